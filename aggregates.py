@@ -0,0 +1,243 @@
+"""
+Server-side aggregation backends for Fuel Tracker
+
+The views and the fuel_summary RPC live in the migrations/ directory.
+SQLiteAggregates runs the same SQL against a local SQLite database so the
+aggregation can be exercised offline.
+"""
+
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from calculations import SEGMENT_COLUMNS, RANGE_TREND_WINDOW
+from schema import DEFAULT_VEHICLE_ID, ENTRY_METRIC_COLUMNS
+from telemetry import count, span, timed, track_response_bytes
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+SQLITE_SCHEMA = MIGRATIONS_DIR / "sqlite" / "000_fuel_entry.sql"
+SQLITE_TRIGGERS = MIGRATIONS_DIR / "sqlite" / "001_entry_sync.sql"
+
+# SQLite's updated_at format (fixed-width UTC with milliseconds)
+SQLITE_NOW = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+PRICE_COLUMNS = ['ts', 'price_per_liter', 'vehicle_id']
+ACCURACY_COLUMNS = ['ts', 'range_accuracy', 'vehicle_id']
+
+# Columns added to fuel_entry after its first release (SQLite has no ADD COLUMN IF NOT EXISTS)
+SQLITE_ADDED_COLUMNS = {
+    'vehicle_id': f"TEXT NOT NULL DEFAULT '{DEFAULT_VEHICLE_ID}'",
+    # ADD COLUMN takes no expression default; existing rows are stamped on upgrade
+    'updated_at': 'TEXT',
+    **{col: 'REAL' for col in ENTRY_METRIC_COLUMNS},
+}
+
+
+@timed('frame_build')
+def _frame(records: List[Dict], columns: List[str], date_columns=()) -> pd.DataFrame:
+    """Build a typed frame from aggregate rows"""
+    df = pd.DataFrame(records, columns=columns)
+    for col in columns:
+        if col in date_columns:
+            df[col] = pd.to_datetime(df[col], format='ISO8601')
+        elif col not in ('end_entry_id', 'vehicle_id'):
+            df[col] = pd.to_numeric(df[col])
+    return df
+
+
+def earliest_by_vehicle(records: List[Dict]) -> Dict[str, str]:
+    """Earliest ts per vehicle in a batch of written rows, as UTC ISO-8601"""
+    earliest: Dict[str, pd.Timestamp] = {}
+    for record in records:
+        vehicle_id = record.get('vehicle_id') or DEFAULT_VEHICLE_ID
+        ts = pd.Timestamp(record['ts'])
+        ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+        if vehicle_id not in earliest or ts < earliest[vehicle_id]:
+            earliest[vehicle_id] = ts
+    return {vehicle_id: ts.isoformat() for vehicle_id, ts in earliest.items()}
+
+
+class Aggregates:
+    """Common interface: each method returns only chart-sized rows.
+
+    With stored_metrics, price and accuracy are read straight from the
+    columns stored on fuel_entry instead of being computed by the views.
+    """
+
+    stored_metrics = False
+
+    def _fetch_view(self, view: str, columns: List[str], order: str,
+                    vehicle_id: Optional[str] = None, not_null: Optional[str] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    def _call_summary(self, params: Dict) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def _fetch(self, *args, **kwargs) -> List[Dict]:
+        """_fetch_view with its time and row count recorded"""
+        with span('fetch'):
+            rows = self._fetch_view(*args, **kwargs)
+        count('rows_fetched', len(rows))
+        return rows
+
+    def price_series(self, vehicle_id: Optional[str] = None) -> pd.DataFrame:
+        """Price per liter per entry, oldest first (whole fleet unless vehicle_id is given)"""
+        view = 'fuel_entry' if self.stored_metrics else 'price_per_liter_series'
+        rows = self._fetch(view, PRICE_COLUMNS, 'ts', vehicle_id)
+        return _frame(rows, PRICE_COLUMNS, date_columns=('ts',))
+
+    def segments(self, vehicle_id: Optional[str] = None) -> pd.DataFrame:
+        """Full-to-full segments, oldest first"""
+        rows = self._fetch('consumption_segments', SEGMENT_COLUMNS, 'end_date', vehicle_id)
+        return _frame(rows, SEGMENT_COLUMNS, date_columns=('start_date', 'end_date'))
+
+    def range_accuracy(self, vehicle_id: Optional[str] = None,
+                       trend_window: int = RANGE_TREND_WINDOW) -> pd.DataFrame:
+        """Range accuracy per entry with its rolling-mean trend, per vehicle"""
+        if self.stored_metrics:
+            rows = self._fetch('fuel_entry', ACCURACY_COLUMNS, 'ts', vehicle_id, not_null='range_accuracy')
+        else:
+            rows = self._fetch('range_accuracy_series', ACCURACY_COLUMNS, 'ts', vehicle_id)
+        df = _frame(rows, ACCURACY_COLUMNS, date_columns=('ts',))
+        df['range_accuracy_trend'] = (
+            df.groupby('vehicle_id', sort=False)['range_accuracy']
+            .transform(lambda series: series.rolling(trend_window, min_periods=1).mean())
+        )
+        return df
+
+    def summary(self, start: Optional[str] = None, end: Optional[str] = None,
+                full_only: bool = False, vehicle_id: Optional[str] = None) -> Dict:
+        """Totals and averages for entries with start <= ts < end"""
+        row = self._call_summary({'p_start': start, 'p_end': end, 'p_full_only': full_only,
+                                  'p_vehicle_id': vehicle_id})
+        return row or {}
+
+
+class SupabaseAggregates(Aggregates):
+    """Aggregates served by the Supabase views and RPC"""
+
+    def __init__(self, client, stored_metrics: bool = False):
+        self.client = client
+        self.stored_metrics = stored_metrics
+
+    def _fetch_view(self, view: str, columns: List[str], order: str,
+                    vehicle_id: Optional[str] = None, not_null: Optional[str] = None) -> List[Dict]:
+        track_response_bytes(self.client)
+        query = self.client.table(view).select(','.join(columns))
+        if vehicle_id is not None:
+            query = query.eq('vehicle_id', vehicle_id)
+        if not_null is not None:
+            query = query.not_.is_(not_null, 'null')
+        return query.order(order).execute().data or []
+
+    def _call_summary(self, params: Dict) -> Optional[Dict]:
+        result = self.client.rpc('fuel_summary', params).execute()
+        return result.data[0] if result.data else None
+
+
+def postgres_migrations() -> List[Path]:
+    """Shipped Postgres migrations in apply order"""
+    return sorted(MIGRATIONS_DIR.glob('[0-9]*.sql'))
+
+
+def sqlite_translation(postgres_sql: str) -> Tuple[str, Dict[str, str]]:
+    """Translate a Postgres migration into a SQLite script and function queries.
+
+    Views become DROP/CREATE pairs, indexes are kept, and each SQL function
+    body becomes a query with its p_* arguments as named parameters.
+    """
+    statements = []
+    for name, body in re.findall(r'CREATE OR REPLACE VIEW (\w+) AS\n(.*?);', postgres_sql, re.S):
+        statements.append(f"DROP VIEW IF EXISTS {name};\nCREATE VIEW {name} AS\n{body};\n")
+    for index in re.findall(r'(CREATE INDEX IF NOT EXISTS .*?;)', postgres_sql, re.S):
+        # SQLite scans indexes in either direction, so DESC is dropped
+        statements.append(index.replace(' DESC', '') + '\n')
+    functions = {}
+    for name, body in re.findall(r'CREATE OR REPLACE FUNCTION (\w+)\(.*?\$\$(.*?)\$\$', postgres_sql, re.S):
+        functions[name] = re.sub(r'\b(p_\w+)\b', r':\1', body.strip().rstrip(';'))
+    return ''.join(statements), functions
+
+
+class SQLiteAggregates(Aggregates):
+    """Offline stand-in running the shipped migration SQL on SQLite"""
+
+    stored_metrics = True
+
+    SUMMARY_COLUMNS = [
+        'entry_count', 'total_fuel_l', 'total_cost_pln',
+        'avg_price_per_liter', 'avg_consumption_l_per_100km'
+    ]
+
+    def __init__(self, path: str = ":memory:"):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # One connection shared across threads, so every statement is serialized
+        self.lock = threading.RLock()
+        self.conn.executescript(SQLITE_SCHEMA.read_text())
+        # Databases created by older releases lack the later columns
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(fuel_entry)")}
+        missing = [col for col in SQLITE_ADDED_COLUMNS if col not in columns]
+        for col in missing:
+            self.conn.execute(f"ALTER TABLE fuel_entry ADD COLUMN {col} {SQLITE_ADDED_COLUMNS[col]}")
+        if 'updated_at' in missing:
+            self.conn.execute(f"UPDATE fuel_entry SET updated_at = {SQLITE_NOW}")
+            self.conn.commit()
+        self.conn.executescript(SQLITE_TRIGGERS.read_text())
+        self.functions: Dict[str, str] = {}
+        for migration in postgres_migrations():
+            script, functions = sqlite_translation(migration.read_text())
+            self.conn.executescript(script)
+            self.functions.update(functions)
+        if missing and set(missing) & set(ENTRY_METRIC_COLUMNS):
+            # Existing rows get their stored metrics once
+            self.refresh_metrics()
+
+    def insert_entries(self, records: List[Dict]):
+        """Load raw fuel_entry rows and fill in their stored metrics; existing ids are skipped"""
+        columns = ['id', 'vehicle_id', 'ts', 'liters', 'amount_pln', 'range_before_km',
+                   'range_after_km', 'odometer_km', 'is_full_tank']
+        rows = [
+            [r['id'], r.get('vehicle_id') or DEFAULT_VEHICLE_ID, str(r['ts'])] + [r[col] for col in columns[3:]]
+            for r in records
+        ]
+        with self.lock:
+            # updated_at is set here too, since upgraded databases have no default for it
+            self.conn.executemany(
+                f"INSERT OR IGNORE INTO fuel_entry ({', '.join(columns)}, updated_at) "
+                f"VALUES ({', '.join('?' * len(columns))}, {SQLITE_NOW})",
+                rows
+            )
+            self.conn.commit()
+            for vehicle_id, since in earliest_by_vehicle(records).items():
+                self.refresh_metrics(vehicle_id, since)
+
+    def refresh_metrics(self, vehicle_id: Optional[str] = None, since: Optional[str] = None):
+        """Recompute stored metrics through the refresh_entry_metrics function body"""
+        with self.lock:
+            self.conn.execute(self.functions['refresh_entry_metrics'],
+                              {'p_vehicle_id': vehicle_id, 'p_since': since})
+            self.conn.commit()
+
+    def _fetch_view(self, view: str, columns: List[str], order: str,
+                    vehicle_id: Optional[str] = None, not_null: Optional[str] = None) -> List[Dict]:
+        sql = f"SELECT {', '.join(columns)} FROM {view}"
+        where, params = [], []
+        if vehicle_id is not None:
+            where.append("vehicle_id = ?")
+            params.append(vehicle_id)
+        if not_null is not None:
+            where.append(f"{not_null} IS NOT NULL")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        with self.lock:
+            rows = self.conn.execute(f"{sql} ORDER BY {order}", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def _call_summary(self, params: Dict) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute(self.functions['fuel_summary'], params).fetchone()
+        return dict(zip(self.SUMMARY_COLUMNS, row)) if row else None
@@ -1,12 +1,30 @@
+import json
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
 from datetime import datetime, timedelta
-from supabase import create_client, Client
-from typing import List, Dict, Optional
-import numpy as np
+from supabase import Client
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 from auth import SimpleAuth
+from entry_store import EntryStore
+from delta_sync import DEFAULT_OVERLAP_S, DEFAULT_RECONCILE_S, SYNC_COLUMN, DeltaSync
+from entry_snapshot import DEFAULT_SNAPSHOT_INTERVAL_S, EntrySnapshot
+from write_queue import DEFAULT_MAX_ATTEMPTS, OwnerUnavailable, WriteQueue
+from precompute import PrecomputeWorker
+from figure_cache import FigureCache
+from downsample import DEFAULT_POINT_BUDGET, WEBGL_THRESHOLD, downsample_frame
+from bulk_import import DEFAULT_BATCH_SIZE, detect_format, import_entries
+from schema import DEFAULT_VEHICLE_ID, ENTRY_METRIC_COLUMNS, VIEW_COLUMNS, columns_for, typed_frame
+from storage import FuelStorage, SQLiteStorage, SupabaseStorage
+from calculations import FleetMetrics, FuelCalculator, is_fleet
+from insights import INSIGHT_WINDOWS, window_column
+from telemetry import count, span, telemetry
+from supabase_pool import (DEFAULT_CONNECT_TIMEOUT_S, DEFAULT_KEEPALIVE_S, DEFAULT_POOL_SIZE,
+                           DEFAULT_READ_TIMEOUT_S, SupabasePool, authorize, clear_authorization)
+
+# Plotly is imported by the chart builders, so only the Analytics view pays for it
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
 
 # Page config for PWA
 st.set_page_config(
@@ -55,6 +73,17 @@ st.markdown("""
         margin: 0.5rem 0;
     }
     
+    div[role="radiogroup"] {
+        gap: 0.5rem;
+        flex-wrap: wrap;
+    }
+    
+    div[role="radiogroup"] > label {
+        padding: 0.5rem 1rem;
+        border-radius: 0.5rem;
+        background: #f0f2f6;
+    }
+    
     @media (max-width: 768px) {
         .stTabs [data-baseweb="tab-list"] {
             gap: 0;
@@ -67,16 +96,46 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Initialize Supabase client
+SECRETS_EXAMPLE = """
+# secrets.toml
+SUPABASE_URL="your_supabase_url_here"
+SUPABASE_KEY="your_supabase_anon_key_here"
+"""
+
+def stop_for_secrets(message: str):
+    """Explain the secrets.toml setup and end this run"""
+    st.error(message)
+    st.code(SECRETS_EXAMPLE)
+    st.stop()
+
+# Storage backend: "supabase" (default) or "sqlite" for a local single-user database.
+# This is the first secrets access, so a missing or broken secrets.toml is reported here
+try:
+    STORAGE_BACKEND = st.secrets.get("STORAGE_BACKEND", "supabase")
+except FileNotFoundError:
+    stop_for_secrets("Please create a secrets.toml file with your Supabase credentials")
+except Exception as e:
+    stop_for_secrets(f"Error loading secrets: {str(e)}")
+
+# Keep-alive connection pool shared by every Supabase client in the process
 @st.cache_resource
-def init_supabase():
+def init_supabase_pool():
     try:
+        if STORAGE_BACKEND == "sqlite" and not st.secrets.get("SUPABASE_URL"):
+            # Local single-user mode: no hosted database and no login
+            return None
         url = st.secrets["SUPABASE_URL"]
         key = st.secrets["SUPABASE_KEY"]
         if not url or not key:
             st.error("Please set SUPABASE_URL and SUPABASE_KEY in your secrets.toml file")
             st.stop()
-        return create_client(url, key)
+        return SupabasePool(
+            url, key,
+            pool_size=int(st.secrets.get("HTTP_POOL_SIZE", DEFAULT_POOL_SIZE)),
+            connect_timeout=float(st.secrets.get("HTTP_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT_S)),
+            read_timeout=float(st.secrets.get("HTTP_READ_TIMEOUT", DEFAULT_READ_TIMEOUT_S)),
+            keepalive_expiry=float(st.secrets.get("HTTP_KEEPALIVE", DEFAULT_KEEPALIVE_S))
+        )
     except KeyError as e:
         st.error(f"Missing secret: {e}. Please add SUPABASE_URL and SUPABASE_KEY to secrets.toml")
         st.stop()
@@ -84,116 +143,271 @@ def init_supabase():
         st.error(f"Error loading secrets: {e}")
         st.stop()
 
-supabase: Client = init_supabase()
+supabase_pool: Optional[SupabasePool] = init_supabase_pool()
+
+# Data client behind the shared caches. Logins happen on each session's own client
+# (SimpleAuth.client); data requests carry the served session's token (authorize)
+@st.cache_resource
+def init_supabase():
+    return supabase_pool.shared_client() if supabase_pool is not None else None
+
+supabase: Optional[Client] = init_supabase()
 
 # Initialize authentication
 @st.cache_resource
 def init_auth():
-    return SimpleAuth(supabase)
+    if supabase_pool is None:
+        return None
+    simple_auth = SimpleAuth(supabase_pool.client)
+    # Background reads (entry store syncs from precompute) run as the freshest session;
+    # the shared caches hold one account's entries (see SETUP.md)
+    supabase_pool.background_token = simple_auth.latest_access_token
+    return simple_auth
 
 auth = init_auth()
 
-class FuelCalculator:
-    @staticmethod
-    def calculate_price_per_liter(amount_pln: float, liters: float) -> float:
-        """Calculate price per liter"""
-        return amount_pln / liters if liters > 0 else 0
-    
-    @staticmethod
-    def find_full_tank_segments(df: pd.DataFrame) -> List[Dict]:
-        """Find full-to-full segments for consumption calculation"""
-        if df.empty:
-            return []
-        
-        # Sort by timestamp
-        df_sorted = df.sort_values('ts').copy()
-        full_tanks = df_sorted[df_sorted['is_full_tank'] == True].copy()
-        
-        segments = []
-        for i in range(len(full_tanks) - 1):
-            start_row = full_tanks.iloc[i]
-            end_row = full_tanks.iloc[i + 1]
-            
-            # Get all entries between these two full tanks (inclusive of end, exclusive of start)
-            segment_entries = df_sorted[
-                (df_sorted['ts'] > start_row['ts']) & 
-                (df_sorted['ts'] <= end_row['ts'])
-            ]
-            
-            if len(segment_entries) > 0:
-                distance = end_row['odometer_km'] - start_row['odometer_km']
-                fuel_used = segment_entries['liters'].sum()
-                cost_total = segment_entries['amount_pln'].sum()
-                
-                if distance > 0:
-                    consumption = (fuel_used / distance) * 100
-                    cost_per_100km = (cost_total / distance) * 100
-                    
-                    segments.append({
-                        'start_date': start_row['ts'],
-                        'end_date': end_row['ts'],
-                        'distance_km': distance,
-                        'fuel_used_l': fuel_used,
-                        'cost_total_pln': cost_total,
-                        'consumption_l_per_100km': consumption,
-                        'cost_per_100km': cost_per_100km,
-                        'end_entry_id': end_row['id']
-                    })
-        
-        return segments
-    
-    @staticmethod
-    def calculate_range_accuracy(df: pd.DataFrame) -> pd.DataFrame:
-        """Calculate range accuracy for each entry"""
-        if df.empty:
-            return df
-        
-        df_sorted = df.sort_values('ts').copy()
-        df_sorted['range_accuracy'] = None
-        
-        for i in range(len(df_sorted) - 1):
-            current_row = df_sorted.iloc[i]
-            next_row = df_sorted.iloc[i + 1]
-            
-            predicted_range = current_row['range_after_km']
-            actual_distance = next_row['odometer_km'] - current_row['odometer_km']
-            
-            if predicted_range > 0:
-                error_pct = abs(predicted_range - actual_distance) / max(predicted_range, 1) * 100
-                accuracy = max(0, min(100, 100 - error_pct))
-                df_sorted.iloc[i, df_sorted.columns.get_loc('range_accuracy')] = accuracy
-        
-        return df_sorted
+# Entry storage selected by STORAGE_BACKEND
+@st.cache_resource
+def init_storage() -> FuelStorage:
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteStorage(st.secrets.get("SQLITE_PATH", "fuel_tracker.db"))
+    # Stored metric columns need migrations/004_stored_entry_metrics.sql and backfill.py,
+    # delta sync needs migrations/005_entry_sync.sql
+    return SupabaseStorage(supabase, stored_metrics=bool(st.secrets.get("STORED_METRICS", False)),
+                           delta_sync=bool(st.secrets.get("DELTA_SYNC", False)))
+
+storage = init_storage()
+
+# Optional server-side aggregation (requires migrations/001_fuel_aggregates.sql on Supabase)
+@st.cache_resource
+def init_aggregates():
+    if st.secrets.get("AGGREGATION_BACKEND", "local") == "database":
+        return storage.aggregates()
+    return None
+
+aggregates = init_aggregates()
+
+# Timing spans and counters, optionally logged as JSON lines and a Prometheus text file
+@st.cache_resource
+def init_telemetry():
+    telemetry.configure(jsonl_path=st.secrets.get("TELEMETRY_JSONL"),
+                        prometheus_path=st.secrets.get("TELEMETRY_PROMETHEUS"),
+                        release=st.secrets.get("RELEASE", "dev"), backend=STORAGE_BACKEND)
+    return telemetry
+
+init_telemetry()
+
+# Entries pages arrive with their derived columns (stored on the rows or from the view)
+PAGES_WITH_METRICS = aggregates is not None or storage.stored_metrics
+
+# Rows per page in the Entries tab
+ENTRIES_PAGE_SIZE = 50
+
+# The entry store serves every view, so it fetches the union of their columns
+# (plus the change watermark when it syncs incrementally)
+STORE_COLUMNS = columns_for('quick_add', 'entries', 'analytics') + ([SYNC_COLUMN] if storage.delta_sync else [])
 
 class FuelDatabase:
     @staticmethod
     def insert_entry(entry_data: Dict) -> bool:
-        """Insert a new fuel entry"""
+        """Save a new fuel entry to the local write queue; it reaches Supabase in the background"""
         try:
-            result = supabase.table('fuel_entry').insert(entry_data).execute()
+            entry = write_queue.enqueue(entry_data, owner=auth.user_id() if auth is not None else None)
+            entry_store.apply_insert(entry)
             return True
         except Exception as e:
             st.error(f"Error saving entry: {str(e)}")
             return False
     
+    @staticmethod
+    def flush_entries(entries: List[Dict], owner: Optional[str] = None):
+        """Write a batch of queued entries as the user who saved them; client ids make retries idempotent"""
+        if auth is None:
+            # Local single-user mode
+            storage.insert_entries(entries)
+            return
+        # Rows queued before owners were recorded go as the freshest session
+        token = auth.access_token_for(owner) if owner is not None else auth.latest_access_token()
+        if token is None:
+            raise OwnerUnavailable("Waiting for the user who saved these entries to log in again")
+        authorize(token)
+        try:
+            storage.insert_entries(entries)
+        finally:
+            clear_authorization()
+    
+    @staticmethod
+    def fetch_all_entries() -> pd.DataFrame:
+        """Fetch all fuel entries from storage (raises on failure)"""
+        rows = storage.query_entries(STORE_COLUMNS)
+        with span('frame_build'):
+            df = typed_frame(rows, STORE_COLUMNS)
+            
+            # Entries still waiting in the write queue are shown as already saved
+            pending = typed_frame(write_queue.pending(), STORE_COLUMNS)
+            if not pending.empty:
+                if not df.empty:
+                    pending = pending[~pending['id'].isin(df['id'])]
+                df = pd.concat([pending, df], ignore_index=True).sort_values('ts', ascending=False, ignore_index=True)
+        return df
+    
     @staticmethod
     def get_all_entries() -> pd.DataFrame:
-        """Get all fuel entries"""
+        """Get all fuel entries from the shared entry store"""
         try:
-            result = supabase.table('fuel_entry').select('*').order('ts', desc=True).execute()
-            if result.data:
-                df = pd.DataFrame(result.data)
-                df['ts'] = pd.to_datetime(df['ts'])
-                return df
-            return pd.DataFrame()
+            return entry_store.get_entries()
         except Exception as e:
             st.error(f"Error loading entries: {str(e)}")
             return pd.DataFrame()
     
+    @staticmethod
+    def get_entries_page(full_only: bool = False, start_date=None, end_date=None,
+                         cursor: Optional[Tuple[str, str]] = None,
+                         page_size: int = ENTRIES_PAGE_SIZE,
+                         vehicle_id: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[Tuple[str, str]]]:
+        """Get one page of entries (newest first) with filters applied by the database.
+        
+        Pages are keyed on (ts, id): the cursor is the last row of the previous
+        page, and the returned cursor is None on the last page. vehicle_id
+        None means the whole fleet. Entries still in the write queue are
+        merged in where they belong, so offline saves show up immediately.
+        """
+        try:
+            # Stored metrics or server-side aggregation: the page already carries derived columns
+            columns = VIEW_COLUMNS['entries']
+            if PAGES_WITH_METRICS:
+                columns = columns + ENTRY_METRIC_COLUMNS
+            
+            # One extra row tells whether an older page exists
+            rows = storage.query_entries(
+                columns, full_only,
+                start=start_date.isoformat() if start_date else None,
+                end=(end_date + timedelta(days=1)).isoformat() if end_date else None,
+                cursor=cursor, limit=page_size + 1, with_metrics=PAGES_WITH_METRICS,
+                vehicle_id=vehicle_id
+            )
+            with span('frame_build'):
+                page_df = typed_frame(rows, columns)
+                pending = FuelDatabase.pending_entries(columns, full_only, start_date, end_date,
+                                                       cursor, vehicle_id)
+                if not pending.empty and not page_df.empty:
+                    pending = pending[~pending['id'].isin(page_df['id'])]
+                if not pending.empty:
+                    if PAGES_WITH_METRICS:
+                        # The database has no metrics for them yet; the entry store does
+                        pending = FuelDatabase.annotate_page(pending)[columns]
+                    page_df = pd.concat([pending, page_df], ignore_index=True).sort_values(
+                        ['ts', 'id'], ascending=False, ignore_index=True
+                    )
+            next_cursor = None
+            if len(page_df) > page_size:
+                last_row = page_df.iloc[page_size - 1]
+                next_cursor = (last_row['ts'].isoformat(), last_row['id'])
+            return page_df.iloc[:page_size], next_cursor
+        except Exception as e:
+            st.error(f"Error loading entries: {str(e)}")
+            return pd.DataFrame(), None
+    
+    @staticmethod
+    def pending_entries(columns: List[str], full_only: bool = False, start_date=None, end_date=None,
+                        cursor: Optional[Tuple[str, str]] = None,
+                        vehicle_id: Optional[str] = None) -> pd.DataFrame:
+        """Queued entries matching the Entries filters and older than the page cursor"""
+        pending = typed_frame(write_queue.pending(), columns)
+        if pending.empty:
+            return pending
+        keep = pd.Series(True, index=pending.index)
+        if vehicle_id is not None:
+            keep &= pending['vehicle_id'] == vehicle_id
+        if full_only:
+            keep &= pending['is_full_tank']
+        if start_date:
+            keep &= pending['ts'] >= pd.Timestamp(start_date, tz='UTC')
+        if end_date:
+            keep &= pending['ts'] < pd.Timestamp(end_date + timedelta(days=1), tz='UTC')
+        if cursor:
+            ts = pd.Timestamp(cursor[0])
+            keep &= (pending['ts'] < ts) | ((pending['ts'] == ts) & (pending['id'] < cursor[1]))
+        return pending[keep]
+    
+    @staticmethod
+    def previous_odometer(ts: pd.Timestamp, vehicle_id: str = DEFAULT_VEHICLE_ID) -> Optional[float]:
+        """Stored odometer reading of a vehicle just before a timestamp"""
+        entry = storage.last_entry(['odometer_km'], before=ts.isoformat(), vehicle_id=vehicle_id)
+        return entry['odometer_km'] if entry else None
+    
+    @staticmethod
+    def annotate_page(page_df: pd.DataFrame) -> pd.DataFrame:
+        """Attach derived metrics to a page of entries.
+        
+        A resident entry store already maintains them; otherwise they are
+        computed from the entries around the page (see page_context) rather
+        than by loading the whole history.
+        """
+        try:
+            if entry_store.serves_without_reload():
+                page_df = entry_store.annotate(page_df)
+            else:
+                context = FuelDatabase.page_context(page_df)
+                page_df = FleetMetrics.from_frame(context).annotate(page_df).sort_values(
+                    ['ts', 'id'], ascending=False
+                )
+        except Exception as e:
+            st.error(f"Error loading entries: {str(e)}")
+            # The page still renders, with its metrics left blank
+            page_df = page_df.reindex(columns=list(page_df.columns.union(ENTRY_METRIC_COLUMNS, sort=False)))
+        page_df['price_per_liter'] = FuelCalculator.price_per_liter_column(page_df)
+        return page_df
+    
+    @staticmethod
+    def page_context(page_df: pd.DataFrame) -> pd.DataFrame:
+        """Entries the derived metrics of a page depend on, fetched per vehicle on the page.
+        
+        For each vehicle that is everything from its last full tank before
+        the page (which opens the first segment; the entry just before the
+        page if it has none) through the entry after the page (which settles
+        range accuracy), plus its queued entries.
+        """
+        columns = VIEW_COLUMNS['entries']
+        parts = [page_df[columns]]
+        pending = typed_frame(write_queue.pending(), columns)
+        for vehicle_id, rows in page_df.groupby('vehicle_id', sort=False):
+            rows = rows.sort_values(['ts', 'id'])
+            oldest, newest = rows.iloc[0], rows.iloc[-1]
+            before = (oldest['ts'].isoformat(), oldest['id'])
+            after = (newest['ts'].isoformat(), newest['id'])
+            opening = (storage.query_entries(columns, full_only=True, cursor=before, limit=1,
+                                             vehicle_id=vehicle_id)
+                       or storage.query_entries(columns, cursor=before, limit=1, vehicle_id=vehicle_id))
+            context = storage.query_entries(columns, start=opening[0]['ts'] if opening else None,
+                                            cursor=after, vehicle_id=vehicle_id)
+            # Entries sharing the newest one's ts also count towards its segment
+            while True:
+                later = storage.query_entries(columns, cursor=after, limit=1, vehicle_id=vehicle_id,
+                                              oldest_first=True)
+                context += later
+                if not later or pd.Timestamp(later[0]['ts']) > newest['ts']:
+                    break
+                after = (later[0]['ts'], later[0]['id'])
+            parts.append(typed_frame(context, columns))
+            if not pending.empty:
+                parts.append(pending[pending['vehicle_id'] == vehicle_id])
+        parts = [part for part in parts if not part.empty]
+        return pd.concat(parts, ignore_index=True).drop_duplicates('id')
+    
+    @staticmethod
+    def get_derived_entries() -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Get entries with derived metrics, plus full-to-full segments"""
+        try:
+            return entry_store.get_derived()
+        except Exception as e:
+            st.error(f"Error loading entries: {str(e)}")
+            return pd.DataFrame(), pd.DataFrame()
+    
     @staticmethod
     def validate_entry(liters: float, amount_pln: float, range_before: int, 
                       range_after: int, odometer: int, last_odometer: Optional[int]) -> List[str]:
-        """Validate fuel entry data"""
+        """Validate fuel entry data (last_odometer is the same vehicle's last reading)"""
         errors = []
         
         if liters <= 0:
@@ -211,12 +425,174 @@ class FuelDatabase:
         
         return errors
 
+# Durable local write queue, flushed to Supabase by one background thread
+@st.cache_resource
+def init_write_queue():
+    queue = WriteQueue(st.secrets.get("WRITE_QUEUE_PATH", "fuel_write_queue.db"),
+                       flush=FuelDatabase.flush_entries, is_permanent=storage.is_permanent_error,
+                       max_attempts=int(st.secrets.get("WRITE_QUEUE_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)))
+    queue.start()
+    return queue
+
+write_queue = init_write_queue()
+
+# Shared entry store: one fetch per TTL for all tabs and sessions; with delta
+# sync, later fetches only transfer the rows changed since the last one and a
+# restart resumes from the on-disk snapshot
+@st.cache_resource
+def init_entry_store():
+    ttl_seconds = float(st.secrets.get("ENTRY_CACHE_TTL", 60))
+    delta = None
+    snapshot = None
+    if storage.delta_sync:
+        delta = DeltaSync(
+            fetch_changes=lambda since, after, limit: storage.query_changes(STORE_COLUMNS, since, after, limit),
+            fetch_checksums=storage.entry_checksums,
+            fetch_vehicle=lambda vehicle_id: storage.query_entries(STORE_COLUMNS, vehicle_id=vehicle_id),
+            columns=STORE_COLUMNS,
+            overlap_seconds=float(st.secrets.get("SYNC_OVERLAP", DEFAULT_OVERLAP_S)),
+            reconcile_seconds=float(st.secrets.get("SYNC_RECONCILE_INTERVAL", DEFAULT_RECONCILE_S))
+        )
+        snapshot_path = st.secrets.get("SNAPSHOT_PATH", "fuel_entries.arrow")
+        # A local SQLite database loads about as fast as the snapshot would
+        if snapshot_path and not isinstance(storage, SQLiteStorage):
+            snapshot = EntrySnapshot(snapshot_path, STORE_COLUMNS,
+                                     min_interval=float(st.secrets.get("SNAPSHOT_INTERVAL",
+                                                                       DEFAULT_SNAPSHOT_INTERVAL_S)))
+    store = EntryStore(FuelDatabase.fetch_all_entries, ttl_seconds=ttl_seconds, columns=STORE_COLUMNS,
+                       delta=delta, snapshot=snapshot, pending=write_queue.pending)
+    if snapshot is not None:
+        store.add_listener(snapshot.notify)
+        snapshot.start(store.resident)
+    # Queued rows are already resident; a new version refreshes pages cached per session
+    write_queue.on_flushed = lambda batch: store.mark_changed()
+    # Rejected rows were shown as saved; take them back out
+    write_queue.on_failed = lambda batch: store.discard([entry['id'] for entry in batch])
+    return store
+
+entry_store = init_entry_store()
+
+# How long a render waits for the worker to catch up with the latest data
+ANALYTICS_WAIT_S = 2.0
+
+# Background worker keeping analytics snapshots warm
+@st.cache_resource
+def init_precompute():
+    worker = PrecomputeWorker(
+        build=build_analytics_data,
+        needs_refresh=lambda version: version != entry_store.version,
+        # Remote changes are picked up once a read finds the snapshot past the store's TTL
+        max_age=entry_store.ttl_seconds
+    )
+    entry_store.add_listener(worker.notify)
+    worker.start()
+    return worker
+
+# Built figures shared across sessions, keyed by data version
+@st.cache_resource
+def init_figure_cache():
+    max_mb = float(st.secrets.get("FIGURE_CACHE_MB", 32))
+    return FigureCache(max_bytes=int(max_mb * 1024 * 1024))
+
+figure_cache = init_figure_cache()
+
+# Points per chart series in fast chart mode
+CHART_POINT_BUDGET = int(st.secrets.get("CHART_POINT_BUDGET", DEFAULT_POINT_BUDGET))
+
+def show_cache_stats():
+    """Show entry store hit/miss counters in the sidebar"""
+    stats = entry_store.stats()
+    with st.sidebar.expander("🗄️ Entry cache"):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Hits", stats['hits'])
+        col2.metric("Misses", stats['misses'])
+        col3.metric("Syncs", stats['syncs'])
+        st.caption(f"Version {stats['version']} · {stats['rows']} rows · "
+                   f"hit rate {stats['hit_rate']:.0%}")
+        if stats['restored_from'] is not None:
+            st.caption(f"Started from disk snapshot v{stats['restored_from']}")
+        if entry_store.snapshot is not None and entry_store.snapshot.last_error:
+            st.warning(f"Snapshot error: {entry_store.snapshot.last_error}")
+        if st.button("Verify derived metrics", key="verify_metrics"):
+            problems = entry_store.verify_metrics()
+            if problems:
+                for problem in problems:
+                    st.warning(problem)
+            else:
+                st.success("Derived metrics match a full recompute")
+        
+        snapshot = precompute.latest()
+        if snapshot is not None:
+            st.caption(f"Analytics snapshot v{snapshot.version} · "
+                       f"built in {snapshot.build_seconds * 1000:.0f} ms")
+        if precompute.last_error:
+            st.warning(f"Precompute error: {precompute.last_error}")
+        
+        figures = figure_cache.stats()
+        st.caption(f"Figures: {figures['entries']} cached · {figures['bytes'] / 1024:.0f} KB · "
+                   f"{figures['hits']} hits / {figures['misses']} misses")
+
+# Opt-in debug panel: PERF_PANEL = true in secrets.toml, or ?debug=1 in the URL
+PERF_PANEL = bool(st.secrets.get("PERF_PANEL", False))
+
+def perf_panel_enabled() -> bool:
+    return PERF_PANEL or st.experimental_get_query_params().get('debug', [''])[0] == '1'
+
+def show_perf_panel():
+    """Where this rerun spent its time, plus process-wide totals"""
+    run = telemetry.current_run()
+    if run is None:
+        return
+    record = run.as_dict()
+    with st.expander(f"🐢 Performance · {record['total_ms']:.0f} ms this rerun"):
+        if record['spans']:
+            st.dataframe(pd.DataFrame(
+                [(name, stage['count'], stage['ms']) for name, stage in record['spans'].items()],
+                columns=['Stage', 'Calls', 'ms']
+            ).sort_values('ms', ascending=False), use_container_width=True, hide_index=True)
+        else:
+            st.caption("No instrumented stage ran (everything was served from caches)")
+        if record['counters']:
+            st.caption(" · ".join(f"{name} {value:,.0f}" for name, value in sorted(record['counters'].items())))
+        st.caption("Process totals below also include background precompute and write-queue work")
+        
+        totals = telemetry.totals()
+        if totals['spans']:
+            st.dataframe(pd.DataFrame(
+                [(name, stage['count'], stage['total_ms'], stage['total_ms'] / stage['count'], stage['max_ms'])
+                 for name, stage in totals['spans'].items()],
+                columns=['Stage', 'Calls', 'Total ms', 'Mean ms', 'Max ms']
+            ).sort_values('Total ms', ascending=False), use_container_width=True, hide_index=True)
+
+def failed_entries_notice():
+    """Entries the database rejected, which are no longer shown as saved"""
+    failed = write_queue.failed()
+    st.warning(f"⚠️ {len(failed)} entries could not be saved and were set aside")
+    with st.expander("Entries not saved"):
+        st.dataframe(pd.DataFrame(failed, columns=['ts', 'vehicle_id', 'liters', 'amount_pln', 'odometer_km',
+                                                   'last_error']),
+                     use_container_width=True, hide_index=True)
+        if st.button("Dismiss", key="discard_failed_entries"):
+            write_queue.discard_failed()
+            st.experimental_rerun()
+
 def quick_add_form():
     """Quick Add fuel entry form"""
     st.header("⛽ Quick Add")
     
-    # Get last entry for validation and hints
+    queue_stats = write_queue.stats()
+    if queue_stats['pending']:
+        st.caption(f"⏳ {queue_stats['pending']} entries waiting to sync"
+                   + (f" (last error: {queue_stats['last_error']})" if queue_stats['last_error'] else ""))
+    if queue_stats['failed']:
+        failed_entries_notice()
+    
+    # Outside the form, so the odometer hint follows the chosen vehicle
     df = FuelDatabase.get_all_entries()
+    vehicle_id = vehicle_input(df)
+    
+    # Get the vehicle's last entry for validation and hints
+    df = df[df['vehicle_id'] == vehicle_id] if not df.empty else df
     last_entry = df.iloc[0] if not df.empty else None
     last_odometer = last_entry['odometer_km'] if last_entry is not None else None
     
@@ -253,6 +629,7 @@ def quick_add_form():
             else:
                 # Create entry
                 entry_data = {
+                    'vehicle_id': vehicle_id,
                     'ts': entry_datetime.isoformat(),
                     'liters': float(liters),
                     'amount_pln': float(amount_pln),
@@ -265,41 +642,256 @@ def quick_add_form():
                 if FuelDatabase.insert_entry(entry_data):
                     st.success("✅ Entry saved successfully!")
                     st.experimental_rerun()
+    
+    bulk_import_panel()
 
-def view_entries():
-    """View and filter fuel entries"""
-    st.header("📋 Fuel Entries")
+# Quick Add choice that reveals a free-text vehicle id
+NEW_VEHICLE = "➕ New vehicle"
+
+def vehicle_input(df: pd.DataFrame) -> str:
+    """Vehicle for a new entry: an existing one (the selected vehicle first) or a new id"""
+    vehicles = sorted(df['vehicle_id'].unique()) if not df.empty else [DEFAULT_VEHICLE_ID]
+    selected = st.session_state.get('vehicle')
+    index = vehicles.index(selected) if selected in vehicles else 0
+    choice = st.selectbox("Vehicle", vehicles + [NEW_VEHICLE], index=index, key="entry_vehicle")
+    if choice != NEW_VEHICLE:
+        return choice
+    new_vehicle = st.text_input("New vehicle ID", key="entry_new_vehicle").strip()
+    return new_vehicle or DEFAULT_VEHICLE_ID
+
+# Shared by all sessions; the store version in the key makes local writes show at once
+@st.cache_data(ttl=entry_store.ttl_seconds, show_spinner=False)
+def stored_vehicles(version: int) -> Optional[List[str]]:
+    """Vehicle ids from the vehicles view, or None if the database lacks it"""
+    try:
+        return storage.vehicle_ids()
+    except Exception:
+        return None
+
+def vehicle_list() -> List[str]:
+    """Sorted ids of the vehicles with entries, queued ones included, without loading the store"""
+    vehicles = stored_vehicles(entry_store.version)
+    if vehicles is None:
+        # migrations/006_vehicle_list.sql not applied yet
+        return entry_store.vehicles()
+    queued = {entry.get('vehicle_id') or DEFAULT_VEHICLE_ID for entry in write_queue.pending()}
+    return sorted(queued.union(vehicles))
+
+def vehicle_selector() -> Optional[str]:
+    """Sidebar vehicle filter shared by Entries and Analytics; None means the whole fleet"""
+    try:
+        vehicles = vehicle_list()
+    except Exception as e:
+        st.error(f"Error loading vehicles: {str(e)}")
+        return None
+    if len(vehicles) < 2:
+        st.session_state['vehicle'] = None
+        return None
+    if st.session_state.get('vehicle') not in vehicles:
+        st.session_state['vehicle'] = None
+    return st.sidebar.selectbox("🚗 Vehicle", [None] + vehicles, key="vehicle",
+                                format_func=lambda v: "All vehicles" if v is None else v)
+
+def bulk_import_panel():
+    """Upload historical entries from a CSV/JSON file"""
+    with st.expander("📥 Bulk import"):
+        st.caption("Columns: ts, liters, amount_pln, range_before_km, range_after_km, "
+                   "odometer_km and optionally is_full_tank and vehicle_id, in chronological order")
+        uploaded = st.file_uploader("CSV or JSON file", type=['csv', 'json', 'jsonl'])
+        batch_size = st.number_input("Batch size", min_value=1, value=DEFAULT_BATCH_SIZE, step=100)
+        dry_run = st.checkbox("Validate only")
+        
+        if uploaded is not None and st.button("📥 Import", use_container_width=True):
+            try:
+                with st.spinner("Importing..."):
+                    report = import_entries(
+                        uploaded, detect_format(uploaded.name),
+                        insert_batch=storage.insert_entries,
+                        previous_odometer=FuelDatabase.previous_odometer,
+                        batch_size=int(batch_size), dry_run=dry_run
+                    )
+            except Exception as e:
+                st.error(f"Import error: {str(e)}")
+                return
+            
+            if report.rows_inserted and not dry_run:
+                entry_store.invalidate()
+            action = "validated" if dry_run else "imported"
+            st.success(f"✅ {report.rows_inserted} of {report.rows_read} rows {action}")
+            if report.errors:
+                st.warning(f"{report.rows_rejected} rows rejected")
+                st.dataframe(pd.DataFrame(report.errors, columns=['Row', 'Error']),
+                             use_container_width=True, hide_index=True)
+
+def filter_entries(df: pd.DataFrame, full_only: bool, start_date=None, end_date=None,
+                   vehicle_id: Optional[str] = None) -> pd.DataFrame:
+    """Apply the Entries tab filters to a local frame"""
+    if vehicle_id is not None:
+        df = df[df['vehicle_id'] == vehicle_id]
+    if full_only:
+        df = df[df['is_full_tank'] == True]
+    if start_date and end_date:
+        df = df[(df['ts'].dt.date >= start_date) & (df['ts'].dt.date <= end_date)]
+    return df
+
+def summarize_entries(df: pd.DataFrame) -> Dict:
+    """Summary totals for a frame of annotated entries"""
+    valid_consumption = df['consumption_l_per_100km'].dropna()
+    return {
+        'entry_count': len(df),
+        'total_fuel_l': df['liters'].sum(),
+        'total_cost_pln': df['amount_pln'].sum(),
+        'avg_price_per_liter': FuelCalculator.price_per_liter_column(df).mean(),
+        'avg_consumption_l_per_100km': valid_consumption.mean() if not valid_consumption.empty else None
+    }
+
+def entries_summary(full_only: bool, start_date=None, end_date=None,
+                    vehicle_id: Optional[str] = None) -> Dict:
+    """Summary totals for the filtered entries, from the database when enabled"""
+    if aggregates is not None:
+        try:
+            return aggregates.summary(
+                start=start_date.isoformat() if start_date else None,
+                end=(end_date + timedelta(days=1)).isoformat() if end_date else None,
+                full_only=full_only, vehicle_id=vehicle_id
+            )
+        except Exception as e:
+            st.error(f"Error loading summary: {str(e)}")
+            return {}
     
-    df = FuelDatabase.get_all_entries()
+    # While the store is fresh, the precomputed snapshot holds the annotated
+    # entries, so filtering them is all that is left to do
+    snapshot = precompute.latest(min_version=entry_store.version)
+    if (snapshot is not None and snapshot.version == entry_store.version
+            and not entry_store.is_stale()):
+        if not full_only and start_date is None and vehicle_id is None:
+            return snapshot.data['summary']
+        if snapshot.data['prices'].empty:
+            return {}
+        return summarize_entries(filter_entries(snapshot.data['prices'], full_only, start_date, end_date,
+                                                vehicle_id))
     
-    if df.empty:
-        st.info("No fuel entries yet. Add your first entry using the Quick Add tab!")
-        return
+    # Totals over a filter need every matching entry: without server-side
+    # aggregation they come from the shared store, reloaded at most once per TTL
+    df_with_accuracy, _ = FuelDatabase.get_derived_entries()
+    if df_with_accuracy.empty:
+        return {}
+    return summarize_entries(filter_entries(df_with_accuracy, full_only, start_date, end_date, vehicle_id))
+
+def build_analytics_data() -> Tuple[int, Dict]:
+    """Analytics frames and summary metrics for one data version.
     
-    # Calculate additional metrics
-    df['price_per_liter'] = df.apply(lambda row: FuelCalculator.calculate_price_per_liter(
-        row['amount_pln'], row['liters']), axis=1)
+    Runs on the precompute worker thread, so it raises instead of calling st.error.
+    """
+    if aggregates is not None:
+        # Only chart-sized rows leave the database
+        return entry_store.version, {
+            'prices': aggregates.price_series(),
+            'segments': aggregates.segments(),
+            'accuracy': aggregates.range_accuracy(),
+            'summary': aggregates.summary()
+        }
     
-    # Calculate distances
-    df_sorted = df.sort_values('ts')
-    df_sorted['distance_from_prev'] = df_sorted['odometer_km'].diff()
+    version, df_with_accuracy, segments_df = entry_store.snapshot_derived()
+    if df_with_accuracy.empty:
+        return version, {'prices': df_with_accuracy, 'segments': segments_df,
+                         'accuracy': df_with_accuracy, 'summary': {}}
     
-    # Calculate range accuracy
-    df_with_accuracy = FuelCalculator.calculate_range_accuracy(df_sorted)
+    df_with_accuracy['price_per_liter'] = FuelCalculator.price_per_liter_column(df_with_accuracy)
+    return version, {
+        'prices': df_with_accuracy,
+        'segments': segments_df,
+        'accuracy': df_with_accuracy[df_with_accuracy['range_accuracy'].notna()],
+        'summary': summarize_entries(df_with_accuracy)
+    }
+
+def load_analytics_data() -> Tuple[Tuple, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Figure cache key, price series, segments and range accuracy for the charts, from the latest snapshot.
     
-    # Get consumption data
-    segments = FuelCalculator.find_full_tank_segments(df)
-    consumption_map = {seg['end_entry_id']: seg for seg in segments}
+    The key is the data version; server-side aggregates can change without
+    a local version change, so for them it includes the build time too.
+    """
+    snapshot = precompute.latest(min_version=entry_store.version, timeout=ANALYTICS_WAIT_S)
+    if snapshot is not None:
+        count('snapshot_hits')
+        version = (snapshot.version, snapshot.built_at if aggregates is not None else None)
+        data = snapshot.data
+    else:
+        count('snapshot_misses')
+        # Worker has not published yet (or keeps failing): build inline
+        try:
+            version, data = build_analytics_data()
+            version = (version, None)
+        except Exception as e:
+            st.error(f"Error loading analytics: {str(e)}")
+            return (-1, None), pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+    return version, data['prices'], data['segments'], data['accuracy']
+
+# Entries table columns and their display names
+ENTRIES_DISPLAY_COLUMNS = {
+    'ts': 'Date',
+    'vehicle_id': 'Vehicle',
+    'liters': 'Liters',
+    'amount_pln': 'Amount (PLN)',
+    'price_per_liter': 'Price/L',
+    'odometer_km': 'Odometer',
+    'distance_from_prev': 'Distance',
+    'consumption_l_per_100km': 'L/100km',
+    'cost_per_100km': 'Cost/100km',
+    'range_before_km': 'Range Before',
+    'range_after_km': 'Range After',
+    'range_accuracy': 'Accuracy %',
+    'is_full_tank': 'Full Tank'
+}
+
+ENTRIES_COLUMN_CONFIG = {
+    'Date': st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm"),
+    'Liters': st.column_config.NumberColumn(format="%.2f"),
+    'Amount (PLN)': st.column_config.NumberColumn(format="%.2f"),
+    'Price/L': st.column_config.NumberColumn(format="%.2f"),
+    'L/100km': st.column_config.NumberColumn(format="%.2f"),
+    'Cost/100km': st.column_config.NumberColumn(format="%.2f"),
+    'Accuracy %': st.column_config.NumberColumn(format="%.1f"),
+    'Full Tank': st.column_config.CheckboxColumn(),
+}
+
+def entries_display_frame(page_df: pd.DataFrame) -> pd.DataFrame:
+    """Entries page with display column names, keeping numeric dtypes"""
+    if page_df.empty:
+        return page_df
+    return page_df.reindex(columns=list(ENTRIES_DISPLAY_COLUMNS)).rename(columns=ENTRIES_DISPLAY_COLUMNS)
+
+def load_entries_page(full_only: bool, start_date, end_date, cursor: Optional[Tuple[str, str]],
+                      vehicle_id: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[Tuple[str, str]]]:
+    """Display-ready entries page, reused across reruns while the data version is unchanged"""
+    page_key = (vehicle_id, full_only, start_date, end_date, cursor)
+    cached = st.session_state.get('entries_display')
+    # Without a fresh store (e.g. server-side aggregation) the version says nothing, so requery
+    if (cached is not None and cached[0] == (entry_store.version,) + page_key
+            and not entry_store.is_stale()):
+        count('page_cache_hits')
+        return cached[1], cached[2]
+    count('page_cache_misses')
     
-    # Add consumption data to dataframe
-    df_with_accuracy['consumption_l_per_100km'] = None
-    df_with_accuracy['cost_per_100km'] = None
+    # Filters are applied by the database, so only one page is transferred
+    page_df, next_cursor = FuelDatabase.get_entries_page(full_only, start_date, end_date, cursor=cursor,
+                                                         vehicle_id=vehicle_id)
+    if not PAGES_WITH_METRICS and not page_df.empty:
+        # A lookup in the entry store while it is resident, else a few
+        # queries for the entries around the page
+        page_df = FuelDatabase.annotate_page(page_df)
     
-    for idx, row in df_with_accuracy.iterrows():
-        if row['id'] in consumption_map:
-            seg = consumption_map[row['id']]
-            df_with_accuracy.at[idx, 'consumption_l_per_100km'] = seg['consumption_l_per_100km']
-            df_with_accuracy.at[idx, 'cost_per_100km'] = seg['cost_per_100km']
+    with span('formatting'):
+        display_data = entries_display_frame(page_df)
+    if not display_data.empty:
+        # Keyed on the version after annotation, which may have reloaded the store
+        st.session_state['entries_display'] = ((entry_store.version,) + page_key, display_data, next_cursor)
+    return display_data, next_cursor
+
+def view_entries():
+    """View and filter fuel entries"""
+    st.header("📋 Fuel Entries")
+    vehicle_id = st.session_state.get('vehicle')
     
     # Filters
     col1, col2 = st.columns(2)
@@ -308,195 +900,339 @@ def view_entries():
     with col2:
         date_range = st.date_input("Date range", value=[])
     
-    # Apply filters
-    display_df = df_with_accuracy.copy()
-    if show_full_only:
-        display_df = display_df[display_df['is_full_tank'] == True]
-    
+    start_date = end_date = None
     if len(date_range) == 2:
         start_date, end_date = date_range
-        display_df = display_df[
-            (display_df['ts'].dt.date >= start_date) & 
-            (display_df['ts'].dt.date <= end_date)
-        ]
+    
+    # Keyset pagination: a stack of page cursors, reset whenever the filters change
+    filter_key = (vehicle_id, show_full_only, start_date, end_date)
+    if st.session_state.get('entries_filter_key') != filter_key:
+        st.session_state['entries_filter_key'] = filter_key
+        st.session_state['entries_cursors'] = [None]
+    cursors = st.session_state['entries_cursors']
+    
+    display_data, next_cursor = load_entries_page(show_full_only, start_date, end_date, cursors[-1], vehicle_id)
+    
+    if display_data.empty and cursors == [None] and not show_full_only and start_date is None:
+        st.info("No fuel entries yet. Add your first entry using the Quick Add tab!")
+        return
     
     # Display table
-    if not display_df.empty:
-        # Format display columns
-        display_columns = {
-            'ts': 'Date',
-            'liters': 'Liters',
-            'amount_pln': 'Amount (PLN)',
-            'price_per_liter': 'Price/L',
-            'odometer_km': 'Odometer',
-            'distance_from_prev': 'Distance',
-            'consumption_l_per_100km': 'L/100km',
-            'cost_per_100km': 'Cost/100km',
-            'range_before_km': 'Range Before',
-            'range_after_km': 'Range After',
-            'range_accuracy': 'Accuracy %',
-            'is_full_tank': 'Full Tank'
-        }
-        
-        # Format dataframe for display
-        display_data = display_df[list(display_columns.keys())].copy()
-        display_data.columns = list(display_columns.values())
+    if not display_data.empty:
+        # Values stay numeric (so columns sort numerically); formatting is client-side
+        st.dataframe(display_data, use_container_width=True, hide_index=True,
+                     column_config=ENTRIES_COLUMN_CONFIG)
         
-        # Format numeric columns
-        numeric_format = {
-            'Liters': '{:.2f}',
-            'Amount (PLN)': '{:.2f}',
-            'Price/L': '{:.2f}',
-            'L/100km': '{:.2f}',
-            'Cost/100km': '{:.2f}',
-            'Accuracy %': '{:.1f}'
-        }
-        
-        for col, fmt in numeric_format.items():
-            if col in display_data.columns:
-                display_data[col] = display_data[col].apply(
-                    lambda x: fmt.format(x) if pd.notna(x) else '-'
-                )
-        
-        # Format date
-        display_data['Date'] = display_data['Date'].dt.strftime('%Y-%m-%d %H:%M')
-        
-        st.dataframe(display_data, use_container_width=True, hide_index=True)
+        # Page navigation
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            st.button("◀ Newer", key="entries_newer", disabled=len(cursors) == 1,
+                      on_click=lambda: st.session_state['entries_cursors'].pop())
+        with col2:
+            st.caption(f"Page {len(cursors)}")
+        with col3:
+            st.button("Older ▶", key="entries_older", disabled=next_cursor is None,
+                      on_click=lambda: st.session_state['entries_cursors'].append(next_cursor))
         
         # Summary statistics
         st.subheader("📊 Summary")
+        summary = entries_summary(show_full_only, start_date, end_date, vehicle_id)
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            total_fuel = display_df['liters'].sum()
-            st.metric("Total Fuel", f"{total_fuel:.1f} L")
+            st.metric("Total Fuel", f"{summary.get('total_fuel_l') or 0:.1f} L")
         
         with col2:
-            total_cost = display_df['amount_pln'].sum()
-            st.metric("Total Cost", f"{total_cost:.2f} PLN")
+            st.metric("Total Cost", f"{summary.get('total_cost_pln') or 0:.2f} PLN")
         
         with col3:
-            avg_price = display_df['price_per_liter'].mean()
-            st.metric("Avg Price/L", f"{avg_price:.2f} PLN")
+            st.metric("Avg Price/L", f"{summary.get('avg_price_per_liter') or 0:.2f} PLN")
         
         with col4:
             # Average consumption from segments
-            valid_consumption = display_df['consumption_l_per_100km'].dropna()
-            if not valid_consumption.empty:
-                avg_consumption = valid_consumption.mean()
-                st.metric("Avg Consumption", f"{avg_consumption:.2f} L/100km")
+            avg_consumption = summary.get('avg_consumption_l_per_100km')
+            if avg_consumption is not None and pd.notna(avg_consumption):
+                st.metric("Avg Consumption", f"{float(avg_consumption):.2f} L/100km")
             else:
                 st.metric("Avg Consumption", "No data")
     else:
         st.info("No entries match the selected filters.")
 
+# Chart builders; each runs only on a figure cache miss
+CHART_HEIGHT = 400
+
+def line_figure(df: pd.DataFrame, x: str, y: str, title: str, labels: Dict,
+                point_budget: Optional[int]) -> "go.Figure":
+    """Line chart of at most point_budget LTTB-selected points, WebGL when large.
+    
+    A fleet gets one line per vehicle, each downsampled to its share of the budget.
+    """
+    import plotly.express as px
+    
+    plotted = downsample_by_vehicle(df, x, y, point_budget)
+    render_mode = 'webgl' if len(plotted) > WEBGL_THRESHOLD else 'svg'
+    color = 'vehicle_id' if is_fleet(df) else None
+    fig = px.line(plotted, x=x, y=y, title=title, labels={**labels, 'vehicle_id': 'Vehicle'},
+                  color=color, render_mode=render_mode)
+    fig.update_layout(height=CHART_HEIGHT)
+    return fig
+
+def downsample_by_vehicle(df: pd.DataFrame, x: str, y: str,
+                          point_budget: Optional[int]) -> pd.DataFrame:
+    """downsample_frame applied per vehicle, splitting the budget between them"""
+    if not is_fleet(df):
+        return downsample_frame(df, x, y, point_budget)
+    groups = df.groupby('vehicle_id', sort=True)
+    budget = None if point_budget is None else max(point_budget // groups.ngroups, 3)
+    return pd.concat([downsample_frame(group, x, y, budget) for _, group in groups])
+
+def price_figure(df: pd.DataFrame, point_budget: Optional[int]) -> "go.Figure":
+    return line_figure(df.sort_values('ts'), 'ts', 'price_per_liter',
+                       "Price per Liter Over Time",
+                       {'ts': 'Date', 'price_per_liter': 'Price (PLN/L)'}, point_budget)
+
+def consumption_figure(segments_df: pd.DataFrame, point_budget: Optional[int]) -> "go.Figure":
+    return line_figure(segments_df, 'end_date', 'consumption_l_per_100km',
+                       "Fuel Consumption Over Time",
+                       {'end_date': 'Date', 'consumption_l_per_100km': 'L/100km'}, point_budget)
+
+def cost_figure(segments_df: pd.DataFrame, point_budget: Optional[int]) -> "go.Figure":
+    return line_figure(segments_df, 'end_date', 'cost_per_100km',
+                       "Cost per 100km Over Time",
+                       {'end_date': 'Date', 'cost_per_100km': 'Cost (PLN/100km)'}, point_budget)
+
+def accuracy_figure(accuracy_data: pd.DataFrame, point_budget: Optional[int]) -> "go.Figure":
+    fig = line_figure(accuracy_data, 'ts', 'range_accuracy',
+                      "Range Prediction Accuracy Over Time",
+                      {'ts': 'Date', 'range_accuracy': 'Accuracy (%)'}, point_budget)
+    import plotly.graph_objects as go
+    
+    # One vehicle's trend only; fleet lines are already one per vehicle
+    if not is_fleet(accuracy_data):
+        # The trend follows the rows LTTB kept for the accuracy series
+        plotted = downsample_frame(accuracy_data, 'ts', 'range_accuracy', point_budget)
+        trace = go.Scattergl if len(plotted) > WEBGL_THRESHOLD else go.Scatter
+        fig.add_trace(trace(x=plotted['ts'], y=plotted['range_accuracy_trend'],
+                            mode='lines', name='Rolling mean', line=dict(dash='dot')))
+    # Average over the full series, not the downsampled one
+    mean_accuracy = accuracy_data['range_accuracy'].mean()
+    fig.add_hline(y=mean_accuracy, 
+                  line_dash="dash", 
+                  annotation_text=f"Average: {mean_accuracy:.1f}%")
+    return fig
+
+def rolling_figure(rolling: pd.DataFrame, title: str, y_label: str,
+                   point_budget: Optional[int]) -> "go.Figure":
+    """One line per rolling window, on the rows LTTB keeps for the shortest window"""
+    import plotly.express as px
+    
+    columns = {window_column(days): f"{days}-day" for days in INSIGHT_WINDOWS}
+    plotted = downsample_frame(rolling, 'ts', window_column(INSIGHT_WINDOWS[0]), point_budget)
+    long = plotted.rename(columns=columns).melt(id_vars='ts', value_vars=list(columns.values()),
+                                                 var_name='Window', value_name='value')
+    render_mode = 'webgl' if len(plotted) > WEBGL_THRESHOLD else 'svg'
+    fig = px.line(long, x='ts', y='value', color='Window', title=title,
+                  labels={'ts': 'Date', 'value': y_label}, render_mode=render_mode)
+    fig.update_layout(height=CHART_HEIGHT)
+    return fig
+
+def seasonality_figure(seasonality: pd.DataFrame, title: str, y_label: str) -> "go.Figure":
+    """Month-of-year bars, with the sample count on hover"""
+    import plotly.express as px
+    
+    fig = px.bar(seasonality, x='month', y='value', title=title, hover_data=['samples'],
+                 labels={'month': 'Month', 'value': y_label, 'samples': 'Samples'})
+    fig.update_layout(height=CHART_HEIGHT)
+    return fig
+
+def plotly_chart_spec(spec: str):
+    """st.plotly_chart for an already serialized figure.
+
+    st.plotly_chart (Streamlit 1.29) copies, revalidates and re-encodes a
+    figure on every call; this sends the cached spec with the same defaults
+    (container width, Streamlit theme).
+    """
+    proto = PlotlyChartProto()
+    proto.use_container_width = True
+    proto.figure.spec = spec
+    proto.figure.config = json.dumps({'showLink': False, 'linkText': False})
+    proto.theme = 'streamlit'
+    # Same path st.plotly_chart takes, so the chart lands in the active container
+    st._main._enqueue('plotly_chart', proto)
+
+def cached_chart(version: Tuple, chart: str, build, total_points: int, point_budget: Optional[int],
+                 vehicle_id: Optional[str] = None):
+    """Render a chart through the shared figure cache, noting any downsampling.
+
+    total_points counts the points of every trace at full resolution.
+    """
+    key = (version, chart, vehicle_id, CHART_HEIGHT, point_budget)
+    spec, plotted = figure_cache.get_or_build(key, lambda: build(point_budget))
+    with span('plotly_render'):
+        plotly_chart_spec(spec)
+    if 0 < plotted < total_points:
+        st.caption(f"Showing {plotted:,} of {total_points:,} points "
+                   f"({total_points / plotted:.1f}× reduction)")
+
 def analytics():
     """Analytics and charts"""
     st.header("📈 Analytics")
     
-    df = FuelDatabase.get_all_entries()
+    version, df, segments_df, accuracy_data = load_analytics_data()
+    
+    # The snapshot covers the whole fleet; one vehicle is a filter over it
+    vehicle_id = st.session_state.get('vehicle')
+    if vehicle_id is not None:
+        df, segments_df, accuracy_data = (
+            frame[frame['vehicle_id'] == vehicle_id] if not frame.empty else frame
+            for frame in (df, segments_df, accuracy_data)
+        )
     
     if df.empty:
         st.info("No data for analytics. Add some fuel entries first!")
         return
     
-    # Calculate metrics
-    df['price_per_liter'] = df.apply(lambda row: FuelCalculator.calculate_price_per_liter(
-        row['amount_pln'], row['liters']), axis=1)
-    
-    df_with_accuracy = FuelCalculator.calculate_range_accuracy(df.sort_values('ts'))
-    segments = FuelCalculator.find_full_tank_segments(df)
+    # Large histories are downsampled to a per-chart point budget
+    fast_charts = st.toggle("⚡ Fast charts", value=True, key="fast_charts",
+                            help="Downsample long series and draw them with WebGL")
+    point_budget = CHART_POINT_BUDGET if fast_charts else None
     
     # Price trend
     st.subheader("💰 Price per Liter Trend")
     if len(df) > 1:
-        fig_price = px.line(df.sort_values('ts'), x='ts', y='price_per_liter',
-                           title="Price per Liter Over Time",
-                           labels={'ts': 'Date', 'price_per_liter': 'Price (PLN/L)'})
-        fig_price.update_layout(height=400)
-        st.plotly_chart(fig_price, use_container_width=True)
+        cached_chart(version, 'price', lambda budget: price_figure(df, budget),
+                     len(df), point_budget, vehicle_id)
     else:
         st.info("Need at least 2 entries to show trend")
     
     # Consumption trend
     st.subheader("⛽ Consumption Trend (Full-to-Full)")
-    if segments:
-        segments_df = pd.DataFrame(segments)
-        fig_consumption = px.line(segments_df, x='end_date', y='consumption_l_per_100km',
-                                 title="Fuel Consumption Over Time",
-                                 labels={'end_date': 'Date', 'consumption_l_per_100km': 'L/100km'})
-        fig_consumption.update_layout(height=400)
-        st.plotly_chart(fig_consumption, use_container_width=True)
+    if not segments_df.empty:
+        cached_chart(version, 'consumption', lambda budget: consumption_figure(segments_df, budget),
+                     len(segments_df), point_budget, vehicle_id)
         
         # Cost per 100km
         st.subheader("💸 Cost per 100km Trend")
-        fig_cost = px.line(segments_df, x='end_date', y='cost_per_100km',
-                          title="Cost per 100km Over Time",
-                          labels={'end_date': 'Date', 'cost_per_100km': 'Cost (PLN/100km)'})
-        fig_cost.update_layout(height=400)
-        st.plotly_chart(fig_cost, use_container_width=True)
+        cached_chart(version, 'cost', lambda budget: cost_figure(segments_df, budget),
+                     len(segments_df), point_budget, vehicle_id)
     else:
         st.info("Need at least 2 full tank entries to calculate consumption")
     
     # Range accuracy
     st.subheader("🎯 Range Prediction Accuracy")
-    accuracy_data = df_with_accuracy[df_with_accuracy['range_accuracy'].notna()]
     if not accuracy_data.empty:
-        fig_accuracy = px.line(accuracy_data, x='ts', y='range_accuracy',
-                              title="Range Prediction Accuracy Over Time",
-                              labels={'ts': 'Date', 'range_accuracy': 'Accuracy (%)'})
-        fig_accuracy.update_layout(height=400)
-        fig_accuracy.add_hline(y=accuracy_data['range_accuracy'].mean(), 
-                              line_dash="dash", 
-                              annotation_text=f"Average: {accuracy_data['range_accuracy'].mean():.1f}%")
-        st.plotly_chart(fig_accuracy, use_container_width=True)
+        # A single vehicle's chart also draws the rolling mean over the same entries
+        accuracy_traces = 1 if is_fleet(accuracy_data) else 2
+        cached_chart(version, 'accuracy', lambda budget: accuracy_figure(accuracy_data, budget),
+                     accuracy_traces * len(accuracy_data), point_budget, vehicle_id)
     else:
         st.info("Need at least 2 entries to calculate range accuracy")
-
-def main():
-    """Main application"""
     
-    # Check if Streamlit secrets are set
+    insights_section(vehicle_id, point_budget)
+
+def insight_metric(label: str, values: Dict[int, float], days: int, unit: str,
+                   compare_to: Optional[int] = None):
+    """Rolling value as a metric; a rise against the longer window shows in red"""
+    value = values[days]
+    delta = value - values[compare_to] if compare_to is not None else None
+    st.metric(f"{label} ({days}d)", f"{value:.2f} {unit}" if pd.notna(value) else "No data",
+              delta=f"{delta:+.2f} vs {compare_to}d" if delta is not None and pd.notna(delta) else None,
+              delta_color="inverse")
+
+def insights_section(vehicle_id: Optional[str], point_budget: Optional[int]):
+    """30/90-day averages and seasonality, maintained incrementally by the entry store"""
     try:
-        if not st.secrets.get("SUPABASE_URL") or not st.secrets.get("SUPABASE_KEY"):
-            st.error("Please set up your Supabase credentials in the secrets.toml file")
-            st.code("""
-            # secrets.toml
-            SUPABASE_URL="your_supabase_url_here"
-            SUPABASE_KEY="your_supabase_anon_key_here"
-            """)
-            st.stop()
+        version, insights = entry_store.snapshot_insights(vehicle_id)
     except Exception as e:
-        st.error("Please create a secrets.toml file with your Supabase credentials")
-        st.code("""
-        # secrets.toml
-        SUPABASE_URL="your_supabase_url_here"
-        SUPABASE_KEY="your_supabase_anon_key_here"
-        """)
-        st.stop()
+        st.error(f"Error loading insights: {str(e)}")
+        return
+    
+    st.subheader("🔎 Insights")
+    short, long = INSIGHT_WINDOWS[0], INSIGHT_WINDOWS[-1]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        insight_metric("Price/L", insights['price_current'], short, "PLN", compare_to=long)
+    with col2:
+        insight_metric("Price/L", insights['price_current'], long, "PLN")
+    with col3:
+        insight_metric("Consumption", insights['consumption_current'], short, "L/100km", compare_to=long)
+    with col4:
+        insight_metric("Consumption", insights['consumption_current'], long, "L/100km")
+    st.caption("Windows end at the latest entry; averages are weighted (total cost / liters, "
+               "total fuel / distance)")
+    
+    rolling_price = insights['price']
+    if len(rolling_price) > 1:
+        cached_chart((version, None), 'insights_price',
+                     lambda budget: rolling_figure(rolling_price, "Rolling Price per Liter", "Price (PLN/L)", budget),
+                     len(INSIGHT_WINDOWS) * len(rolling_price), point_budget, vehicle_id)
+        cached_chart((version, None), 'insights_price_season',
+                     lambda budget: seasonality_figure(insights['price_seasonality'],
+                                                       "Price per Liter by Month", "Price (PLN/L)"),
+                     12, point_budget, vehicle_id)
+    
+    rolling_consumption = insights['consumption']
+    if len(rolling_consumption) > 1:
+        cached_chart((version, None), 'insights_consumption',
+                     lambda budget: rolling_figure(rolling_consumption, "Rolling Consumption", "L/100km", budget),
+                     len(INSIGHT_WINDOWS) * len(rolling_consumption), point_budget, vehicle_id)
+        cached_chart((version, None), 'insights_consumption_season',
+                     lambda budget: seasonality_figure(insights['consumption_seasonality'],
+                                                       "Consumption by Month", "L/100km"),
+                     12, point_budget, vehicle_id)
+
+precompute = init_precompute()
+
+VIEWS = {
+    "➕ Quick Add": quick_add_form,
+    "📋 Entries": view_entries,
+    "📈 Analytics": analytics,
+}
+
+def main():
+    """Main application, timed as one telemetry run per rerun"""
+    telemetry.start_run()
+    try:
+        render_app()
+    finally:
+        clear_authorization()
+        telemetry.finish_run(view=st.session_state.get('active_view'),
+                             vehicle=st.session_state.get('vehicle'),
+                             rows=entry_store.stats()['rows'])
+
+def render_app():
+    """Credentials check, login and the selected view"""
+    
+    # Check if Streamlit secrets are set (a local SQLite database needs none)
+    if supabase is not None and (not st.secrets.get("SUPABASE_URL") or not st.secrets.get("SUPABASE_KEY")):
+        stop_for_secrets("Please set up your Supabase credentials in the secrets.toml file")
     
-    # Require authentication
-    auth.require_auth()
+    # Require authentication (local single-user mode has no accounts)
+    if auth is not None:
+        auth.require_auth()
+        # Queries of this rerun run as the logged-in user
+        authorize(auth.access_token())
     
     # Main app header with logout button
     col1, col2 = st.columns([3, 1])
     with col1:
         st.title("⛽ Fuel Tracker")
     with col2:
-        if st.button("🚪 Logout", type="secondary"):
+        if auth is not None and st.button("🚪 Logout", type="secondary"):
             auth.logout_user()
     
-    # Navigation tabs
-    tab1, tab2, tab3 = st.tabs(["➕ Quick Add", "📋 Entries", "📈 Analytics"])
-    
-    with tab1:
-        quick_add_form()
+    # Entries and Analytics show one vehicle or the whole fleet
+    vehicle_selector()
     
-    with tab2:
-        view_entries()
+    # Navigation: unlike st.tabs, only the selected view's loading and
+    # chart building runs, so typing in Quick Add does not rebuild charts
+    selected_view = st.radio("View", list(VIEWS), horizontal=True,
+                             key="active_view", label_visibility="collapsed")
+    VIEWS[selected_view]()
     
-    with tab3:
-        analytics()
+    show_cache_stats()
+    if perf_panel_enabled():
+        show_perf_panel()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
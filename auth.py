@@ -4,12 +4,62 @@ Simple authentication module for Fuel Tracker
 
 import streamlit as st
 from supabase import Client
+from http.cookies import SimpleCookie
+from typing import Callable, Dict, Optional, Tuple
 import hashlib
+import hmac
 import secrets
+import threading
+import time
+
+PBKDF2_ITERATIONS = 100000
+# Renew the access token this long before it expires
+REFRESH_MARGIN_S = 60
+# Query parameter carrying the opaque session id across page reloads. The id is
+# replaced on every token refresh and only restores a session in the browser
+# that logged in (see browser_binding)
+SESSION_PARAM = "sid"
+# Other tabs of the same browser may still hold a replaced id for this long
+ROTATED_SID_GRACE_S = 3600
+# A stored session ends after this long without a rerun, or this long after login
+SESSION_IDLE_TTL_S = 12 * 3600
+SESSION_MAX_AGE_S = 7 * 24 * 3600
+
+def browser_binding() -> Optional[str]:
+    """Digest of this browser's XSRF cookie token, a per-browser secret that is never in the URL.
+
+    Tornado re-masks the cookie value when it re-sets it, so the token is
+    unmasked first. None when there is no cookie (e.g. XSRF protection off).
+    """
+    try:
+        from streamlit.web.server.websocket_headers import _get_websocket_headers
+        headers = _get_websocket_headers() or {}
+    except Exception:
+        return None
+    morsel = SimpleCookie(headers.get('Cookie', '')).get('_xsrf')
+    if morsel is None:
+        return None
+    parts = morsel.value.split('|')
+    try:
+        if len(parts) == 4 and parts[0] == '2':
+            mask, masked = bytes.fromhex(parts[1]), bytes.fromhex(parts[2])
+            token = bytes(byte ^ mask[i % 4] for i, byte in enumerate(masked))
+        else:
+            token = bytes.fromhex(morsel.value)
+    except ValueError:
+        return None
+    return hashlib.sha256(token).hexdigest()
 
 class SimpleAuth:
-    def __init__(self, supabase_client: Client):
-        self.supabase = supabase_client
+    def __init__(self, client_factory: Callable[[Optional[str]], Client]):
+        # client_factory(access_token) builds a Supabase client for one browser session,
+        # so logins and token refreshes never touch a client other sessions use
+        self.client_factory = client_factory
+        # Token records by session id; the browser only ever sees the id
+        self._sessions: Dict[str, Dict] = {}
+        # Replaced session id -> (its replacement, until when it is followed)
+        self._rotated: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
         
     def hash_password(self, password: str, salt: str = None) -> tuple:
         """Hash password with salt"""
@@ -19,19 +69,199 @@ class SimpleAuth:
         password_hash = hashlib.pbkdf2_hmac('sha256', 
                                           password.encode('utf-8'), 
                                           salt.encode('utf-8'), 
-                                          100000)
+                                          PBKDF2_ITERATIONS)
         return password_hash.hex(), salt
     
     def verify_password(self, password: str, password_hash: str, salt: str) -> bool:
         """Verify password against hash"""
         calculated_hash, _ = self.hash_password(password, salt)
-        return calculated_hash == password_hash
+        return hmac.compare_digest(calculated_hash, password_hash)
+    
+    def client(self) -> Client:
+        """This browser session's Supabase client, authorized with its access token once logged in"""
+        token = self.access_token()
+        handle = st.session_state.get('supabase_client')
+        if handle is None or st.session_state.get('supabase_client_token') != token:
+            handle = self.client_factory(token)
+            st.session_state['supabase_client'] = handle
+            st.session_state['supabase_client_token'] = token
+        return handle
+    
+    def access_token(self) -> Optional[str]:
+        """This browser session's access token, None when logged out"""
+        record = st.session_state.get('auth_session')
+        return record['access_token'] if record is not None else None
+    
+    def user_id(self) -> Optional[str]:
+        """This browser session's user id, None when logged out"""
+        record = st.session_state.get('auth_session')
+        return getattr(record['user'], 'id', None) if record is not None else None
+    
+    def access_token_for(self, user_id: str) -> Optional[str]:
+        """Access token of a live session of user_id, renewed when close to expiry; for background writes"""
+        now = time.time()
+        with self._lock:
+            live = [record for record in self._sessions.values()
+                    if getattr(record['user'], 'id', None) == user_id and not self._is_expired(record, now)]
+        if not live:
+            return None
+        record = max(live, key=lambda record: record['expires_at'])
+        if record['expires_at'] - now > REFRESH_MARGIN_S:
+            return record['access_token']
+        try:
+            result = self.client_factory(None).auth.refresh_session(record['refresh_token'])
+        except Exception:
+            return None
+        if result is None or result.session is None:
+            return None
+        session = result.session
+        with self._lock:
+            # In place, so the browser session serving this record picks up the new tokens
+            record['access_token'] = session.access_token
+            record['refresh_token'] = session.refresh_token
+            record['expires_at'] = session.expires_at or now + (session.expires_in or 0)
+        return session.access_token
+    
+    def latest_access_token(self) -> Optional[str]:
+        """Unexpired access token of the most recently refreshed session, for background reads"""
+        now = time.time()
+        with self._lock:
+            live = [record for record in self._sessions.values()
+                    if record['expires_at'] > now and not self._is_expired(record, now)]
+        return max(live, key=lambda record: record['expires_at'])['access_token'] if live else None
+    
+    @staticmethod
+    def _is_expired(record: Dict, now: float) -> bool:
+        return (now - record['last_seen'] > SESSION_IDLE_TTL_S
+                or now - record['created_at'] > SESSION_MAX_AGE_S)
+    
+    def _evict_expired(self):
+        """Drop stored sessions past their idle or absolute lifetime (lock held)"""
+        now = time.time()
+        for sid in [sid for sid, record in self._sessions.items() if self._is_expired(record, now)]:
+            del self._sessions[sid]
+        for sid in [sid for sid, (_, until) in self._rotated.items() if until <= now]:
+            del self._rotated[sid]
+    
+    def _lookup(self, sid: Optional[str], binding: Optional[str]) -> Tuple[Optional[str], Optional[Dict]]:
+        """Current id and record for a session id, following rotations, for one browser (lock held)"""
+        while sid is not None and sid not in self._sessions and sid in self._rotated:
+            sid = self._rotated[sid][0]
+        record = self._sessions.get(sid) if sid is not None else None
+        if record is None or record['binding'] != binding:
+            return None, None
+        return sid, record
+    
+    @staticmethod
+    def _set_sid_param(sid: Optional[str]):
+        """Set or remove the session id, keeping the page's other query parameters (e.g. debug)"""
+        params = st.experimental_get_query_params()
+        params.pop(SESSION_PARAM, None)
+        if sid is not None:
+            params[SESSION_PARAM] = [sid]
+        st.experimental_set_query_params(**params)
+    
+    def _store_session(self, session):
+        """Keep the Supabase tokens for this browser session"""
+        now = time.time()
+        previous = st.session_state.get('auth_session')
+        record = {
+            'access_token': session.access_token,
+            'refresh_token': session.refresh_token,
+            'expires_at': session.expires_at or now + (session.expires_in or 0),
+            'user': session.user,
+            # A refresh keeps the login's absolute lifetime
+            'created_at': previous['created_at'] if previous is not None else now,
+            'last_seen': now,
+            # Only this browser can restore the session from its id
+            'binding': previous['binding'] if previous is not None else browser_binding(),
+        }
+        # A new id on every login and refresh, so an id that leaked (history, shared links) soon stops working
+        previous_sid = st.session_state.get('auth_sid')
+        sid = secrets.token_urlsafe(24)
+        with self._lock:
+            self._evict_expired()
+            if previous_sid is not None and self._sessions.pop(previous_sid, None) is not None:
+                self._rotated[previous_sid] = (sid, now + ROTATED_SID_GRACE_S)
+            self._sessions[sid] = record
+        st.session_state['auth_sid'] = sid
+        st.session_state['auth_session'] = record
+        st.session_state['authenticated'] = True
+        st.session_state['user'] = session.user
+        if st.experimental_get_query_params().get(SESSION_PARAM, [None])[0] != sid:
+            self._set_sid_param(sid)
+    
+    def _forget_session(self):
+        """Drop the stored tokens for this browser session"""
+        sid = st.session_state.pop('auth_sid', None)
+        if sid is not None:
+            with self._lock:
+                self._sessions.pop(sid, None)
+        st.session_state.pop('auth_session', None)
+        st.session_state['authenticated'] = False
+        st.session_state['user'] = None
+        self._set_sid_param(None)
+    
+    def _adopt(self, sid: str, record: Dict):
+        """Serve a stored session in this browser session"""
+        st.session_state['auth_sid'] = sid
+        st.session_state['auth_session'] = record
+        st.session_state['authenticated'] = True
+        st.session_state['user'] = record['user']
+        if st.experimental_get_query_params().get(SESSION_PARAM, [None])[0] != sid:
+            self._set_sid_param(sid)
+    
+    def _restore_session(self) -> Optional[Dict]:
+        """Pick up the tokens of a reloaded page from its session id"""
+        sid = st.experimental_get_query_params().get(SESSION_PARAM, [None])[0]
+        if sid is None:
+            return None
+        with self._lock:
+            self._evict_expired()
+            current_sid, record = self._lookup(sid, browser_binding())
+        if record is None:
+            # Expired, from before a restart, or opened in another browser: drop the dead id from the URL
+            self._set_sid_param(None)
+        else:
+            self._adopt(current_sid, record)
+        return record
+    
+    def ensure_session(self) -> bool:
+        """Serve the stored tokens, renewing them only when close to expiry"""
+        record = st.session_state.get('auth_session') or self._restore_session()
+        if record is None:
+            return False
+        now = time.time()
+        with self._lock:
+            sid, current = self._lookup(st.session_state.get('auth_sid'), record['binding'])
+            alive = current is not None and not self._is_expired(current, now)
+            if alive:
+                current['last_seen'] = now
+        if not alive:
+            # Idle too long, past its absolute lifetime, or evicted: log in again
+            self._forget_session()
+            return False
+        if current is not record:
+            # Another tab of this browser renewed the tokens under a new id
+            self._adopt(sid, current)
+            record = current
+        if record['expires_at'] - now > REFRESH_MARGIN_S:
+            return True
+        try:
+            result = self.client().auth.refresh_session(record['refresh_token'])
+        except Exception:
+            result = None
+        if result is None or result.session is None:
+            self._forget_session()
+            return False
+        self._store_session(result.session)
+        return True
     
     def register_user(self, email: str, password: str) -> bool:
         """Register a new user (simplified - for single user)"""
         try:
             # For MVP, we'll use Supabase Auth
-            result = self.supabase.auth.sign_up({
+            result = self.client().auth.sign_up({
                 "email": email,
                 "password": password
             })
@@ -50,14 +280,13 @@ class SimpleAuth:
     def login_user(self, email: str, password: str) -> bool:
         """Login user"""
         try:
-            result = self.supabase.auth.sign_in_with_password({
+            result = self.client().auth.sign_in_with_password({
                 "email": email,
                 "password": password
             })
             
-            if result.user:
-                st.session_state['authenticated'] = True
-                st.session_state['user'] = result.user
+            if result.user and result.session:
+                self._store_session(result.session)
                 return True
             else:
                 st.error("Invalid credentials")
@@ -70,16 +299,18 @@ class SimpleAuth:
     def logout_user(self):
         """Logout user"""
         try:
-            self.supabase.auth.sign_out()
-            st.session_state['authenticated'] = False
-            st.session_state['user'] = None
+            record = st.session_state.get('auth_session')
+            if record is not None:
+                # Revoke this session's tokens only; other sessions keep theirs
+                self.client().auth.admin.sign_out(record['access_token'])
+            self._forget_session()
             st.rerun()
         except Exception as e:
             st.error(f"Logout error: {str(e)}")
     
     def is_authenticated(self) -> bool:
-        """Check if user is authenticated"""
-        return st.session_state.get('authenticated', False)
+        """Check if user is authenticated, without a round trip while tokens are valid"""
+        return self.ensure_session()
     
     def require_auth(self):
         """Decorator to require authentication"""
@@ -0,0 +1,52 @@
+"""
+One-shot backfill of the stored metric columns for Fuel Tracker
+
+Fills price_per_liter, distance_from_prev, range_accuracy and segment
+consumption/cost on existing fuel_entry rows, one vehicle at a time. Run it
+once after applying migrations/004_stored_entry_metrics.sql, then set
+STORED_METRICS = true; from then on every write keeps the columns current.
+Without --vehicle the vehicles come from the vehicles view
+(migrations/006_vehicle_list.sql).
+
+Usage:
+    python backfill.py [--vehicle ID] [--since 2024-01-01] [--sqlite fuel_tracker.db]
+"""
+
+import argparse
+import sys
+import time
+from typing import List, Optional
+
+from storage import FuelStorage, SQLiteStorage, SupabaseStorage, supabase_from_environment
+
+
+def backfill(storage: FuelStorage, vehicles: List[str], since: Optional[str] = None):
+    """Refresh stored metrics per vehicle, so each statement stays small"""
+    for vehicle_id in vehicles:
+        started = time.perf_counter()
+        storage.refresh_metrics(vehicle_id, since)
+        print(f"✅ {vehicle_id}: refreshed in {time.perf_counter() - started:.2f}s")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Backfill stored metric columns on fuel_entry")
+    parser.add_argument('--vehicle', action='append', help="Only this vehicle (repeatable)")
+    parser.add_argument('--since', help="Only entries from this timestamp on (and the one before)")
+    parser.add_argument('--sqlite', metavar='PATH', help="Local SQLite database instead of Supabase")
+    args = parser.parse_args(argv)
+
+    if args.sqlite:
+        storage = SQLiteStorage(args.sqlite)
+    else:
+        storage = SupabaseStorage(supabase_from_environment(), stored_metrics=True)
+
+    vehicles = args.vehicle or storage.vehicle_ids()
+    if not vehicles:
+        print("No entries to backfill")
+        return 0
+    backfill(storage, vehicles, args.since)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+"""
+Benchmarks for Fuel Tracker
+
+Synthetic fill-up histories, an in-memory Supabase fake and timing /
+peak-memory benchmarks for the calculation and data-loading pipeline.
+
+Usage (from the repository root):
+    python -m benchmarks [--sizes 100 10000 1000000] [--output results.json] [--compare baseline.json]
+"""
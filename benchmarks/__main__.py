@@ -0,0 +1,69 @@
+"""
+Command line entry point for the Fuel Tracker benchmarks
+"""
+
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.suite import BENCHMARKS, compare, run_suite
+from benchmarks.synthetic import DEFAULT_SEED
+
+DEFAULT_SIZES = [100, 1_000, 10_000, 100_000]
+
+
+def print_result(result):
+    print(f"{result['name']:<36} {result['rows']:>9,} rows  "
+          f"{result['median_s'] * 1000:10.2f} ms  {result['peak_mb']:9.1f} MB peak")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark Fuel Tracker calculations and data loading")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="History sizes in rows (up to 1000000)")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="Run only these benchmarks")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--compare', help="Baseline JSON results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed median slowdown before flagging a regression")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes, args.only, args.repeats, args.seed, progress=print_result)
+
+    if args.output:
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'seed': args.seed,
+            'results': results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"📝 Results written to {args.output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())['results']
+        regressions = 0
+        print(f"\nCompared with {args.compare}:")
+        for row in compare(results, baseline, args.tolerance):
+            marker = "❌" if row['regression'] else "✅"
+            regressions += row['regression']
+            print(f"{marker} {row['name']:<36} {row['rows']:>9,} rows  {row['ratio']:6.2f}×  "
+                  f"{row['peak_mb_delta']:+8.1f} MB")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
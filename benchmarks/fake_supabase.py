@@ -0,0 +1,178 @@
+"""
+In-memory Supabase fake for Fuel Tracker benchmarks
+
+Implements the slice of the supabase-py query builder FuelDatabase uses:
+table().select().eq()/gte()/lt()/order()/limit().execute(), insert/upsert, and
+the raw "order" / "or" PostgREST params the keyset pagination adds.
+"""
+
+import re
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+OPERATORS: Dict[str, Callable] = {
+    'eq': lambda a, b: a == b,
+    'neq': lambda a, b: a != b,
+    'gt': lambda a, b: a > b,
+    'gte': lambda a, b: a >= b,
+    'lt': lambda a, b: a < b,
+    'lte': lambda a, b: a <= b,
+}
+
+
+class FakeResponse:
+    def __init__(self, data: List[Dict]):
+        self.data = data
+        self.count = len(data)
+
+
+def _coerce(value: str, sample):
+    """Parse a PostgREST literal to the type of the column it is compared with"""
+    value = value.strip('"')
+    if isinstance(sample, bool):
+        return value == 'true'
+    if isinstance(sample, (int, float)):
+        return type(sample)(value)
+    return value
+
+
+def _split_top_level(text: str) -> List[str]:
+    """Split on commas that are not inside parentheses or quotes"""
+    parts, depth, quoted, current = [], 0, False, ''
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            parts.append(current)
+            current = ''
+            continue
+        current += char
+    return parts + [current]
+
+
+def parse_logic(expression: str) -> Callable[[Dict], bool]:
+    """Predicate for a PostgREST logic tree such as (a.lt.1,and(a.eq.1,b.lt.2))"""
+    match = re.fullmatch(r'(and|or)?\((.*)\)', expression, re.S)
+    if match:
+        combine = all if match.group(1) == 'and' else any
+        children = [parse_logic(part) for part in _split_top_level(match.group(2))]
+        return lambda row: combine(child(row) for child in children)
+    column, operator, value = expression.split('.', 2)
+    compare = OPERATORS[operator]
+    return lambda row: compare(row[column], _coerce(value, row[column]))
+
+
+class FakeQuery:
+    """Chainable query over one in-memory table"""
+
+    def __init__(self, rows: List[Dict]):
+        self.rows = rows
+        self.params = httpx.QueryParams()
+        self._columns: Optional[List[str]] = None
+        self._filters: List[Callable[[Dict], bool]] = []
+        self._orders: List[tuple] = []
+        self._limit: Optional[int] = None
+        self._write: Optional[Callable[[], List[Dict]]] = None
+
+    def select(self, columns: str = '*', count: Optional[str] = None) -> 'FakeQuery':
+        self._columns = None if columns == '*' else [col.strip() for col in columns.split(',')]
+        return self
+
+    def _filter(self, column: str, operator: str, value) -> 'FakeQuery':
+        compare = OPERATORS[operator]
+        self._filters.append(lambda row: compare(row[column], value))
+        return self
+
+    def eq(self, column: str, value) -> 'FakeQuery':
+        return self._filter(column, 'eq', value)
+
+    def neq(self, column: str, value) -> 'FakeQuery':
+        return self._filter(column, 'neq', value)
+
+    def gt(self, column: str, value) -> 'FakeQuery':
+        return self._filter(column, 'gt', value)
+
+    def gte(self, column: str, value) -> 'FakeQuery':
+        return self._filter(column, 'gte', value)
+
+    def lt(self, column: str, value) -> 'FakeQuery':
+        return self._filter(column, 'lt', value)
+
+    def lte(self, column: str, value) -> 'FakeQuery':
+        return self._filter(column, 'lte', value)
+
+    def order(self, column: str, desc: bool = False) -> 'FakeQuery':
+        self._orders.append((column, desc))
+        return self
+
+    def limit(self, size: int) -> 'FakeQuery':
+        self._limit = size
+        return self
+
+    def insert(self, rows, **_) -> 'FakeQuery':
+        rows = rows if isinstance(rows, list) else [rows]
+        self._write = lambda: self._append(rows, on_conflict=None)
+        return self
+
+    def upsert(self, rows, on_conflict: str = 'id', ignore_duplicates: bool = False, **_) -> 'FakeQuery':
+        rows = rows if isinstance(rows, list) else [rows]
+        self._write = lambda: self._append(rows, on_conflict, ignore_duplicates)
+        return self
+
+    def _append(self, rows: List[Dict], on_conflict: Optional[str],
+                ignore_duplicates: bool = False) -> List[Dict]:
+        if on_conflict is None:
+            self.rows.extend(dict(row) for row in rows)
+            return rows
+        positions = {row[on_conflict]: i for i, row in enumerate(self.rows)}
+        written = []
+        for row in rows:
+            position = positions.get(row[on_conflict])
+            if position is None:
+                self.rows.append(dict(row))
+            elif ignore_duplicates:
+                continue
+            else:
+                self.rows[position] = dict(row)
+            written.append(row)
+        return written
+
+    def execute(self) -> FakeResponse:
+        if self._write is not None:
+            return FakeResponse(self._write())
+
+        orders = list(self._orders)
+        filters = list(self._filters)
+        if 'order' in self.params:
+            for term in self.params['order'].split(','):
+                column, _, direction = term.partition('.')
+                orders.append((column, direction == 'desc'))
+        if 'or' in self.params:
+            filters.append(parse_logic(self.params['or']))
+
+        rows = [row for row in self.rows if all(match(row) for match in filters)] if filters else list(self.rows)
+        # Stable sorts applied last key first give a compound ordering
+        for column, desc in reversed(orders):
+            rows.sort(key=lambda row: row[column], reverse=desc)
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        if self._columns is not None:
+            rows = [{col: row[col] for col in self._columns} for row in rows]
+        return FakeResponse(rows)
+
+
+class FakeSupabase:
+    """Stand-in for supabase.Client holding tables as lists of row dicts"""
+
+    def __init__(self, tables: Optional[Dict[str, List[Dict]]] = None):
+        self.tables = tables or {}
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self.tables.setdefault(name, []))
+
+    from_ = table
@@ -0,0 +1,238 @@
+"""
+Benchmark definitions and measurement for Fuel Tracker
+
+Each benchmark prepares its inputs from a Workload (untimed) and returns the
+callable to measure. Time is the median of several runs; peak memory is taken
+from a separate tracemalloc run so tracing does not skew the timings.
+"""
+
+import statistics
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from calculations import FuelCalculator, DerivedMetrics, FleetMetrics
+from entry_store import EntryStore
+from insights import FleetInsights
+from schema import VIEW_COLUMNS, columns_for, select_clause, typed_frame
+from downsample import DEFAULT_POINT_BUDGET, downsample_frame
+from aggregates import SQLiteAggregates
+from benchmarks.synthetic import DEFAULT_SEED, generate_fleet, generate_history, to_rows
+from benchmarks.fake_supabase import FakeSupabase
+
+# Mirrors app.STORE_COLUMNS / ENTRIES_PAGE_SIZE (app.py cannot be imported outside Streamlit)
+STORE_COLUMNS = columns_for('quick_add', 'entries', 'analytics')
+PAGE_SIZE = 50
+# Vehicles in the fleet workloads
+FLEET_SIZE = 50
+
+
+class Workload:
+    """Inputs for one history size, built lazily and shared by the benchmarks"""
+
+    def __init__(self, rows: int, seed: int = DEFAULT_SEED):
+        self.rows = rows
+        self.seed = seed
+        self._cache: Dict[str, object] = {}
+
+    def _get(self, name: str, build: Callable[[], object]):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    @property
+    def history(self) -> pd.DataFrame:
+        return self._get('history', lambda: generate_history(self.rows, self.seed))
+
+    @property
+    def records(self) -> List[Dict]:
+        return self._get('records', lambda: to_rows(self.history))
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """Typed frame as the entry store holds it (newest first)"""
+        return self._get('frame', lambda: typed_frame(self.records[::-1], STORE_COLUMNS))
+
+    @property
+    def fleet_frame(self) -> pd.DataFrame:
+        """The same number of rows spread over FLEET_SIZE vehicles, newest first"""
+        return self._get('fleet_frame', lambda: typed_frame(
+            to_rows(generate_fleet(self.rows, FLEET_SIZE, self.seed))[::-1], STORE_COLUMNS))
+
+    @property
+    def client(self) -> FakeSupabase:
+        return self._get('client', lambda: FakeSupabase({'fuel_entry': self.records}))
+
+
+def fetch_all(client) -> pd.DataFrame:
+    """Same query and framing as FuelDatabase.fetch_all_entries"""
+    result = client.table('fuel_entry').select(select_clause(STORE_COLUMNS)).order('ts', desc=True).execute()
+    return typed_frame(result.data, STORE_COLUMNS)
+
+
+def fetch_page(client) -> pd.DataFrame:
+    """First entries page as FuelDatabase.get_entries_page queries it"""
+    query = client.table('fuel_entry').select(select_clause(VIEW_COLUMNS['entries']))
+    query.params = query.params.add('order', 'ts.desc,id.desc')
+    rows = query.limit(PAGE_SIZE + 1).execute().data
+    return typed_frame(rows[:PAGE_SIZE], VIEW_COLUMNS['entries'])
+
+
+def analytics_data(store: EntryStore) -> Dict:
+    """The local-mode body of app.build_analytics_data"""
+    _, entries, segments = store.snapshot_derived()
+    entries['price_per_liter'] = FuelCalculator.price_per_liter_column(entries)
+    return {'prices': entries, 'segments': segments,
+            'accuracy': entries[entries['range_accuracy'].notna()]}
+
+
+def _segments(w: Workload):
+    frame = w.frame
+    return lambda: FuelCalculator.find_full_tank_segments(frame)
+
+
+def _segments_reference(w: Workload):
+    frame = w.frame
+    return lambda: FuelCalculator.find_full_tank_segments_reference(frame)
+
+
+def _range_accuracy(w: Workload):
+    frame = w.frame
+    return lambda: FuelCalculator.calculate_range_accuracy(frame)
+
+
+def _derived_metrics(w: Workload):
+    frame = w.frame
+    return lambda: DerivedMetrics.from_frame(frame)
+
+
+def _fleet_segments(w: Workload):
+    frame = w.fleet_frame
+    return lambda: FuelCalculator.find_full_tank_segments(frame)
+
+
+def _fleet_metrics(w: Workload):
+    frame = w.fleet_frame
+    return lambda: FleetMetrics.from_frame(frame)
+
+
+def _insights(w: Workload):
+    frame = w.frame
+    segments = FuelCalculator.segments_frame(frame)
+    return lambda: FleetInsights.from_frames(frame, segments)
+
+
+def _fetch_all(w: Workload):
+    client = w.client
+    return lambda: fetch_all(client)
+
+
+def _analytics_pipeline(w: Workload):
+    # Cold store each run: fetch, derived metrics, analytics frames
+    client = w.client
+    return lambda: analytics_data(EntryStore(lambda: fetch_all(client), columns=STORE_COLUMNS))
+
+
+def _entries_page(w: Workload):
+    client = w.client
+    store = EntryStore(lambda: w.frame, ttl_seconds=3600, columns=STORE_COLUMNS)
+    store.get_derived()
+
+    def run():
+        page = store.annotate(fetch_page(client))
+        page['price_per_liter'] = FuelCalculator.price_per_liter_column(page)
+        return page
+    return run
+
+
+def _downsample(w: Workload):
+    prices = w.frame.sort_values('ts')
+    prices = prices.assign(price_per_liter=FuelCalculator.price_per_liter_column(prices))
+    return lambda: downsample_frame(prices, 'ts', 'price_per_liter', DEFAULT_POINT_BUDGET)
+
+
+def _sqlite_aggregates(w: Workload):
+    backend = SQLiteAggregates()
+    backend.insert_entries(w.records)
+
+    def run():
+        return (backend.price_series(), backend.segments(),
+                backend.range_accuracy(), backend.summary())
+    return run
+
+
+# name -> (setup, largest history size it is run on)
+BENCHMARKS: Dict[str, tuple] = {
+    'find_full_tank_segments': (_segments, None),
+    'find_full_tank_segments_reference': (_segments_reference, 5_000),
+    'calculate_range_accuracy': (_range_accuracy, None),
+    'derived_metrics_from_frame': (_derived_metrics, None),
+    'fleet_segments': (_fleet_segments, None),
+    'fleet_metrics_from_frame': (_fleet_metrics, None),
+    'insights_from_frames': (_insights, None),
+    'fetch_all_entries': (_fetch_all, None),
+    'analytics_pipeline': (_analytics_pipeline, None),
+    'entries_page': (_entries_page, None),
+    'downsample_price_series': (_downsample, None),
+    'sqlite_aggregates': (_sqlite_aggregates, 200_000),
+}
+
+
+def measure(fn: Callable[[], object], repeats: int) -> Dict:
+    """Median/min wall time over repeats, and peak traced memory of one run"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'median_s': statistics.median(timings),
+        'min_s': min(timings),
+        'repeats': repeats,
+        'peak_mb': peak / 1024 / 1024,
+    }
+
+
+def run_suite(sizes: List[int], names: Optional[List[str]] = None, repeats: int = 5,
+              seed: int = DEFAULT_SEED, progress: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """Run the selected benchmarks at each history size"""
+    results = []
+    for rows in sizes:
+        workload = Workload(rows, seed)
+        for name, (setup, max_rows) in BENCHMARKS.items():
+            if names and name not in names:
+                continue
+            if max_rows is not None and rows > max_rows:
+                continue
+            # Fewer repeats for the largest histories keep the suite tractable
+            result = {'name': name, 'rows': rows,
+                      **measure(setup(workload), repeats if rows <= 100_000 else max(1, repeats // 2))}
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    return results
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float = 0.2) -> List[Dict]:
+    """Pair results with a baseline run; flags median slowdowns beyond tolerance"""
+    previous = {(r['name'], r['rows']): r for r in baseline}
+    rows = []
+    for result in results:
+        before = previous.get((result['name'], result['rows']))
+        if before is None:
+            continue
+        ratio = result['median_s'] / before['median_s'] if before['median_s'] else float('inf')
+        rows.append({'name': result['name'], 'rows': result['rows'], 'ratio': ratio,
+                     'peak_mb_delta': result['peak_mb'] - before['peak_mb'],
+                     'regression': ratio > 1 + tolerance})
+    return rows
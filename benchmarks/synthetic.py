@@ -0,0 +1,78 @@
+"""
+Synthetic fill-up histories for Fuel Tracker benchmarks
+
+Histories are generated with numpy from a seed, so every run at a given size
+sees the same data: mostly full fills, some partial top-ups, occasional
+odometer gaps (fill-ups that were never recorded) and a drifting fuel price.
+Fleets interleave several such histories, one per vehicle_id.
+"""
+
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from schema import DEFAULT_VEHICLE_ID
+
+DEFAULT_SEED = 42
+PARTIAL_FILL_RATE = 0.2
+ODOMETER_GAP_RATE = 0.01
+# Histories are squeezed into at most this many years so timestamps stay valid
+MAX_SPAN_YEARS = 30
+
+
+def generate_history(rows: int, seed: int = DEFAULT_SEED,
+                     partial_fill_rate: float = PARTIAL_FILL_RATE,
+                     gap_rate: float = ODOMETER_GAP_RATE,
+                     vehicle_id: str = DEFAULT_VEHICLE_ID) -> pd.DataFrame:
+    """Fuel entries in chronological order, with fuel_entry columns and dtypes"""
+    rng = np.random.default_rng(seed)
+
+    is_full = rng.random(rows) >= partial_fill_rate
+    is_full[0] = True
+    liters = np.where(is_full, rng.uniform(30, 50, rows), rng.uniform(8, 25, rows)).round(2)
+
+    # Distance driven since the previous fill, from the fuel it took to replace
+    consumption = rng.normal(6.5, 0.6, rows).clip(4.0, 10.0)
+    distance = liters / consumption * 100
+    gaps = rng.random(rows) < gap_rate
+    distance[gaps] += rng.uniform(300, 3000, gaps.sum())
+    odometer = (10000 + np.cumsum(distance)).astype(np.int64)
+
+    range_before = rng.integers(20, 150, rows)
+    added_range = (liters / consumption * 100 * rng.normal(1.0, 0.08, rows)).clip(0)
+    range_after = range_before + added_range.astype(np.int64)
+
+    price = (6.3 + np.cumsum(rng.normal(0, 0.03, rows))).clip(4.5, 8.5)
+    amount = (liters * price).round(2)
+
+    span_seconds = min(rows * 5, MAX_SPAN_YEARS * 365) * 86400
+    intervals = span_seconds / rows * (0.5 + rng.random(rows))
+    ts = pd.Timestamp('2000-01-01', tz='UTC') + pd.to_timedelta(np.cumsum(intervals).astype(np.int64), unit='s')
+
+    return pd.DataFrame({
+        'id': [f"00000000-0000-4000-{seed % 0x10000:04x}-{i:012x}" for i in range(rows)],
+        'vehicle_id': vehicle_id,
+        'ts': ts,
+        'liters': liters,
+        'amount_pln': amount,
+        'range_before_km': range_before,
+        'range_after_km': range_after,
+        'odometer_km': odometer,
+        'is_full_tank': is_full,
+    })
+
+
+def generate_fleet(rows: int, vehicles: int, seed: int = DEFAULT_SEED) -> pd.DataFrame:
+    """rows entries spread over vehicles interleaved histories, in chronological order"""
+    sizes = np.full(vehicles, rows // vehicles)
+    sizes[:rows % vehicles] += 1
+    histories = [generate_history(int(size), seed + i, vehicle_id=f"vehicle-{i:03d}")
+                 for i, size in enumerate(sizes) if size]
+    return pd.concat(histories, ignore_index=True).sort_values('ts', kind='mergesort', ignore_index=True)
+
+
+def to_rows(history: pd.DataFrame) -> List[Dict]:
+    """JSON-shaped rows as Supabase returns them (timestamps as ISO strings)"""
+    ts = np.char.add(np.datetime_as_string(history['ts'].values, unit='s'), '+00:00')
+    return history.assign(ts=ts).to_dict('records')
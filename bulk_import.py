@@ -0,0 +1,268 @@
+"""
+Bulk historical import for Fuel Tracker
+
+Streams CSV / JSON files in chunks, validates whole columns at once and
+writes valid rows in batches, reporting every rejected row by number.
+
+Usage:
+    python bulk_import.py receipts.csv [--batch-size 500] [--chunk-size 5000] [--dry-run]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from schema import DEFAULT_VEHICLE_ID
+
+REQUIRED_COLUMNS = ['ts', 'liters', 'amount_pln', 'range_before_km', 'range_after_km', 'odometer_km']
+NUMERIC_COLUMNS = ['liters', 'amount_pln', 'range_before_km', 'range_after_km', 'odometer_km']
+TRUE_VALUES = {'true', '1', 'yes', 'y', 'tak', 't'}
+FALSE_VALUES = {'false', '0', 'no', 'n', 'nie', 'f'}
+EMPTY_VALUES = {'', 'nan', 'none'}
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_BATCH_SIZE = 500
+
+
+class ImportReport:
+    """Counters and per-row errors for one import run"""
+
+    def __init__(self):
+        self.rows_read = 0
+        self.rows_inserted = 0
+        self.errors: List[Tuple[int, str]] = []
+
+    @property
+    def rows_rejected(self) -> int:
+        return len(self.errors)
+
+    def add_errors(self, row_numbers, messages):
+        self.errors.extend(zip((int(n) for n in row_numbers), messages))
+
+
+def read_chunks(source, file_format: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Yield raw chunks from a CSV, JSON-lines or JSON-array source"""
+    if file_format == 'csv':
+        yield from pd.read_csv(source, chunksize=chunk_size, dtype=str, keep_default_na=False)
+    elif file_format == 'jsonl':
+        yield from pd.read_json(source, lines=True, chunksize=chunk_size, dtype=False)
+    elif file_format == 'json':
+        # A JSON array cannot be streamed, but it is still written in chunks
+        records = json.load(source) if hasattr(source, 'read') else json.loads(Path(source).read_text())
+        for start in range(0, len(records), chunk_size):
+            yield pd.DataFrame(records[start:start + chunk_size])
+    else:
+        raise ValueError(f"Unsupported format: {file_format}")
+
+
+def detect_format(filename: str) -> str:
+    """Pick the reader from the file extension"""
+    suffix = Path(filename).suffix.lower()
+    if suffix in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if suffix == '.json':
+        return 'json'
+    return 'csv'
+
+
+def parse_chunk(raw: pd.DataFrame) -> pd.DataFrame:
+    """Coerce raw columns to typed ones; unparseable values become NaN/NaT"""
+    df = pd.DataFrame(index=raw.index)
+    if 'vehicle_id' in raw:
+        vehicle = raw['vehicle_id'].astype(str).str.strip()
+        df['vehicle_id'] = vehicle.where(~vehicle.str.lower().isin(EMPTY_VALUES), DEFAULT_VEHICLE_ID)
+    else:
+        df['vehicle_id'] = DEFAULT_VEHICLE_ID
+    # Parsed per value: exports mix date-only and full timestamps
+    df['ts'] = pd.to_datetime(raw['ts'], errors='coerce', utc=True, format='mixed') if 'ts' in raw else pd.NaT
+    for col in NUMERIC_COLUMNS:
+        df[col] = pd.to_numeric(raw[col], errors='coerce') if col in raw else np.nan
+
+    if 'is_full_tank' in raw:
+        # Blank flags default to a full tank, like the Quick Add form
+        flag = raw['is_full_tank'].astype(str).str.strip().str.lower()
+        df['is_full_tank'] = ~flag.isin(FALSE_VALUES)
+        df['bad_full_flag'] = ~flag.isin(TRUE_VALUES | FALSE_VALUES | EMPTY_VALUES)
+    else:
+        df['is_full_tank'] = True
+        df['bad_full_flag'] = False
+    return df
+
+
+def validate_frame(df: pd.DataFrame, prev_odometers: Optional[Dict[str, float]] = None,
+                   prev_ts: Optional[pd.Timestamp] = None) -> pd.Series:
+    """Validate a parsed chunk column-wise; returns an error message per invalid row.
+
+    Applies the same rules as FuelDatabase.validate_entry, with "last reading"
+    taken as the vehicle's last accepted row in the file (or its
+    prev_odometers value before the first one), so one bad reading does not
+    reject the rows after it.
+    """
+    odometer = df['odometer_km']
+    previous_ts = df['ts'].shift(1)
+    if prev_ts is not None:
+        previous_ts.iloc[:1] = prev_ts
+
+    checks = {
+        'Missing or invalid date': df['ts'].isna(),
+        'Missing or invalid numeric value': df[NUMERIC_COLUMNS].isna().any(axis=1),
+        'Invalid full tank flag': df['bad_full_flag'],
+        'Liters must be greater than 0': df['liters'] <= 0,
+        'Amount must be greater than 0': df['amount_pln'] <= 0,
+        'Range before cannot be negative': df['range_before_km'] < 0,
+        'Range after must be >= range before': df['range_after_km'] < df['range_before_km'],
+        'Odometer must be greater than 0': odometer <= 0,
+        'Entries must be in chronological order': df['ts'] < previous_ts,
+    }
+    failed = pd.DataFrame(checks, index=df.index)
+
+    # Accepted readings only grow, so the last accepted one is the highest
+    # among the earlier rows that pass every other check
+    vehicles = df['vehicle_id']
+    candidates = odometer.where(~failed.any(axis=1))
+    previous = candidates.groupby(vehicles, sort=False).cummax().groupby(vehicles, sort=False).ffill()
+    previous = previous.groupby(vehicles, sort=False).shift(1)
+    previous = previous.fillna(vehicles.map(prev_odometers or {}))
+    failed.insert(failed.columns.get_loc('Odometer must be greater than 0') + 1,
+                  'Odometer must be greater than previous reading', odometer <= previous)
+    bad_rows = failed.any(axis=1)
+    # Messages are only assembled for the rejected rows
+    return failed[bad_rows].apply(lambda row: '; '.join(row.index[row]), axis=1)
+
+
+def to_records(df: pd.DataFrame) -> List[Dict]:
+    """JSON-ready fuel_entry rows"""
+    return [
+        {
+            'vehicle_id': vehicle_id,
+            'ts': ts.isoformat(),
+            'liters': float(liters),
+            'amount_pln': float(amount),
+            'range_before_km': int(before),
+            'range_after_km': int(after),
+            'odometer_km': int(odometer),
+            'is_full_tank': bool(full),
+        }
+        for vehicle_id, ts, liters, amount, before, after, odometer, full in zip(
+            df['vehicle_id'], df['ts'], df['liters'], df['amount_pln'], df['range_before_km'],
+            df['range_after_km'], df['odometer_km'], df['is_full_tank']
+        )
+    ]
+
+
+def import_entries(source, file_format: str, insert_batch: Callable[[List[Dict]], None],
+                   previous_odometer: Optional[Callable[[pd.Timestamp, str], Optional[float]]] = None,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE, batch_size: int = DEFAULT_BATCH_SIZE,
+                   dry_run: bool = False) -> ImportReport:
+    """Validate and insert entries from a file, chunk by chunk.
+
+    previous_odometer(ts, vehicle_id) looks up the vehicle's stored reading
+    just before its first imported timestamp, so backfills older than the
+    existing history work.
+    """
+    report = ImportReport()
+    prev_odometers: Dict[str, float] = {}
+    looked_up = set()
+    prev_ts = None
+
+    for raw in read_chunks(source, file_format, chunk_size):
+        missing = [col for col in REQUIRED_COLUMNS if col not in raw.columns]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+        df = parse_chunk(raw)
+        # File row numbers, 1-based and excluding the header
+        row_numbers = np.arange(report.rows_read + 1, report.rows_read + len(df) + 1)
+        df.index = row_numbers
+        report.rows_read += len(df)
+
+        if previous_odometer is not None:
+            # Once per vehicle, at the vehicle's first timestamp in the file
+            first_rows = df[df['ts'].notna()].drop_duplicates('vehicle_id')
+            for vehicle_id, ts in zip(first_rows['vehicle_id'], first_rows['ts']):
+                if vehicle_id not in looked_up:
+                    looked_up.add(vehicle_id)
+                    stored = previous_odometer(ts, vehicle_id)
+                    if stored is not None:
+                        prev_odometers[vehicle_id] = stored
+
+        errors = validate_frame(df, prev_odometers, prev_ts)
+        report.add_errors(errors.index, errors.values)
+        valid = df.drop(index=errors.index)
+
+        # Each vehicle's last accepted row in this chunk is its "previous reading" for the next one
+        last_valid = valid.drop_duplicates('vehicle_id', keep='last')
+        prev_odometers.update(zip(last_valid['vehicle_id'], last_valid['odometer_km']))
+        looked_up.update(df['vehicle_id'])
+        prev_ts = df['ts'].iloc[-1]
+
+        if dry_run:
+            report.rows_inserted += len(valid)
+            continue
+
+        for start in range(0, len(valid), batch_size):
+            batch = valid.iloc[start:start + batch_size]
+            try:
+                insert_batch(to_records(batch))
+                report.rows_inserted += len(batch)
+            except Exception as e:
+                report.add_errors(batch.index, [f"Insert failed: {e}"] * len(batch))
+
+    report.errors.sort()
+    return report
+
+
+def supabase_writer(client, stored_metrics: bool = False) -> Callable[[List[Dict]], None]:
+    """Batch writer inserting into fuel_entry with one request per batch.
+
+    With stored_metrics each batch also refreshes the stored metric columns
+    (one call per vehicle in the batch).
+    """
+    from storage import SupabaseStorage
+    return SupabaseStorage(client, stored_metrics).insert_entries
+
+
+def supabase_previous_odometer(client) -> Callable[[pd.Timestamp, str], Optional[float]]:
+    """Lookup of a vehicle's stored odometer reading just before a timestamp"""
+    def lookup(ts: pd.Timestamp, vehicle_id: str) -> Optional[float]:
+        result = (client.table('fuel_entry').select('odometer_km').eq('vehicle_id', vehicle_id)
+                  .lt('ts', ts.isoformat()).order('ts', desc=True).limit(1).execute())
+        return result.data[0]['odometer_km'] if result.data else None
+    return lookup
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk import fuel entries from CSV/JSON")
+    parser.add_argument('path', help="CSV, JSON array or JSON-lines file")
+    parser.add_argument('--format', choices=['csv', 'json', 'jsonl'], help="Override format detection")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help="Validate only, write nothing")
+    parser.add_argument('--stored-metrics', action='store_true',
+                        help="Fill the stored metric columns (migrations/004_stored_entry_metrics.sql)")
+    args = parser.parse_args(argv)
+
+    from storage import supabase_from_environment
+    client = supabase_from_environment()
+
+    report = import_entries(
+        args.path, args.format or detect_format(args.path),
+        insert_batch=supabase_writer(client, args.stored_metrics),
+        previous_odometer=supabase_previous_odometer(client),
+        chunk_size=args.chunk_size, batch_size=args.batch_size, dry_run=args.dry_run
+    )
+
+    for row_number, message in report.errors:
+        print(f"❌ Row {row_number}: {message}")
+    action = "validated" if args.dry_run else "imported"
+    print(f"✅ {report.rows_inserted} of {report.rows_read} rows {action}, {report.rows_rejected} rejected")
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
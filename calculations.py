@@ -0,0 +1,537 @@
+"""
+Fuel consumption and range calculations for Fuel Tracker
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+from schema import DEFAULT_VEHICLE_ID
+from telemetry import timed
+
+# Number of accuracy points in the rolling-mean trend line
+RANGE_TREND_WINDOW = 5
+
+# Fleets at least this large build their per-vehicle metrics in a process pool
+PARALLEL_MIN_VEHICLES = 4
+PARALLEL_MIN_ROWS = 200_000
+
+SEGMENT_COLUMNS = [
+    'start_date', 'end_date', 'distance_km', 'fuel_used_l', 'cost_total_pln',
+    'consumption_l_per_100km', 'cost_per_100km', 'end_entry_id', 'vehicle_id'
+]
+
+
+def is_fleet(df: pd.DataFrame) -> bool:
+    """Check if entries span more than one vehicle"""
+    return 'vehicle_id' in df.columns and df['vehicle_id'].nunique() > 1
+
+class FuelCalculator:
+    @staticmethod
+    def calculate_price_per_liter(amount_pln: float, liters: float) -> float:
+        """Calculate price per liter"""
+        return amount_pln / liters if liters > 0 else 0
+
+    @staticmethod
+    def price_per_liter_column(df: pd.DataFrame) -> pd.Series:
+        """Vectorized calculate_price_per_liter over a frame (0 where liters <= 0)"""
+        liters = df['liters'].astype('float64')
+        price = df['amount_pln'].astype('float64') / liters.where(liters > 0)
+        return price.fillna(0.0)
+
+    @staticmethod
+    def range_accuracy(predicted_range: float, actual_distance: float) -> float:
+        """Range accuracy for a single entry (NaN without a positive prediction)"""
+        if not predicted_range > 0:
+            return np.nan
+        error_pct = abs(predicted_range - actual_distance) / max(predicted_range, 1) * 100
+        return max(0.0, min(100.0, 100 - error_pct))
+
+    @staticmethod
+    @timed('segments')
+    def segments_frame(df: pd.DataFrame) -> pd.DataFrame:
+        """Full-to-full segments as a DataFrame, computed in a single pass.
+
+        Liters and amounts are accumulated once over the ts-sorted frame; the
+        totals for a segment (F0, F1] are then the difference of the running
+        sums at the last row with ts <= F1.ts and ts <= F0.ts, located with
+        searchsorted instead of a boolean mask per segment.
+        """
+        if df.empty:
+            return pd.DataFrame(columns=SEGMENT_COLUMNS)
+        if is_fleet(df):
+            return FuelCalculator.fleet_segments_frame(df)
+
+        df_sorted = df.sort_values('ts')
+        # datetime64 view of ts (UTC for tz-aware columns) for fast binary search
+        ts = df_sorted['ts'].values
+
+        # Running totals with a leading zero so position k sums the first k rows
+        cum_liters = np.concatenate(([0.0], df_sorted['liters'].fillna(0).to_numpy(dtype=float).cumsum()))
+        cum_amount = np.concatenate(([0.0], df_sorted['amount_pln'].fillna(0).to_numpy(dtype=float).cumsum()))
+
+        full_tanks = df_sorted[df_sorted['is_full_tank'] == True]
+        if len(full_tanks) < 2:
+            return pd.DataFrame(columns=SEGMENT_COLUMNS)
+
+        # Number of rows with ts <= each full tank's ts
+        upto = np.searchsorted(ts, full_tanks['ts'].values, side='right')
+        start, end = upto[:-1], upto[1:]
+
+        odometer = full_tanks['odometer_km'].to_numpy()
+        distance = odometer[1:] - odometer[:-1]
+        fuel_used = cum_liters[end] - cum_liters[start]
+        cost_total = cum_amount[end] - cum_amount[start]
+
+        # Same skip rules as the loop: the segment must contain entries and cover distance
+        keep = np.flatnonzero((end > start) & (distance > 0))
+        distance, fuel_used, cost_total = distance[keep], fuel_used[keep], cost_total[keep]
+
+        # Positional takes keep the ts dtype (tz-aware stays tz-aware, no object arrays)
+        return pd.DataFrame({
+            'start_date': full_tanks['ts'].iloc[keep].reset_index(drop=True),
+            'end_date': full_tanks['ts'].iloc[keep + 1].reset_index(drop=True),
+            'distance_km': distance,
+            'fuel_used_l': fuel_used,
+            'cost_total_pln': cost_total,
+            'consumption_l_per_100km': fuel_used / distance * 100,
+            'cost_per_100km': cost_total / distance * 100,
+            'end_entry_id': full_tanks['id'].iloc[keep + 1].reset_index(drop=True),
+            'vehicle_id': (full_tanks['vehicle_id'].iloc[keep + 1].reset_index(drop=True)
+                           if 'vehicle_id' in full_tanks.columns else None),
+        }, columns=SEGMENT_COLUMNS)
+
+    @staticmethod
+    def fleet_segments_frame(df: pd.DataFrame) -> pd.DataFrame:
+        """Full-to-full segments for every vehicle at once, ordered by vehicle then time.
+
+        Same running-sum approach as segments_frame over the (vehicle_id, ts)
+        sorted frame: the search key combines the vehicle with the rank of ts,
+        so each segment only sums its own vehicle's rows and consecutive full
+        tanks of different vehicles never pair up.
+        """
+        df_sorted = df.sort_values(['vehicle_id', 'ts'], kind='stable')
+        vehicle_codes = pd.factorize(df_sorted['vehicle_id'])[0].astype(np.int64)
+        ts_rank = np.unique(df_sorted['ts'].values, return_inverse=True)[1].astype(np.int64)
+        key = vehicle_codes * (len(df_sorted) + 1) + ts_rank
+
+        cum_liters = np.concatenate(([0.0], df_sorted['liters'].fillna(0).to_numpy(dtype=float).cumsum()))
+        cum_amount = np.concatenate(([0.0], df_sorted['amount_pln'].fillna(0).to_numpy(dtype=float).cumsum()))
+
+        is_full = (df_sorted['is_full_tank'] == True).to_numpy()
+        full_tanks = df_sorted[is_full]
+        if len(full_tanks) < 2:
+            return pd.DataFrame(columns=SEGMENT_COLUMNS)
+
+        upto = np.searchsorted(key, key[is_full], side='right')
+        start, end = upto[:-1], upto[1:]
+        full_codes = vehicle_codes[is_full]
+
+        odometer = full_tanks['odometer_km'].to_numpy()
+        distance = odometer[1:] - odometer[:-1]
+        fuel_used = cum_liters[end] - cum_liters[start]
+        cost_total = cum_amount[end] - cum_amount[start]
+
+        keep = np.flatnonzero((full_codes[1:] == full_codes[:-1]) & (end > start) & (distance > 0))
+        distance, fuel_used, cost_total = distance[keep], fuel_used[keep], cost_total[keep]
+
+        return pd.DataFrame({
+            'start_date': full_tanks['ts'].iloc[keep].reset_index(drop=True),
+            'end_date': full_tanks['ts'].iloc[keep + 1].reset_index(drop=True),
+            'distance_km': distance,
+            'fuel_used_l': fuel_used,
+            'cost_total_pln': cost_total,
+            'consumption_l_per_100km': fuel_used / distance * 100,
+            'cost_per_100km': cost_total / distance * 100,
+            'end_entry_id': full_tanks['id'].iloc[keep + 1].reset_index(drop=True),
+            'vehicle_id': full_tanks['vehicle_id'].iloc[keep + 1].reset_index(drop=True),
+        }, columns=SEGMENT_COLUMNS)
+
+    @staticmethod
+    def find_full_tank_segments(df: pd.DataFrame) -> List[Dict]:
+        """Find full-to-full segments for consumption calculation"""
+        return FuelCalculator.segments_frame(df).to_dict('records')
+
+    @staticmethod
+    def find_full_tank_segments_reference(df: pd.DataFrame) -> List[Dict]:
+        """Original per-segment loop, kept as the reference for equivalence checks"""
+        if df.empty:
+            return []
+
+        # Sort by timestamp
+        df_sorted = df.sort_values('ts').copy()
+        full_tanks = df_sorted[df_sorted['is_full_tank'] == True].copy()
+
+        segments = []
+        for i in range(len(full_tanks) - 1):
+            start_row = full_tanks.iloc[i]
+            end_row = full_tanks.iloc[i + 1]
+
+            # Get all entries between these two full tanks (inclusive of end, exclusive of start)
+            segment_entries = df_sorted[
+                (df_sorted['ts'] > start_row['ts']) &
+                (df_sorted['ts'] <= end_row['ts'])
+            ]
+
+            if len(segment_entries) > 0:
+                distance = end_row['odometer_km'] - start_row['odometer_km']
+                fuel_used = segment_entries['liters'].sum()
+                cost_total = segment_entries['amount_pln'].sum()
+
+                if distance > 0:
+                    consumption = (fuel_used / distance) * 100
+                    cost_per_100km = (cost_total / distance) * 100
+
+                    segments.append({
+                        'start_date': start_row['ts'],
+                        'end_date': end_row['ts'],
+                        'distance_km': distance,
+                        'fuel_used_l': fuel_used,
+                        'cost_total_pln': cost_total,
+                        'consumption_l_per_100km': consumption,
+                        'cost_per_100km': cost_per_100km,
+                        'end_entry_id': end_row['id']
+                    })
+
+        return segments
+
+    @staticmethod
+    @timed('range_accuracy')
+    def calculate_range_accuracy(df: pd.DataFrame, trend_window: int = RANGE_TREND_WINDOW) -> pd.DataFrame:
+        """Calculate range accuracy for each entry, plus its rolling-mean trend.
+
+        Each entry's range_after_km is compared with the distance to the next
+        entry using shifted columns; range_accuracy is float64 with NaN where
+        there is no prediction or no next entry. range_accuracy_trend is the
+        rolling mean over the last trend_window accuracy values. For a fleet,
+        both are computed per vehicle (rows come back sorted by vehicle, ts).
+        """
+        if df.empty:
+            return df
+
+        fleet = is_fleet(df)
+        if fleet:
+            df_sorted = df.sort_values(['vehicle_id', 'ts'], kind='stable').copy()
+        else:
+            df_sorted = df.sort_values('ts').copy()
+
+        predicted_range = df_sorted['range_after_km'].to_numpy(dtype=float)
+        odometer = df_sorted['odometer_km'].to_numpy(dtype=float)
+        actual_distance = np.append(odometer[1:] - odometer[:-1], np.nan)
+        if fleet:
+            # The next entry of another vehicle is not a next entry
+            vehicles = df_sorted['vehicle_id'].to_numpy()
+            actual_distance[:-1][vehicles[1:] != vehicles[:-1]] = np.nan
+
+        with np.errstate(invalid='ignore'):
+            error_pct = np.abs(predicted_range - actual_distance) / np.maximum(predicted_range, 1) * 100
+            accuracy = np.clip(100 - error_pct, 0, 100)
+            # Entries without a positive prediction have no accuracy
+            accuracy[~(predicted_range > 0)] = np.nan
+
+        df_sorted['range_accuracy'] = accuracy
+        valid = df_sorted['range_accuracy'].dropna()
+        if fleet:
+            df_sorted['range_accuracy_trend'] = (
+                valid.groupby(df_sorted['vehicle_id'], sort=False)
+                .rolling(trend_window, min_periods=1).mean()
+                .reset_index(level=0, drop=True)
+            )
+        else:
+            df_sorted['range_accuracy_trend'] = valid.rolling(trend_window, min_periods=1).mean()
+
+        return df_sorted
+
+
+class DerivedMetrics:
+    """Per-entry and per-segment metrics of one vehicle, maintained incrementally on append.
+
+    A new entry that is later than every known entry can only set its own
+    distance_from_prev, fill in the previous entry's range_accuracy and close
+    the open full-to-full segment, so append() touches just that tail.
+    Backdated entries are rejected and need a full rebuild via from_frame().
+    """
+
+    def __init__(self):
+        self.distance_from_prev: Dict = {}
+        self.range_accuracy: Dict = {}
+        self._base_segments = pd.DataFrame(columns=SEGMENT_COLUMNS)
+        self._tail_segments: List[Dict] = []
+        self._segments_cache: Optional[pd.DataFrame] = None
+        self._last_entry: Optional[Dict] = None
+        self._last_full: Optional[Dict] = None
+        self._open_liters = 0.0
+        self._open_amount = 0.0
+        self._open_count = 0
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'DerivedMetrics':
+        """Full recompute from all entries"""
+        metrics = cls()
+        if df.empty:
+            return metrics
+
+        df_sorted = FuelCalculator.calculate_range_accuracy(df)
+        metrics.distance_from_prev = dict(zip(df_sorted['id'], df_sorted['odometer_km'].diff()))
+        metrics.range_accuracy = dict(zip(df_sorted['id'], df_sorted['range_accuracy']))
+        metrics._base_segments = FuelCalculator.segments_frame(df_sorted)
+        metrics._last_entry = df_sorted.iloc[-1].to_dict()
+
+        # Entries after the last full tank make up the open segment
+        full_tanks = df_sorted[df_sorted['is_full_tank'] == True]
+        if not full_tanks.empty:
+            metrics._last_full = full_tanks.iloc[-1].to_dict()
+            open_entries = df_sorted[df_sorted['ts'] > metrics._last_full['ts']]
+            metrics._open_liters = float(open_entries['liters'].sum())
+            metrics._open_amount = float(open_entries['amount_pln'].sum())
+            metrics._open_count = len(open_entries)
+
+        return metrics
+
+    def append(self, entry: Dict) -> bool:
+        """Apply a new entry in O(1); returns False if it is not the latest entry"""
+        last = self._last_entry
+        if last is not None and not entry['ts'] > last['ts']:
+            return False
+
+        if last is not None:
+            distance = entry['odometer_km'] - last['odometer_km']
+            self.distance_from_prev[entry['id']] = distance
+            self.range_accuracy[last['id']] = FuelCalculator.range_accuracy(last['range_after_km'], distance)
+        else:
+            self.distance_from_prev[entry['id']] = np.nan
+        self.range_accuracy[entry['id']] = np.nan
+
+        self._open_liters += entry['liters']
+        self._open_amount += entry['amount_pln']
+        self._open_count += 1
+
+        if entry['is_full_tank'] == True:
+            start = self._last_full
+            if start is not None:
+                distance = entry['odometer_km'] - start['odometer_km']
+                if self._open_count > 0 and distance > 0:
+                    self._tail_segments.append({
+                        'start_date': start['ts'],
+                        'end_date': entry['ts'],
+                        'distance_km': distance,
+                        'fuel_used_l': self._open_liters,
+                        'cost_total_pln': self._open_amount,
+                        'consumption_l_per_100km': self._open_liters / distance * 100,
+                        'cost_per_100km': self._open_amount / distance * 100,
+                        'end_entry_id': entry['id'],
+                        'vehicle_id': entry.get('vehicle_id')
+                    })
+                    self._segments_cache = None
+            self._last_full = entry
+            self._open_liters = 0.0
+            self._open_amount = 0.0
+            self._open_count = 0
+
+        self._last_entry = entry
+        return True
+
+    def segment_ending_at(self, entry_id) -> Optional[Dict]:
+        """Segment closed by a just-appended entry, if it closed one"""
+        if self._tail_segments and self._tail_segments[-1]['end_entry_id'] == entry_id:
+            return self._tail_segments[-1]
+        return None
+
+    def segments_frame(self) -> pd.DataFrame:
+        """All full-to-full segments, oldest first"""
+        if not self._tail_segments:
+            return self._base_segments
+        if self._segments_cache is None:
+            tail = pd.DataFrame(self._tail_segments, columns=SEGMENT_COLUMNS)
+            base = self._base_segments
+            self._segments_cache = tail if base.empty else pd.concat([base, tail], ignore_index=True)
+        return self._segments_cache
+
+    def annotate(self, df: pd.DataFrame, trend_window: int = RANGE_TREND_WINDOW) -> pd.DataFrame:
+        """Attach the maintained metrics to entries, sorted by ts"""
+        df_sorted = df.sort_values('ts').copy()
+        ids = df_sorted['id']
+        df_sorted['distance_from_prev'] = ids.map(self.distance_from_prev).astype(float)
+        df_sorted['range_accuracy'] = ids.map(self.range_accuracy).astype(float)
+        df_sorted['range_accuracy_trend'] = (
+            df_sorted['range_accuracy'].dropna().rolling(trend_window, min_periods=1).mean()
+        )
+
+        segments = self.segments_frame().set_index('end_entry_id')
+        df_sorted['consumption_l_per_100km'] = ids.map(segments['consumption_l_per_100km']).astype(float)
+        df_sorted['cost_per_100km'] = ids.map(segments['cost_per_100km']).astype(float)
+        return df_sorted
+
+    def check_consistency(self, df: pd.DataFrame) -> List[str]:
+        """Compare the maintained metrics with a full recompute; returns mismatches"""
+        fresh = DerivedMetrics.from_frame(df)
+        problems = []
+
+        for name in ('distance_from_prev', 'range_accuracy'):
+            ours = pd.Series(getattr(self, name), dtype=float)
+            theirs = pd.Series(getattr(fresh, name), dtype=float)
+            if set(ours.index) != set(theirs.index):
+                problems.append(f"{name}: entry ids differ")
+                continue
+            ours = ours.reindex(theirs.index)
+            if not np.allclose(ours.to_numpy(), theirs.to_numpy(), equal_nan=True):
+                problems.append(f"{name}: {int((~np.isclose(ours, theirs, equal_nan=True)).sum())} values differ")
+
+        ours, theirs = self.segments_frame(), fresh.segments_frame()
+        if len(ours) != len(theirs):
+            problems.append(f"segments: {len(ours)} maintained vs {len(theirs)} recomputed")
+        elif not ours.empty:
+            if list(ours['end_entry_id']) != list(theirs['end_entry_id']):
+                problems.append("segments: end entries differ")
+            for col in ('distance_km', 'fuel_used_l', 'cost_total_pln'):
+                if not np.allclose(ours[col].to_numpy(dtype=float), theirs[col].to_numpy(dtype=float)):
+                    problems.append(f"segments: {col} differs")
+
+        return problems
+
+
+class FleetMetrics:
+    """DerivedMetrics partitioned by vehicle_id, behind the same interface.
+
+    All vehicles are built from one partitioned pass over the entries (no
+    per-vehicle rescans); large fleets split that pass across worker
+    processes by vehicle. Appends are routed to the entry's vehicle, so a
+    backdated entry only has to be later than its own vehicle's last one.
+    """
+
+    def __init__(self):
+        self.vehicles: Dict[str, DerivedMetrics] = {}
+        self._segments_cache: Optional[pd.DataFrame] = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, max_workers: Optional[int] = None) -> 'FleetMetrics':
+        """Full recompute from all entries"""
+        fleet = cls()
+        if df.empty:
+            return fleet
+        if 'vehicle_id' not in df.columns:
+            df = df.assign(vehicle_id=DEFAULT_VEHICLE_ID)
+
+        if df['vehicle_id'].nunique() >= PARALLEL_MIN_VEHICLES and len(df) >= PARALLEL_MIN_ROWS:
+            # Whole vehicles are dealt out to workers, each building its share in one pass
+            workers = max_workers or os.cpu_count() or 1
+            shares = pd.factorize(df['vehicle_id'])[0] % workers
+            partitions = [part for _, part in df.groupby(shares)]
+            # spawn: forking a multithreaded server process is not safe
+            context = multiprocessing.get_context('spawn')
+            try:
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                    built = {}
+                    for part in pool.map(FleetMetrics.build_vehicles, partitions):
+                        built.update(part)
+            except (BrokenProcessPool, OSError):
+                # No usable worker processes (e.g. sandboxed host): build in-process
+                built = FleetMetrics.build_vehicles(df)
+        else:
+            built = FleetMetrics.build_vehicles(df)
+        fleet.vehicles = dict(sorted(built.items()))
+        return fleet
+
+    @staticmethod
+    def build_vehicles(df: pd.DataFrame) -> Dict[str, DerivedMetrics]:
+        """Per-vehicle DerivedMetrics from one partitioned pass over all their entries.
+
+        Distances, accuracy and segments are computed for every vehicle at
+        once; the results are then only split up by vehicle.
+        """
+        df_sorted = FuelCalculator.calculate_range_accuracy(df)
+        vehicles = df_sorted['vehicle_id'].to_numpy()
+        odometer = df_sorted['odometer_km'].to_numpy(dtype=float)
+        distance = np.append(np.nan, odometer[1:] - odometer[:-1])
+        distance[1:][vehicles[1:] != vehicles[:-1]] = np.nan
+        ids = df_sorted['id'].to_numpy()
+        accuracy = df_sorted['range_accuracy'].to_numpy()
+
+        segments = FuelCalculator.segments_frame(df_sorted)
+        segments_by_vehicle = dict(tuple(segments.groupby('vehicle_id', sort=False))) if not segments.empty else {}
+
+        # Rows are in ts order within each vehicle, so the last row per vehicle is its latest
+        last_entries = {row['vehicle_id']: row for row in
+                        df_sorted.drop_duplicates('vehicle_id', keep='last').to_dict('records')}
+        full_tanks = df_sorted[df_sorted['is_full_tank'] == True]
+        last_fulls = {row['vehicle_id']: row for row in
+                      full_tanks.drop_duplicates('vehicle_id', keep='last').to_dict('records')}
+
+        # Entries after their vehicle's last full tank make up its open segment
+        last_full_ts = df_sorted['vehicle_id'].map(
+            pd.Series({v: row['ts'] for v, row in last_fulls.items()}, dtype=df_sorted['ts'].dtype)
+        )
+        open_totals = (df_sorted[df_sorted['ts'] > last_full_ts]
+                       .groupby('vehicle_id')
+                       .agg(liters=('liters', 'sum'), amount=('amount_pln', 'sum'), count=('id', 'size')))
+
+        built = {}
+        for vehicle_id, positions in df_sorted.groupby('vehicle_id', sort=False).indices.items():
+            metrics = DerivedMetrics()
+            vehicle_ids = ids[positions]
+            metrics.distance_from_prev = dict(zip(vehicle_ids, distance[positions]))
+            metrics.range_accuracy = dict(zip(vehicle_ids, accuracy[positions]))
+            if vehicle_id in segments_by_vehicle:
+                metrics._base_segments = segments_by_vehicle[vehicle_id].reset_index(drop=True)
+            metrics._last_entry = last_entries[vehicle_id]
+            metrics._last_full = last_fulls.get(vehicle_id)
+            if vehicle_id in open_totals.index:
+                totals = open_totals.loc[vehicle_id]
+                metrics._open_liters = float(totals['liters'])
+                metrics._open_amount = float(totals['amount'])
+                metrics._open_count = int(totals['count'])
+            built[vehicle_id] = metrics
+        return built
+
+    def append(self, entry: Dict) -> bool:
+        """Apply a new entry to its vehicle; returns False if it is not that vehicle's latest"""
+        vehicle_id = entry.get('vehicle_id') or DEFAULT_VEHICLE_ID
+        metrics = self.vehicles.setdefault(vehicle_id, DerivedMetrics())
+        if not metrics.append(entry):
+            return False
+        self._segments_cache = None
+        return True
+
+    def segment_ending_at(self, entry: Dict) -> Optional[Dict]:
+        """Segment closed by a just-appended entry, if it closed one"""
+        metrics = self.vehicles.get(entry.get('vehicle_id') or DEFAULT_VEHICLE_ID)
+        return metrics.segment_ending_at(entry['id']) if metrics is not None else None
+
+    def segments_frame(self) -> pd.DataFrame:
+        """All full-to-full segments, by vehicle, oldest first within each"""
+        if len(self.vehicles) <= 1:
+            return next(iter(self.vehicles.values())).segments_frame() if self.vehicles \
+                else pd.DataFrame(columns=SEGMENT_COLUMNS)
+        if self._segments_cache is None:
+            parts = [metrics.segments_frame() for metrics in self.vehicles.values()]
+            parts = [part for part in parts if not part.empty]
+            self._segments_cache = (pd.concat(parts, ignore_index=True) if parts
+                                    else pd.DataFrame(columns=SEGMENT_COLUMNS))
+        return self._segments_cache
+
+    def annotate(self, df: pd.DataFrame, trend_window: int = RANGE_TREND_WINDOW) -> pd.DataFrame:
+        """Attach each vehicle's maintained metrics to its entries, sorted by ts"""
+        if not is_fleet(df):
+            vehicle_id = df['vehicle_id'].iloc[0] if 'vehicle_id' in df.columns and not df.empty \
+                else DEFAULT_VEHICLE_ID
+            return self.vehicles.get(vehicle_id, DerivedMetrics()).annotate(df, trend_window)
+        parts = [self.vehicles.get(vehicle_id, DerivedMetrics()).annotate(group, trend_window)
+                 for vehicle_id, group in df.groupby('vehicle_id', sort=False)]
+        return pd.concat(parts).sort_values('ts', kind='stable')
+
+    def check_consistency(self, df: pd.DataFrame) -> List[str]:
+        """Compare every vehicle's maintained metrics with a full recompute"""
+        if 'vehicle_id' not in df.columns:
+            return self.vehicles.get(DEFAULT_VEHICLE_ID, DerivedMetrics()).check_consistency(df)
+        problems = []
+        groups = dict(tuple(df.groupby('vehicle_id')))
+        for vehicle_id in sorted(set(groups) | set(self.vehicles)):
+            group = groups.get(vehicle_id, df.iloc[:0])
+            metrics = self.vehicles.get(vehicle_id, DerivedMetrics())
+            problems.extend(f"{vehicle_id}: {problem}" for problem in metrics.check_consistency(group))
+        return problems
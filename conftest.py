@@ -0,0 +1,6 @@
+"""
+pytest configuration for Fuel Tracker
+
+Its presence puts the repository root on sys.path, so tests import the
+flat top-level modules directly.
+"""
@@ -0,0 +1,179 @@
+"""
+Incremental entry sync for Fuel Tracker
+
+After one full load the entry store only asks for the rows whose updated_at
+is at or after its high-water mark, so a refresh costs in proportion to the
+number of changes rather than the size of the table. The query reaches back
+overlap_seconds before the mark, because rows committed late by a concurrent
+writer carry an older updated_at; rows fetched again are recognised by id.
+Deletes leave nothing to fetch, so every reconcile_seconds the per-vehicle
+row count and odometer sum are compared with the resident rows, and a
+vehicle that differs is reloaded on its own.
+"""
+
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from schema import typed_frame
+from telemetry import count
+
+SYNC_COLUMN = 'updated_at'
+
+# Rows per request while paging through changes
+CHANGES_PAGE_SIZE = 1000
+
+DEFAULT_OVERLAP_S = 30.0
+DEFAULT_RECONCILE_S = 600.0
+
+
+def split_changes(frame: pd.DataFrame,
+                  changes: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Changed rows split into new entries, edits of resident ones, and
+    resident local rows now confirmed (stamped) by the database.
+
+    The remaining rows, such as overlap re-fetches, match the resident copy
+    and need no merge. Only the resident rows sharing an id are compared.
+    """
+    empty = changes.iloc[:0]
+    if frame.empty:
+        return changes, empty, empty
+    resident = frame[frame['id'].isin(changes['id'])].drop_duplicates('id').set_index('id')
+    known = changes['id'].isin(resident.index).to_numpy()
+    new = changes[~known]
+    if not known.any():
+        return new, empty, empty
+
+    known_rows = changes[known]
+    fetched = known_rows.set_index('id')
+    resident = resident.loc[fetched.index]
+    columns = [col for col in fetched.columns if col != SYNC_COLUMN and col in resident.columns]
+    same = ((fetched[columns] == resident[columns]) | (fetched[columns].isna() & resident[columns].isna()))
+    differs = ~same.all(axis=1).to_numpy()
+    unstamped = ~differs
+    if SYNC_COLUMN in resident.columns:
+        unstamped &= resident[SYNC_COLUMN].isna().to_numpy()
+    return new, known_rows[differs], known_rows[unstamped]
+
+
+def merge_rows(frame: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+    """Resident frame with rows added or replaced by id, kept newest first"""
+    if frame.empty:
+        return rows.sort_values('ts', ascending=False, kind='stable', ignore_index=True)
+    kept = frame[~frame['id'].isin(rows['id'])]
+    rows = rows.sort_values('ts', ascending=False, kind='stable')
+    if kept.empty or rows['ts'].iloc[-1] >= kept['ts'].iloc[0]:
+        # Newer than everything resident (the usual case): no re-sort
+        return pd.concat([rows, kept], ignore_index=True)
+    return pd.concat([rows, kept], ignore_index=True).sort_values(
+        'ts', ascending=False, kind='stable', ignore_index=True
+    )
+
+
+def replace_vehicle(frame: pd.DataFrame, vehicle_id: str, rows: pd.DataFrame) -> pd.DataFrame:
+    """Swap in a vehicle's reloaded rows, keeping its local rows the database has not seen yet"""
+    if frame.empty:
+        return merge_rows(frame, rows)
+    local = frame[SYNC_COLUMN].isna() & ~frame['id'].isin(rows['id'])
+    kept = frame[(frame['vehicle_id'] != vehicle_id) | local]
+    if rows.empty:
+        return kept.reset_index(drop=True)
+    return merge_rows(kept, rows)
+
+
+def resident_checksums(frame: pd.DataFrame) -> Dict[str, Tuple[int, int]]:
+    """(entry count, odometer sum) per vehicle over the rows that came from the database"""
+    synced = frame[frame[SYNC_COLUMN].notna()] if not frame.empty else frame
+    if synced.empty:
+        return {}
+    totals = (synced.assign(odometer_km=synced['odometer_km'].astype('int64'))
+              .groupby('vehicle_id')
+              .agg(entry_count=('id', 'size'), odometer_total=('odometer_km', 'sum')))
+    return {vehicle_id: (int(entries), int(odometer))
+            for vehicle_id, entries, odometer in totals.itertuples()}
+
+
+class DeltaSync:
+    """High-water mark and reconciliation state for one resident copy of the entries.
+
+    fetch_changes(since, after, limit) returns raw rows changed at or after
+    since, paged by the (updated_at, id) cursor after; fetch_checksums()
+    returns the database's (count, odometer sum) per vehicle; and
+    fetch_vehicle(vehicle_id) returns all of one vehicle's raw rows.
+    """
+
+    def __init__(self, fetch_changes: Callable[[Optional[str], Optional[Tuple[str, str]], int], List[Dict]],
+                 fetch_checksums: Callable[[], Dict[str, Tuple[int, int]]],
+                 fetch_vehicle: Callable[[str], List[Dict]], columns: List[str],
+                 overlap_seconds: float = DEFAULT_OVERLAP_S, reconcile_seconds: float = DEFAULT_RECONCILE_S,
+                 page_size: int = CHANGES_PAGE_SIZE):
+        self._fetch_changes = fetch_changes
+        self._fetch_checksums = fetch_checksums
+        self._fetch_vehicle = fetch_vehicle
+        self.columns = columns
+        self.overlap = pd.Timedelta(seconds=overlap_seconds)
+        self.reconcile_seconds = reconcile_seconds
+        self.page_size = page_size
+        self.watermark: Optional[pd.Timestamp] = None
+        self.syncs = 0
+        self.reconciles = 0
+        self.vehicles_reloaded = 0
+        self._reconciled_at = time.monotonic()
+
+    def reset(self, frame: pd.DataFrame, reconcile: bool = False):
+        """Take the high-water mark from a full load, or from a restored
+        snapshot (reconcile=True), whose deletes the next sync must check"""
+        latest = frame[SYNC_COLUMN].max() if not frame.empty and SYNC_COLUMN in frame.columns else None
+        self.watermark = latest if pd.notna(latest) else None
+        self._reconciled_at = float('-inf') if reconcile else time.monotonic()
+
+    def fetch_changes(self) -> pd.DataFrame:
+        """Rows changed since the high-water mark (minus the overlap), advancing the mark"""
+        since = (self.watermark - self.overlap).isoformat() if self.watermark is not None else None
+        rows: List[Dict] = []
+        after = None
+        while True:
+            page = self._fetch_changes(since, after, self.page_size)
+            rows.extend(page)
+            if len(page) < self.page_size:
+                break
+            after = (page[-1][SYNC_COLUMN], page[-1]['id'])
+        self.syncs += 1
+        count('delta_syncs')
+        count('delta_rows', len(rows))
+
+        changes = typed_frame(rows, self.columns)
+        if not changes.empty:
+            latest = changes[SYNC_COLUMN].max()
+            if self.watermark is None or latest > self.watermark:
+                self.watermark = latest
+        return changes
+
+    def reconcile_due(self) -> bool:
+        return time.monotonic() - self._reconciled_at >= self.reconcile_seconds
+
+    def stale_vehicles(self, frame: pd.DataFrame) -> List[str]:
+        """Vehicles whose resident rows disagree with the database's checksums"""
+        self._reconciled_at = time.monotonic()
+        self.reconciles += 1
+        remote = self._fetch_checksums()
+        local = resident_checksums(frame)
+        stale = sorted(vehicle_id for vehicle_id in set(remote) | set(local)
+                       if remote.get(vehicle_id) != local.get(vehicle_id))
+        self.vehicles_reloaded += len(stale)
+        count('reconcile_reloads', len(stale))
+        return stale
+
+    def fetch_vehicle(self, vehicle_id: str) -> pd.DataFrame:
+        """All of one vehicle's rows, typed"""
+        rows = typed_frame(self._fetch_vehicle(vehicle_id), self.columns)
+        return rows if not rows.empty else pd.DataFrame(columns=self.columns)
+
+    def stats(self) -> Dict:
+        return {
+            'watermark': self.watermark,
+            'syncs': self.syncs,
+            'reconciles': self.reconciles,
+            'vehicles_reloaded': self.vehicles_reloaded,
+        }
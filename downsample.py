@@ -0,0 +1,58 @@
+"""
+Chart downsampling for Fuel Tracker
+
+Largest-Triangle-Three-Buckets (LTTB) reduces a series to a point budget while
+keeping its visual shape: the first and last points are always kept, and each
+bucket contributes the point forming the largest triangle with its neighbours,
+so spikes and dips survive.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Roughly two points per horizontal pixel on a phone-width chart
+DEFAULT_POINT_BUDGET = 2000
+# Above this many plotted points, traces are drawn with WebGL instead of SVG
+WEBGL_THRESHOLD = 1000
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Positions of the points LTTB keeps when reducing (x, y) to n_out points"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+
+    # Bucket i covers [edges[i], edges[i + 1]); first and last points sit outside
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+    # The last bucket's "next" point is the final point itself
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[a] - avg_x[i]) * (by - y[a]) - (x[a] - bx) * (avg_y[i] - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def downsample_frame(df: pd.DataFrame, x: str, y: str, n_out: int) -> pd.DataFrame:
+    """Rows of df kept by LTTB on (x, y); df must already be sorted by x"""
+    df = df[df[y].notna()]
+    if n_out is None or len(df) <= n_out:
+        return df
+    x_values = df[x]
+    if pd.api.types.is_datetime64_any_dtype(x_values):
+        x_values = x_values.values.view('int64')
+    return df.iloc[lttb_indices(x_values, df[y].to_numpy(dtype='float64'), n_out)]
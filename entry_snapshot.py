@@ -0,0 +1,112 @@
+"""
+Persistent entry snapshot for Fuel Tracker
+
+The entry store's frame is kept in a local Arrow IPC file tagged with its data
+version, so a restarted (or woken) process reads it back instead of fetching
+and parsing the whole history; a delta sync then brings it up to date. The
+file is memory-mapped, which saves reading it into a buffer first, but
+converting to pandas still copies every column once. The file is rewritten by
+a background thread at most every min_interval seconds.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from delta_sync import SYNC_COLUMN
+from telemetry import count, span
+
+# Bump when the file layout changes; older files are then ignored
+SNAPSHOT_FORMAT = 1
+
+DEFAULT_SNAPSHOT_INTERVAL_S = 30.0
+
+_META_FORMAT = b'fuel_tracker.format'
+_META_VERSION = b'fuel_tracker.version'
+_META_COLUMNS = b'fuel_tracker.columns'
+
+
+class EntrySnapshot:
+    """Arrow IPC copy of the resident entries for one set of columns.
+
+    Only rows the database has confirmed (with an updated_at) are written, so
+    a restored frame never holds entries that may not exist remotely.
+    """
+
+    def __init__(self, path: str, columns: List[str], min_interval: float = DEFAULT_SNAPSHOT_INTERVAL_S):
+        self.path = path
+        self.columns = columns
+        self.min_interval = min_interval
+        self.saved_version: Optional[int] = None
+        self.last_error: Optional[str] = None
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self) -> Optional[Tuple[int, pd.DataFrame]]:
+        """(data version, frame) from the file; None if it is missing, unreadable or for other columns"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with span('snapshot_load'):
+                with pa.memory_map(self.path, 'r') as source:
+                    table = pa.ipc.open_file(source).read_all()
+                    meta = table.schema.metadata or {}
+                    if (meta.get(_META_FORMAT) != str(SNAPSHOT_FORMAT).encode()
+                            or json.loads(meta.get(_META_COLUMNS, b'[]')) != self.columns):
+                        return None
+                    version = int(meta[_META_VERSION])
+                    frame = table.to_pandas()
+        except (OSError, ValueError, KeyError, pa.ArrowException) as e:
+            # A torn or foreign file only costs the full load it would have saved
+            self.last_error = str(e)
+            return None
+        count('snapshot_restores')
+        self.saved_version = version
+        return version, frame
+
+    def save(self, version: int, frame: pd.DataFrame):
+        """Write the frame atomically, tagged with its data version"""
+        confirmed = frame[frame[SYNC_COLUMN].notna()]
+        with span('snapshot_write'):
+            table = pa.Table.from_pandas(confirmed[self.columns], preserve_index=False)
+            table = table.replace_schema_metadata({
+                _META_FORMAT: str(SNAPSHOT_FORMAT),
+                _META_VERSION: str(version),
+                _META_COLUMNS: json.dumps(self.columns),
+            })
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with pa.OSFile(temp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(temp_path, self.path)
+        self.saved_version = version
+
+    def notify(self, *_):
+        """Signal that the entries changed (safe to call from any thread)"""
+        self._wake.set()
+
+    def _run(self, source: Callable[[], Tuple[int, Optional[pd.DataFrame]]]):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            version, frame = source()
+            if frame is not None and not frame.empty and version != self.saved_version:
+                try:
+                    self.save(version, frame)
+                    self.last_error = None
+                except (OSError, ValueError, pa.ArrowException) as e:
+                    self.last_error = str(e)
+            # Coalesce bursts of changes into one write per interval
+            time.sleep(self.min_interval)
+
+    def start(self, source: Callable[[], Tuple[int, Optional[pd.DataFrame]]]):
+        """Start the writer thread (idempotent); source() returns the current (version, frame)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, args=(source,), name="fuel-snapshot",
+                                            daemon=True)
+            self._thread.start()
@@ -0,0 +1,309 @@
+"""
+Versioned entry store for Fuel Tracker
+
+With a DeltaSync, TTL expiry and invalidation refresh the resident frame with
+just the changed rows instead of reloading the whole history, and the first
+load can start from an on-disk EntrySnapshot instead of a full fetch.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from calculations import FleetMetrics
+from delta_sync import DeltaSync, merge_rows, replace_vehicle, split_changes
+from entry_snapshot import EntrySnapshot
+from insights import FleetInsights
+from schema import typed_frame
+from telemetry import count, telemetry
+
+
+class EntryStore:
+    """Single shared copy of the fuel entries, reloaded on TTL expiry or invalidation"""
+
+    def __init__(self, loader: Callable[[], pd.DataFrame], ttl_seconds: float = 60.0,
+                 columns: Optional[List[str]] = None, delta: Optional[DeltaSync] = None,
+                 snapshot: Optional[EntrySnapshot] = None,
+                 pending: Optional[Callable[[], List[Dict]]] = None):
+        self.loader = loader
+        self.columns = columns
+        self.ttl_seconds = ttl_seconds
+        self.delta = delta
+        # A snapshot can only be reconciled through delta sync
+        self.snapshot = snapshot if delta is not None else None
+        self.restored_from: Optional[int] = None
+        # Rows saved locally but not yet in the database; a full load merges them via
+        # the loader, a restore from the snapshot through this
+        self.pending = pending
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._frame: Optional[pd.DataFrame] = None
+        self._metrics: Optional[FleetMetrics] = None
+        self._insights: Optional[FleetInsights] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[int], None]] = []
+
+    def add_listener(self, callback: Callable[[int], None]):
+        """Register a non-blocking callback invoked with each new version"""
+        self._listeners.append(callback)
+
+    def _bump_version(self):
+        """Advance the data version and notify listeners (lock held)"""
+        self.version += 1
+        for callback in self._listeners:
+            callback(self.version)
+
+    def is_stale(self) -> bool:
+        """Check if the next read would refetch"""
+        with self._lock:
+            return not self._is_fresh()
+
+    def serves_without_reload(self) -> bool:
+        """Check if a read needs neither a full load nor a restore (fresh, or resident with delta sync)"""
+        with self._lock:
+            return self._frame is not None and (self.delta is not None or self._is_fresh())
+
+    def _is_fresh(self) -> bool:
+        """Check if the resident frame can still be served"""
+        if self._frame is None:
+            return False
+        return (time.monotonic() - self._loaded_at) < self.ttl_seconds
+
+    def _ensure_loaded(self):
+        """Reload the frame if it is missing or past its TTL (lock held)"""
+        if self._is_fresh():
+            self.hits += 1
+            count('entry_cache_hits')
+            return
+        if self.delta is not None and self._frame is not None:
+            # Sync errors propagate and leave the expired frame in place for a retry
+            self._sync()
+            self._loaded_at = time.monotonic()
+            telemetry.gauge('entry_rows', len(self._frame))
+            return
+        if self._frame is None and self.snapshot is not None and self.restored_from is None:
+            if self._restore():
+                return
+        self.misses += 1
+        count('entry_cache_misses')
+        # Loader errors propagate and leave the store empty, so a
+        # failed fetch is retried on the next call instead of cached
+        self._frame = self.loader()
+        self._metrics = None
+        self._insights = None
+        self._loaded_at = time.monotonic()
+        if self.delta is not None:
+            self.delta.reset(self._frame)
+        telemetry.gauge('entry_rows', len(self._frame))
+        self._bump_version()
+
+    def _restore(self) -> bool:
+        """Start from the on-disk snapshot and sync it with the database (lock held)"""
+        restored = self.snapshot.load()
+        if restored is None:
+            return False
+        version, frame = restored
+        self.restored_from = version
+        self._frame = frame
+        self._metrics = None
+        self._insights = None
+        # Continue the snapshot's numbering so versions never repeat across restarts
+        self.version = max(self.version, version)
+        self._bump_version()
+        # Sync errors propagate; the next read retries the sync, not the restore
+        self.delta.reset(frame, reconcile=True)
+        self._sync()
+        if self.pending is not None:
+            pending = typed_frame(self.pending(), self.columns)
+            if not pending.empty:
+                self._merge(pending)
+        self._loaded_at = time.monotonic()
+        telemetry.gauge('entry_rows', len(self._frame))
+        return True
+
+    def _sync(self):
+        """Merge the rows changed since the watermark, then reconcile if due (lock held)"""
+        changes = self.delta.fetch_changes()
+        if not changes.empty:
+            self._merge(changes)
+        if self.delta.reconcile_due():
+            stale = self.delta.stale_vehicles(self._frame)
+            for vehicle_id in stale:
+                self._frame = replace_vehicle(self._frame, vehicle_id, self.delta.fetch_vehicle(vehicle_id))
+            if stale:
+                self._metrics = None
+                self._insights = None
+                self._bump_version()
+
+    def _merge(self, rows: pd.DataFrame):
+        """Fold new or changed rows into the resident frame (lock held).
+
+        Entries newer than their vehicle's latest are appended to the derived
+        metrics; edits and backdated entries leave them to be rebuilt from the
+        frame. Rows identical to the resident ones do not change the version.
+        """
+        new, edited, confirmed = split_changes(self._frame, rows)
+        if new.empty and edited.empty:
+            if not confirmed.empty:
+                # Same data, now carrying the database's updated_at
+                self._frame = merge_rows(self._frame, confirmed)
+            return
+        self._frame = merge_rows(self._frame, pd.concat([new, edited, confirmed]))
+        if not edited.empty or not self._append_metrics(new):
+            self._metrics = None
+            self._insights = None
+        self._bump_version()
+
+    def _append_metrics(self, new: pd.DataFrame) -> bool:
+        """Apply new entries, oldest first, to the derived metrics; False if they need a rebuild"""
+        if self._metrics is None:
+            return False
+        for entry in new.sort_values('ts', kind='stable').to_dict('records'):
+            if not self._metrics.append(entry):
+                return False
+            if self._insights is not None:
+                # Entries older than another vehicle's latest rebuild the insights lazily
+                if not self._insights.append(entry, self._metrics.segment_ending_at(entry)):
+                    self._insights = None
+        return True
+
+    def _ensure_metrics(self):
+        """Load the frame and build its derived metrics if needed (lock held)"""
+        self._ensure_loaded()
+        if self._metrics is None:
+            self._metrics = FleetMetrics.from_frame(self._frame)
+
+    def _ensure_insights(self):
+        """Build the rolling and seasonal insights if needed (lock held)"""
+        self._ensure_metrics()
+        if self._insights is None:
+            self._insights = FleetInsights.from_frames(self._frame, self._metrics.segments_frame())
+
+    def get_entries(self) -> pd.DataFrame:
+        """Return a copy of all entries, loading them at most once per TTL"""
+        with self._lock:
+            self._ensure_loaded()
+            # Callers add derived columns, so never hand out the shared frame
+            return self._frame.copy()
+
+    def vehicles(self) -> List[str]:
+        """Sorted ids of the vehicles that have entries"""
+        with self._lock:
+            self._ensure_loaded()
+            if self._frame.empty or 'vehicle_id' not in self._frame.columns:
+                return []
+            return sorted(self._frame['vehicle_id'].unique())
+
+    def get_derived(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Entries (ts ascending) with derived metric columns, and the segments.
+
+        Metrics are built once per load and then maintained by apply_insert;
+        both are read under the lock so a concurrent insert cannot race them.
+        """
+        _, entries, segments = self.snapshot_derived()
+        return entries, segments
+
+    def snapshot_derived(self) -> Tuple[int, pd.DataFrame, pd.DataFrame]:
+        """Like get_derived, plus the version the frames belong to"""
+        with self._lock:
+            self._ensure_metrics()
+            if self._frame.empty:
+                return self.version, self._frame.copy(), self._metrics.segments_frame().copy()
+            return self.version, self._metrics.annotate(self._frame), self._metrics.segments_frame().copy()
+
+    def snapshot_insights(self, vehicle_id: Optional[str] = None) -> Tuple[int, Dict]:
+        """Rolling-window and seasonal insights of a vehicle (None = fleet), plus their version.
+
+        Insights are built once per load and then maintained by apply_insert,
+        so this only reads cached frames; treat them as read-only.
+        """
+        with self._lock:
+            self._ensure_insights()
+            return self.version, self._insights.get(vehicle_id).snapshot()
+
+    def annotate(self, page_df: pd.DataFrame) -> pd.DataFrame:
+        """Attach derived metrics to a subset of entries, keeping newest first"""
+        with self._lock:
+            self._ensure_metrics()
+            annotated = self._metrics.annotate(page_df)
+        return annotated.sort_values(['ts', 'id'], ascending=False)
+
+    def apply_insert(self, row: Optional[Dict]):
+        """Fold a freshly inserted row into the resident data.
+
+        The row is merged into the frame without a refetch; the newest entry
+        is also appended to the derived metrics, while a backdated one has
+        them rebuilt from the frame. Without a row or a resident frame the
+        store is invalidated instead.
+        """
+        with self._lock:
+            if row is None or self._frame is None:
+                self._invalidate()
+                return
+            self._merge(typed_frame([row], self.columns))
+
+    def discard(self, ids: List[str]):
+        """Drop rows that will never reach the database, e.g. queued entries it rejected"""
+        with self._lock:
+            if self._frame is None or self._frame.empty:
+                return
+            dropped = self._frame['id'].isin(ids)
+            if not dropped.any():
+                return
+            self._frame = self._frame[~dropped].reset_index(drop=True)
+            self._metrics = None
+            self._insights = None
+            self._bump_version()
+
+    def mark_changed(self):
+        """Advance the version without reloading, e.g. after queued rows reached the database"""
+        with self._lock:
+            self._bump_version()
+
+    def resident(self) -> Tuple[int, Optional[pd.DataFrame]]:
+        """Current version and frame without loading; the frame is shared, so treat it as read-only"""
+        with self._lock:
+            return self.version, self._frame
+
+    def verify_metrics(self) -> List[str]:
+        """Check the incrementally maintained metrics against a full recompute"""
+        with self._lock:
+            if self._frame is None or self._metrics is None:
+                return []
+            return self._metrics.check_consistency(self._frame)
+
+    def _invalidate(self):
+        if self.delta is not None and self._frame is not None:
+            # Expire instead of dropping: the next read pulls only the changes
+            self._loaded_at = float('-inf')
+            for callback in self._listeners:
+                callback(self.version)
+            return
+        self._frame = None
+        self._metrics = None
+        self._insights = None
+        self._bump_version()
+
+    def invalidate(self):
+        """Drop (or, with delta sync, expire) the resident frame so the next read refetches"""
+        with self._lock:
+            self._invalidate()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and the current data version"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'syncs': self.delta.syncs if self.delta is not None else 0,
+                'restored_from': self.restored_from,
+                'hit_rate': self.hits / total if total else 0.0,
+                'rows': len(self._frame) if self._frame is not None else 0,
+                'age_s': time.monotonic() - self._loaded_at if self._frame is not None else None,
+            }
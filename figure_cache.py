@@ -0,0 +1,94 @@
+"""
+Memoized Plotly figures for Fuel Tracker
+
+Figures are keyed by (data version, chart type, parameters) and kept as the
+JSON spec the frontend receives, so a rerun with unchanged data skips the
+pandas preparation, the Plotly build and the serialization; the spec's length
+is its size against the byte budget. The number of points the figure plots
+is kept with it for the downsampling caption. Entries are evicted least-recently-used
+once that budget is exceeded.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Tuple
+
+from telemetry import count, span
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 64
+
+
+def figure_spec(figure) -> str:
+    """JSON spec of a figure, encoded the way st.plotly_chart encodes it"""
+    import plotly.utils
+    return json.dumps(figure.to_dict(), cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def plotted_points(figure) -> int:
+    """Points drawn by a figure's traces (lines added with add_hline are shapes, not traces)"""
+    total = 0
+    for trace in figure.data:
+        values = getattr(trace, 'x', None)
+        if values is None:
+            values = getattr(trace, 'y', None)
+        total += len(values) if values is not None else 0
+    return total
+
+
+class FigureCache:
+    """Thread-safe LRU of serialized figures with a memory bound"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (spec, plotted points, size)
+        self._entries: "OrderedDict[Hashable, Tuple[str, int, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Hashable, build: Callable[[], object]) -> Tuple[str, int]:
+        """Return the cached (JSON spec, plotted points) for key, building the figure on a miss"""
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                count('figure_cache_hits')
+                return cached[0], cached[1]
+            self.misses += 1
+        count('figure_cache_misses')
+
+        with span('plotly_build'):
+            figure = build()
+            spec = figure_spec(figure)
+        points = plotted_points(figure)
+        size = len(spec)
+
+        with self._lock:
+            if key not in self._entries and size <= self.max_bytes:
+                self._entries[key] = (spec, points, size)
+                self._bytes += size
+                self._evict()
+        return spec, points
+
+    def _evict(self):
+        """Drop least-recently-used figures until within budget (lock held)"""
+        while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
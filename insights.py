@@ -0,0 +1,239 @@
+"""
+Rolling-window and seasonal insights for Fuel Tracker
+
+Price per liter and full-to-full consumption are kept as ratios of sums
+(amount / liters, fuel / distance) over trailing 30/90-day windows and per
+month of year. Samples arrive in ts order, so each window is a deque that
+every sample enters and leaves once: appending an entry costs O(1) amortized
+instead of a rescan of the history.
+"""
+
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from schema import DEFAULT_VEHICLE_ID
+
+# Trailing windows, in days
+INSIGHT_WINDOWS = (30, 90)
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+               'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def window_column(days: int) -> str:
+    """Column holding a window's rolling value"""
+    return f'rolling_{days}d'
+
+
+class RollingWindow:
+    """Ratio of sums over the samples with ts in (latest - days, latest]"""
+
+    def __init__(self, days: int):
+        self.span = pd.Timedelta(days=days)
+        self._samples: deque = deque()
+        self._numerator = 0.0
+        self._denominator = 0.0
+
+    def seed(self, ts: pd.Series, numerator: np.ndarray, denominator: np.ndarray):
+        """Start from the tail of a ts-sorted history (only samples still in the window are kept)"""
+        if len(ts) == 0:
+            return
+        inside = (ts > ts.iloc[-1] - self.span).to_numpy()
+        self._samples = deque(zip(ts[inside], numerator[inside], denominator[inside]))
+        self._numerator = float(numerator[inside].sum())
+        self._denominator = float(denominator[inside].sum())
+
+    def add(self, ts: pd.Timestamp, numerator: float, denominator: float):
+        """Take in the newest sample and drop the ones it pushes out of the window"""
+        self._samples.append((ts, numerator, denominator))
+        self._numerator += numerator
+        self._denominator += denominator
+        cutoff = ts - self.span
+        while self._samples[0][0] <= cutoff:
+            _, old_numerator, old_denominator = self._samples.popleft()
+            self._numerator -= old_numerator
+            self._denominator -= old_denominator
+
+    def value(self) -> float:
+        """Current ratio (NaN while the window holds no denominator)"""
+        return self._numerator / self._denominator if self._denominator > 0 else np.nan
+
+
+class InsightSeries:
+    """Rolling-window and month-of-year ratios of one metric.
+
+    The rolling series is built vectorized on from_samples(); add() then
+    appends one point per sample, and frame() concatenates the two lazily.
+    """
+
+    def __init__(self, scale: float = 1.0, windows: Tuple[int, ...] = INSIGHT_WINDOWS):
+        self.scale = scale
+        self.windows = {days: RollingWindow(days) for days in windows}
+        self.month_numerator = np.zeros(12)
+        self.month_denominator = np.zeros(12)
+        self.month_samples = np.zeros(12, dtype=np.int64)
+        self._last_ts: Optional[pd.Timestamp] = None
+        self._base = pd.DataFrame(columns=self.columns)
+        self._tail: List[Dict] = []
+        self._frame_cache: Optional[pd.DataFrame] = None
+
+    @property
+    def columns(self) -> List[str]:
+        return ['ts'] + [window_column(days) for days in self.windows]
+
+    @classmethod
+    def from_samples(cls, ts: pd.Series, numerator: pd.Series, denominator: pd.Series,
+                     scale: float = 1.0) -> 'InsightSeries':
+        """Full build from samples sorted by ts"""
+        series = cls(scale)
+        if len(ts) == 0:
+            return series
+        ts = ts.reset_index(drop=True)
+        numerator = numerator.to_numpy(dtype='float64')
+        denominator = denominator.to_numpy(dtype='float64')
+
+        sums = pd.DataFrame({'numerator': numerator, 'denominator': denominator},
+                            index=pd.DatetimeIndex(ts))
+        base = {'ts': ts}
+        for days, window in series.windows.items():
+            rolled = sums.rolling(f'{days}D').sum()
+            ratio = rolled['numerator'] / rolled['denominator'].where(rolled['denominator'] > 0)
+            base[window_column(days)] = ratio.to_numpy() * scale
+            window.seed(ts, numerator, denominator)
+        series._base = pd.DataFrame(base, columns=series.columns)
+
+        months = ts.dt.month.to_numpy() - 1
+        series.month_numerator = np.bincount(months, weights=numerator, minlength=12)
+        series.month_denominator = np.bincount(months, weights=denominator, minlength=12)
+        series.month_samples = np.bincount(months, minlength=12)
+        series._last_ts = ts.iloc[-1]
+        return series
+
+    def add(self, ts: pd.Timestamp, numerator: float, denominator: float) -> bool:
+        """Append the newest sample in O(1) amortized; returns False if it is backdated"""
+        if self._last_ts is not None and ts < self._last_ts:
+            return False
+        point = {'ts': ts}
+        for days, window in self.windows.items():
+            window.add(ts, numerator, denominator)
+            point[window_column(days)] = window.value() * self.scale
+        self._tail.append(point)
+        self._frame_cache = None
+
+        month = ts.month - 1
+        self.month_numerator[month] += numerator
+        self.month_denominator[month] += denominator
+        self.month_samples[month] += 1
+        self._last_ts = ts
+        return True
+
+    def frame(self) -> pd.DataFrame:
+        """Rolling values at every sample, oldest first"""
+        if not self._tail:
+            return self._base
+        if self._frame_cache is None:
+            tail = pd.DataFrame(self._tail, columns=self.columns)
+            self._frame_cache = tail if self._base.empty else pd.concat([self._base, tail], ignore_index=True)
+        return self._frame_cache
+
+    def current(self) -> Dict[int, float]:
+        """Value of each window as of the latest sample"""
+        return {days: window.value() * self.scale for days, window in self.windows.items()}
+
+    def seasonality(self) -> pd.DataFrame:
+        """Ratio per month of year over the whole history"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            value = np.where(self.month_denominator > 0,
+                             self.month_numerator / self.month_denominator * self.scale, np.nan)
+        return pd.DataFrame({'month': MONTH_NAMES, 'value': value, 'samples': self.month_samples})
+
+
+class FuelInsights:
+    """Price (amount / liters) and consumption (fuel / distance) insights for one vehicle or a fleet"""
+
+    def __init__(self):
+        self.price = InsightSeries()
+        self.consumption = InsightSeries(scale=100.0)
+
+    @classmethod
+    def from_frames(cls, entries: pd.DataFrame, segments: pd.DataFrame) -> 'FuelInsights':
+        """Full build from entries and full-to-full segments (any order)"""
+        insights = cls()
+        if not entries.empty:
+            entries = entries.sort_values('ts', kind='stable')
+            insights.price = InsightSeries.from_samples(entries['ts'], entries['amount_pln'], entries['liters'])
+        if not segments.empty:
+            segments = segments.sort_values('end_date', kind='stable')
+            insights.consumption = InsightSeries.from_samples(
+                segments['end_date'], segments['fuel_used_l'], segments['distance_km'], scale=100.0
+            )
+        return insights
+
+    def accepts(self, entry: Dict) -> bool:
+        """Check if an entry is no older than anything already seen"""
+        last = self.price._last_ts
+        return last is None or not entry['ts'] < last
+
+    def append(self, entry: Dict, segment: Optional[Dict] = None):
+        """Fold in the newest entry and the segment it closed, if any"""
+        self.price.add(entry['ts'], float(entry['amount_pln']), float(entry['liters']))
+        if segment is not None:
+            self.consumption.add(segment['end_date'], float(segment['fuel_used_l']),
+                                 float(segment['distance_km']))
+
+    def snapshot(self) -> Dict:
+        """Frames and current values for display (treat as read-only)"""
+        return {
+            'price': self.price.frame(),
+            'consumption': self.consumption.frame(),
+            'price_current': self.price.current(),
+            'consumption_current': self.consumption.current(),
+            'price_seasonality': self.price.seasonality(),
+            'consumption_seasonality': self.consumption.seasonality(),
+        }
+
+
+class FleetInsights:
+    """FuelInsights for the whole fleet and for each vehicle, kept in step on append"""
+
+    def __init__(self):
+        self.fleet = FuelInsights()
+        self.vehicles: Dict[str, FuelInsights] = {}
+
+    @classmethod
+    def from_frames(cls, entries: pd.DataFrame, segments: pd.DataFrame) -> 'FleetInsights':
+        """Full build from all entries and segments"""
+        insights = cls()
+        insights.fleet = FuelInsights.from_frames(entries, segments)
+        if entries.empty or 'vehicle_id' not in entries.columns:
+            # Never alias the fleet: a later vehicle's entries must not reach this one
+            insights.vehicles[DEFAULT_VEHICLE_ID] = FuelInsights.from_frames(entries, segments)
+            return insights
+
+        segment_groups = dict(tuple(segments.groupby('vehicle_id', sort=False))) if not segments.empty else {}
+        for vehicle_id, group in entries.groupby('vehicle_id', sort=False):
+            insights.vehicles[vehicle_id] = FuelInsights.from_frames(
+                group, segment_groups.get(vehicle_id, segments.iloc[:0])
+            )
+        return insights
+
+    def append(self, entry: Dict, segment: Optional[Dict] = None) -> bool:
+        """Apply a new entry; returns False if it is older than the fleet's latest entry"""
+        if not self.fleet.accepts(entry):
+            return False
+        vehicle_id = entry.get('vehicle_id') or DEFAULT_VEHICLE_ID
+        self.fleet.append(entry, segment)
+        vehicle = self.vehicles.get(vehicle_id)
+        if vehicle is None:
+            vehicle = self.vehicles[vehicle_id] = FuelInsights()
+        vehicle.append(entry, segment)
+        return True
+
+    def get(self, vehicle_id: Optional[str] = None) -> FuelInsights:
+        """Insights of one vehicle, or of the whole fleet for None"""
+        if vehicle_id is None:
+            return self.fleet
+        return self.vehicles.get(vehicle_id, FuelInsights())
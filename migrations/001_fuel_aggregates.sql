@@ -0,0 +1,87 @@
+-- Server-side aggregation for Fuel Tracker (Postgres / Supabase)
+-- Run in the Supabase SQL Editor after the fuel_entry table exists.
+-- Entries are ordered by (ts, id) so ties resolve deterministically.
+
+-- Price per liter per entry: two columns instead of the full row
+CREATE OR REPLACE VIEW price_per_liter_series AS
+SELECT id, ts, amount_pln / NULLIF(liters, 0) AS price_per_liter
+FROM fuel_entry;
+
+-- Full-to-full segments: (F0, F1] groups every entry after a full tank up to
+-- and including the next one, numbered by the count of earlier full tanks
+CREATE OR REPLACE VIEW consumption_segments AS
+WITH ordered AS (
+    SELECT id, ts, liters, amount_pln, odometer_km, is_full_tank,
+           COALESCE(SUM(CASE WHEN is_full_tank THEN 1 ELSE 0 END) OVER (
+               ORDER BY ts, id ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+           ), 0) AS segment_no
+    FROM fuel_entry
+),
+totals AS (
+    SELECT segment_no, SUM(liters) AS fuel_used_l, SUM(amount_pln) AS cost_total_pln
+    FROM ordered
+    GROUP BY segment_no
+),
+full_tanks AS (
+    SELECT id, ts, odometer_km, segment_no,
+           LAG(ts) OVER (ORDER BY ts, id) AS start_date,
+           LAG(odometer_km) OVER (ORDER BY ts, id) AS start_odometer
+    FROM ordered
+    WHERE is_full_tank
+)
+SELECT f.start_date,
+       f.ts AS end_date,
+       f.odometer_km - f.start_odometer AS distance_km,
+       t.fuel_used_l,
+       t.cost_total_pln,
+       t.fuel_used_l * 100.0 / (f.odometer_km - f.start_odometer) AS consumption_l_per_100km,
+       t.cost_total_pln * 100.0 / (f.odometer_km - f.start_odometer) AS cost_per_100km,
+       f.id AS end_entry_id
+FROM full_tanks f
+JOIN totals t ON t.segment_no = f.segment_no
+WHERE f.start_odometer IS NOT NULL AND f.odometer_km > f.start_odometer;
+
+-- Range accuracy: predicted range vs distance to the next entry, clipped to 0-100
+CREATE OR REPLACE VIEW range_accuracy_series AS
+WITH paired AS (
+    SELECT id, ts, range_after_km,
+           LEAD(odometer_km) OVER (ORDER BY ts, id) - odometer_km AS actual_distance
+    FROM fuel_entry
+),
+scored AS (
+    SELECT id, ts,
+           100 - ABS(range_after_km - actual_distance) * 100.0 / NULLIF(range_after_km, 0) AS raw_accuracy
+    FROM paired
+    WHERE range_after_km > 0 AND actual_distance IS NOT NULL
+)
+SELECT id, ts,
+       CASE WHEN raw_accuracy < 0 THEN 0 WHEN raw_accuracy > 100 THEN 100 ELSE raw_accuracy END AS range_accuracy
+FROM scored;
+
+-- Summary totals for the Entries tab, with the same filters as the UI
+CREATE OR REPLACE FUNCTION fuel_summary(
+    p_start TIMESTAMPTZ DEFAULT NULL,
+    p_end TIMESTAMPTZ DEFAULT NULL,
+    p_full_only BOOLEAN DEFAULT FALSE
+)
+RETURNS TABLE (
+    entry_count BIGINT,
+    total_fuel_l NUMERIC,
+    total_cost_pln NUMERIC,
+    avg_price_per_liter NUMERIC,
+    avg_consumption_l_per_100km NUMERIC
+)
+LANGUAGE sql STABLE AS $$
+    SELECT COUNT(*),
+           SUM(e.liters),
+           SUM(e.amount_pln),
+           AVG(e.amount_pln / NULLIF(e.liters, 0)),
+           (SELECT AVG(s.consumption_l_per_100km)
+              FROM consumption_segments s
+             WHERE (p_start IS NULL OR s.end_date >= p_start)
+               AND (p_end IS NULL OR s.end_date < p_end))
+    FROM fuel_entry e
+    WHERE (p_start IS NULL OR e.ts >= p_start)
+      AND (p_end IS NULL OR e.ts < p_end)
+      AND (NOT p_full_only OR e.is_full_tank);
+$$;
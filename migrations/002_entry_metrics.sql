@@ -0,0 +1,24 @@
+-- Per-entry derived metrics for the paginated Entries tab (Postgres / Supabase)
+-- Requires 001_fuel_aggregates.sql. Filters and keyset pagination are applied
+-- on top of this view, after the window functions, so neighbours are never
+-- hidden by a filter.
+
+CREATE OR REPLACE VIEW entry_metrics AS
+WITH paired AS (
+    SELECT id, ts, liters, amount_pln, range_before_km, range_after_km, odometer_km, is_full_tank,
+           odometer_km - LAG(odometer_km) OVER (ORDER BY ts, id) AS distance_from_prev
+    FROM fuel_entry
+)
+SELECT p.id, p.ts, p.liters, p.amount_pln, p.range_before_km, p.range_after_km,
+       p.odometer_km, p.is_full_tank,
+       p.amount_pln / NULLIF(p.liters, 0) AS price_per_liter,
+       p.distance_from_prev,
+       a.range_accuracy,
+       s.consumption_l_per_100km,
+       s.cost_per_100km
+FROM paired p
+LEFT JOIN range_accuracy_series a ON a.id = p.id
+LEFT JOIN consumption_segments s ON s.end_entry_id = p.id;
+
+-- Keyset pagination walks (ts, id) newest first
+CREATE INDEX IF NOT EXISTS idx_fuel_entry_ts_id ON fuel_entry (ts DESC, id DESC);
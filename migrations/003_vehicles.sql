@@ -0,0 +1,115 @@
+-- Multi-vehicle support for Fuel Tracker (Postgres / Supabase)
+-- Requires 001_fuel_aggregates.sql and 002_entry_metrics.sql. Existing entries
+-- belong to the 'default' vehicle; every window is partitioned by vehicle_id,
+-- so one scan serves the whole fleet. Views gain vehicle_id as their last column.
+
+ALTER TABLE fuel_entry ADD COLUMN IF NOT EXISTS vehicle_id TEXT NOT NULL DEFAULT 'default';
+
+-- Per-vehicle pagination, odometer checks and partitioned windows
+CREATE INDEX IF NOT EXISTS idx_fuel_entry_vehicle_ts ON fuel_entry (vehicle_id, ts, id);
+CREATE INDEX IF NOT EXISTS idx_fuel_entry_vehicle_odometer ON fuel_entry (vehicle_id, odometer_km);
+
+CREATE OR REPLACE VIEW price_per_liter_series AS
+SELECT id, ts, amount_pln / NULLIF(liters, 0) AS price_per_liter, vehicle_id
+FROM fuel_entry;
+
+CREATE OR REPLACE VIEW consumption_segments AS
+WITH ordered AS (
+    SELECT id, vehicle_id, ts, liters, amount_pln, odometer_km, is_full_tank,
+           COALESCE(SUM(CASE WHEN is_full_tank THEN 1 ELSE 0 END) OVER (
+               PARTITION BY vehicle_id ORDER BY ts, id ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+           ), 0) AS segment_no
+    FROM fuel_entry
+),
+totals AS (
+    SELECT vehicle_id, segment_no, SUM(liters) AS fuel_used_l, SUM(amount_pln) AS cost_total_pln
+    FROM ordered
+    GROUP BY vehicle_id, segment_no
+),
+full_tanks AS (
+    SELECT id, vehicle_id, ts, odometer_km, segment_no,
+           LAG(ts) OVER (PARTITION BY vehicle_id ORDER BY ts, id) AS start_date,
+           LAG(odometer_km) OVER (PARTITION BY vehicle_id ORDER BY ts, id) AS start_odometer
+    FROM ordered
+    WHERE is_full_tank
+)
+SELECT f.start_date,
+       f.ts AS end_date,
+       f.odometer_km - f.start_odometer AS distance_km,
+       t.fuel_used_l,
+       t.cost_total_pln,
+       t.fuel_used_l * 100.0 / (f.odometer_km - f.start_odometer) AS consumption_l_per_100km,
+       t.cost_total_pln * 100.0 / (f.odometer_km - f.start_odometer) AS cost_per_100km,
+       f.id AS end_entry_id,
+       f.vehicle_id
+FROM full_tanks f
+JOIN totals t ON t.vehicle_id = f.vehicle_id AND t.segment_no = f.segment_no
+WHERE f.start_odometer IS NOT NULL AND f.odometer_km > f.start_odometer;
+
+CREATE OR REPLACE VIEW range_accuracy_series AS
+WITH paired AS (
+    SELECT id, vehicle_id, ts, range_after_km,
+           LEAD(odometer_km) OVER (PARTITION BY vehicle_id ORDER BY ts, id) - odometer_km AS actual_distance
+    FROM fuel_entry
+),
+scored AS (
+    SELECT id, vehicle_id, ts,
+           100 - ABS(range_after_km - actual_distance) * 100.0 / NULLIF(range_after_km, 0) AS raw_accuracy
+    FROM paired
+    WHERE range_after_km > 0 AND actual_distance IS NOT NULL
+)
+SELECT id, ts,
+       CASE WHEN raw_accuracy < 0 THEN 0 WHEN raw_accuracy > 100 THEN 100 ELSE raw_accuracy END AS range_accuracy,
+       vehicle_id
+FROM scored;
+
+CREATE OR REPLACE VIEW entry_metrics AS
+WITH paired AS (
+    SELECT id, vehicle_id, ts, liters, amount_pln, range_before_km, range_after_km, odometer_km, is_full_tank,
+           odometer_km - LAG(odometer_km) OVER (PARTITION BY vehicle_id ORDER BY ts, id) AS distance_from_prev
+    FROM fuel_entry
+)
+SELECT p.id, p.ts, p.liters, p.amount_pln, p.range_before_km, p.range_after_km,
+       p.odometer_km, p.is_full_tank,
+       p.amount_pln / NULLIF(p.liters, 0) AS price_per_liter,
+       p.distance_from_prev,
+       a.range_accuracy,
+       s.consumption_l_per_100km,
+       s.cost_per_100km,
+       p.vehicle_id
+FROM paired p
+LEFT JOIN range_accuracy_series a ON a.id = p.id
+LEFT JOIN consumption_segments s ON s.end_entry_id = p.id;
+
+-- fuel_summary gains an optional vehicle filter (NULL = whole fleet)
+DROP FUNCTION IF EXISTS fuel_summary(TIMESTAMPTZ, TIMESTAMPTZ, BOOLEAN);
+
+CREATE OR REPLACE FUNCTION fuel_summary(
+    p_start TIMESTAMPTZ DEFAULT NULL,
+    p_end TIMESTAMPTZ DEFAULT NULL,
+    p_full_only BOOLEAN DEFAULT FALSE,
+    p_vehicle_id TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+    entry_count BIGINT,
+    total_fuel_l NUMERIC,
+    total_cost_pln NUMERIC,
+    avg_price_per_liter NUMERIC,
+    avg_consumption_l_per_100km NUMERIC
+)
+LANGUAGE sql STABLE AS $$
+    SELECT COUNT(*),
+           SUM(e.liters),
+           SUM(e.amount_pln),
+           AVG(e.amount_pln / NULLIF(e.liters, 0)),
+           (SELECT AVG(s.consumption_l_per_100km)
+              FROM consumption_segments s
+             WHERE (p_start IS NULL OR s.end_date >= p_start)
+               AND (p_end IS NULL OR s.end_date < p_end)
+               AND (p_vehicle_id IS NULL OR s.vehicle_id = p_vehicle_id))
+    FROM fuel_entry e
+    WHERE (p_start IS NULL OR e.ts >= p_start)
+      AND (p_end IS NULL OR e.ts < p_end)
+      AND (NOT p_full_only OR e.is_full_tank)
+      AND (p_vehicle_id IS NULL OR e.vehicle_id = p_vehicle_id);
+$$;
@@ -0,0 +1,90 @@
+-- Derived metrics stored on fuel_entry (Postgres / Supabase)
+-- Requires 003_vehicles.sql. The columns are written when entries are written,
+-- so reads are plain column fetches instead of window views. Enable with
+-- STORED_METRICS = true once backfill.py has filled existing rows.
+
+ALTER TABLE fuel_entry ADD COLUMN IF NOT EXISTS price_per_liter NUMERIC;
+ALTER TABLE fuel_entry ADD COLUMN IF NOT EXISTS distance_from_prev NUMERIC;
+ALTER TABLE fuel_entry ADD COLUMN IF NOT EXISTS range_accuracy NUMERIC;
+ALTER TABLE fuel_entry ADD COLUMN IF NOT EXISTS consumption_l_per_100km NUMERIC;
+ALTER TABLE fuel_entry ADD COLUMN IF NOT EXISTS cost_per_100km NUMERIC;
+
+-- Recompute the stored metrics of one vehicle (NULL = all) from p_since on.
+-- Entries written at or after p_since can only change their own metrics, those
+-- of later entries and the range accuracy of the vehicle's entry just before
+-- (the cutoff), so only rows from the cutoff on are rewritten. The windows run
+-- over just enough history for those rows: back to the entry before the cutoff
+-- and to the full tank that opens the cutoff's segment. Same rules as the
+-- entry_metrics view; without p_since every row of the vehicle is recomputed.
+CREATE OR REPLACE FUNCTION refresh_entry_metrics(
+    p_vehicle_id TEXT DEFAULT NULL,
+    p_since TIMESTAMPTZ DEFAULT NULL
+)
+RETURNS VOID
+LANGUAGE sql AS $$
+    WITH vehicles AS (
+        SELECT p_vehicle_id AS vehicle_id WHERE p_vehicle_id IS NOT NULL
+        UNION
+        SELECT DISTINCT vehicle_id FROM fuel_entry WHERE p_vehicle_id IS NULL
+    ),
+    cutoffs AS (
+        SELECT v.vehicle_id,
+               COALESCE((SELECT MAX(e.ts) FROM fuel_entry AS e
+                          WHERE e.vehicle_id = v.vehicle_id AND e.ts < p_since), p_since) AS cutoff
+        FROM vehicles AS v
+    ),
+    bounds AS (
+        SELECT c.vehicle_id, c.cutoff,
+               (SELECT MAX(e.ts) FROM fuel_entry AS e
+                 WHERE e.vehicle_id = c.vehicle_id AND e.ts < c.cutoff) AS prev_ts,
+               (SELECT MAX(e.ts) FROM fuel_entry AS e
+                 WHERE e.vehicle_id = c.vehicle_id AND e.ts < c.cutoff AND e.is_full_tank) AS full_ts
+        FROM cutoffs AS c
+    ),
+    scope AS (
+        SELECT e.id, e.vehicle_id, e.ts, e.liters, e.amount_pln, e.range_after_km, e.odometer_km,
+               e.is_full_tank, b.cutoff
+        FROM bounds AS b
+        JOIN fuel_entry AS e ON e.vehicle_id = b.vehicle_id
+        -- A plain range on (vehicle_id, ts), so only the scoped rows are read
+        WHERE e.ts >= COALESCE(
+            CASE WHEN b.full_ts < b.prev_ts THEN b.full_ts ELSE b.prev_ts END,
+            (SELECT MIN(h.ts) FROM fuel_entry AS h WHERE h.vehicle_id = b.vehicle_id)
+        )
+    ),
+    paired AS (
+        SELECT id, vehicle_id, ts, liters, amount_pln, range_after_km, odometer_km, is_full_tank, cutoff,
+               odometer_km - LAG(odometer_km) OVER w AS distance_from_prev,
+               LEAD(odometer_km) OVER w - odometer_km AS actual_distance,
+               COALESCE(SUM(CASE WHEN is_full_tank THEN 1 ELSE 0 END) OVER earlier, 0) AS segment_no,
+               -- Odometers only grow, so the highest earlier full tank is the last one
+               MAX(CASE WHEN is_full_tank THEN odometer_km END) OVER earlier AS segment_start_km
+        FROM scope
+        WINDOW w AS (PARTITION BY vehicle_id ORDER BY ts, id),
+               earlier AS (w ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING)
+    ),
+    -- A segment ends with its only full tank; window sums keep this join-free
+    scored AS (
+        SELECT id, ts, cutoff, distance_from_prev,
+               amount_pln / NULLIF(liters, 0) AS price_per_liter,
+               CASE WHEN range_after_km > 0 AND actual_distance IS NOT NULL
+                    THEN 100 - ABS(range_after_km - actual_distance) * 100.0 / range_after_km
+               END AS raw_accuracy,
+               CASE WHEN is_full_tank THEN odometer_km - segment_start_km END AS distance_km,
+               SUM(liters) OVER segment AS fuel_used_l,
+               SUM(amount_pln) OVER segment AS cost_total_pln
+        FROM paired
+        WINDOW segment AS (PARTITION BY vehicle_id, segment_no)
+    )
+    UPDATE fuel_entry AS f
+       SET price_per_liter = m.price_per_liter,
+           distance_from_prev = m.distance_from_prev,
+           range_accuracy = CASE WHEN m.raw_accuracy < 0 THEN 0
+                                 WHEN m.raw_accuracy > 100 THEN 100
+                                 ELSE m.raw_accuracy END,
+           consumption_l_per_100km = CASE WHEN m.distance_km > 0 THEN m.fuel_used_l * 100.0 / m.distance_km END,
+           cost_per_100km = CASE WHEN m.distance_km > 0 THEN m.cost_total_pln * 100.0 / m.distance_km END
+      FROM scored AS m
+     WHERE m.id = f.id
+       AND (m.cutoff IS NULL OR m.ts >= m.cutoff);
+$$;
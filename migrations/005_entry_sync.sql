@@ -0,0 +1,45 @@
+-- Incremental sync support for Fuel Tracker (Postgres / Supabase)
+-- Requires 003_vehicles.sql. updated_at is set on insert and bumped whenever an
+-- entry's own columns change (not when only its stored metrics are refreshed),
+-- so clients can fetch just the rows changed since their high-water mark.
+-- Enable with DELTA_SYNC = true.
+
+ALTER TABLE fuel_entry ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+-- Keyset scan of changes in (updated_at, id) order
+CREATE INDEX IF NOT EXISTS idx_fuel_entry_updated ON fuel_entry (updated_at, id);
+
+CREATE OR REPLACE FUNCTION touch_fuel_entry()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS fuel_entry_touch ON fuel_entry;
+CREATE TRIGGER fuel_entry_touch
+BEFORE UPDATE ON fuel_entry
+FOR EACH ROW
+WHEN ((OLD.vehicle_id, OLD.ts, OLD.liters, OLD.amount_pln, OLD.range_before_km, OLD.range_after_km,
+       OLD.odometer_km, OLD.is_full_tank)
+      IS DISTINCT FROM
+      (NEW.vehicle_id, NEW.ts, NEW.liters, NEW.amount_pln, NEW.range_before_km, NEW.range_after_km,
+       NEW.odometer_km, NEW.is_full_tank))
+EXECUTE FUNCTION touch_fuel_entry();
+
+-- Per-vehicle row count and odometer sum. Deletes never show up in a
+-- watermark query, so clients compare these with their resident rows.
+CREATE OR REPLACE FUNCTION entry_checksums()
+RETURNS TABLE (
+    vehicle_id TEXT,
+    entry_count BIGINT,
+    odometer_total BIGINT
+)
+LANGUAGE sql STABLE AS $$
+    SELECT vehicle_id, COUNT(*) AS entry_count, SUM(odometer_km) AS odometer_total
+    FROM fuel_entry
+    GROUP BY vehicle_id
+    ORDER BY vehicle_id;
+$$;
@@ -0,0 +1,7 @@
+-- Vehicle list for Fuel Tracker (Postgres / Supabase)
+-- Requires 003_vehicles.sql. The sidebar vehicle selector reads the distinct
+-- vehicle ids from this view (an index-only scan of the vehicle indexes)
+-- instead of downloading every entry.
+
+CREATE OR REPLACE VIEW vehicles AS
+SELECT DISTINCT vehicle_id FROM fuel_entry;
@@ -0,0 +1,26 @@
+-- Local SQLite mirror of the fuel_entry table, used by the offline stand-ins.
+-- ts is stored as ISO-8601 text so lexical order matches time order.
+
+CREATE TABLE IF NOT EXISTS fuel_entry (
+    id TEXT PRIMARY KEY,
+    vehicle_id TEXT NOT NULL DEFAULT 'default',
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    -- Fixed-width UTC text, so lexical order matches time order
+    updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    ts TEXT NOT NULL,
+    liters REAL NOT NULL CHECK (liters > 0),
+    amount_pln REAL NOT NULL CHECK (amount_pln > 0),
+    range_before_km INTEGER NOT NULL CHECK (range_before_km >= 0),
+    range_after_km INTEGER NOT NULL CHECK (range_after_km >= range_before_km),
+    odometer_km INTEGER NOT NULL CHECK (odometer_km > 0),
+    is_full_tank BOOLEAN DEFAULT TRUE,
+    -- Derived metrics written with the entry (see migrations/004_stored_entry_metrics.sql)
+    price_per_liter REAL,
+    distance_from_prev REAL,
+    range_accuracy REAL,
+    consumption_l_per_100km REAL,
+    cost_per_100km REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_fuel_entry_ts ON fuel_entry (ts);
+CREATE INDEX IF NOT EXISTS idx_fuel_entry_odometer ON fuel_entry (odometer_km);
@@ -0,0 +1,10 @@
+-- updated_at bump for the local SQLite mirror (see migrations/005_entry_sync.sql).
+-- Runs after any columns missing from older databases have been added.
+
+CREATE TRIGGER IF NOT EXISTS fuel_entry_touch
+AFTER UPDATE OF vehicle_id, ts, liters, amount_pln, range_before_km, range_after_km, odometer_km, is_full_tank
+ON fuel_entry
+FOR EACH ROW
+BEGIN
+    UPDATE fuel_entry SET updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now') WHERE id = NEW.id;
+END;
@@ -0,0 +1,96 @@
+"""
+Background precompute worker for Fuel Tracker
+
+Rebuilds the analytics inputs off the request path whenever the entry store
+changes and publishes them as immutable snapshots; tab renders only read the
+latest snapshot.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+
+class Snapshot:
+    """Precomputed analytics data for one entry store version (treat as read-only)"""
+
+    __slots__ = ('version', 'data', 'built_at', 'build_seconds')
+
+    def __init__(self, version: int, data: Dict, build_seconds: float):
+        self.version = version
+        self.data = data
+        self.built_at = time.time()
+        self.build_seconds = build_seconds
+
+
+class PrecomputeWorker:
+    """Single background thread that keeps the latest Snapshot warm.
+
+    build() returns (version, data) read atomically from the store;
+    needs_refresh(version) tells whether the published version is outdated.
+    The worker sleeps until notify(); a snapshot older than max_age is
+    rebuilt when it is next read, so an idle process does no work.
+    """
+
+    def __init__(self, build: Callable[[], Tuple[int, Dict]],
+                 needs_refresh: Callable[[int], bool], max_age: Optional[float] = None):
+        self.build = build
+        self.needs_refresh = needs_refresh
+        self.max_age = max_age
+        self.last_error: Optional[str] = None
+        self._snapshot: Optional[Snapshot] = None
+        self._expired = False
+        self._published = threading.Condition()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def notify(self, *_):
+        """Signal that the underlying data changed (safe to call from any thread)"""
+        self._wake.set()
+
+    def latest(self, min_version: int = 0, timeout: float = 0.0) -> Optional[Snapshot]:
+        """Latest snapshot, waiting up to timeout for one at least min_version"""
+        deadline = time.monotonic() + timeout
+        with self._published:
+            while self._snapshot is None or self._snapshot.version < min_version:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._published.wait(remaining)
+            snapshot = self._snapshot
+        if (snapshot is not None and self.max_age is not None
+                and time.time() - snapshot.built_at > self.max_age):
+            # Served as is; the worker rebuilds it in the background
+            self._expired = True
+            self._wake.set()
+        return snapshot
+
+    def _refresh(self):
+        current = self._snapshot
+        if current is not None and not self._expired and not self.needs_refresh(current.version):
+            return
+        started = time.perf_counter()
+        try:
+            version, data = self.build()
+        except Exception as e:
+            self.last_error = str(e)
+            return
+        self.last_error = None
+        snapshot = Snapshot(version, data, time.perf_counter() - started)
+        with self._published:
+            self._snapshot = snapshot
+            # Reads during the build saw the old snapshot; this one answers them
+            self._expired = False
+            self._published.notify_all()
+
+    def _run(self):
+        while True:
+            self._refresh()
+            self._wake.wait()
+            self._wake.clear()
+
+    def start(self):
+        """Start the worker thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="fuel-precompute", daemon=True)
+            self._thread.start()
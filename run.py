@@ -1,29 +1,114 @@
 """
 Simple runner script to start the Fuel Tracker app
+
+Usage:
+    python run.py                                   # check setup and start the app
+    python run.py --importtime [--runs 5] [--json importtime.json]
 """
 
+import argparse
+import ast
+import json
+import re
+import statistics
 import subprocess
 import sys
 import os
-import streamlit as st
+from importlib import metadata
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+APP_DIR = Path(__file__).resolve().parent
 
 def check_requirements():
-    """Check if required packages are installed"""
-    try:
-        import streamlit
-        import supabase
-        import plotly
-        import pandas
-        print("✅ All required packages are installed")
-        return True
-    except ImportError as e:
-        print(f"❌ Missing package: {e}")
+    """Check if required packages are installed, from metadata (nothing is imported)"""
+    missing = []
+    for line in (APP_DIR / "requirements.txt").read_text().splitlines():
+        requirement = line.split('#')[0].strip()
+        if not requirement:
+            continue
+        name, _, pinned = requirement.partition('==')
+        try:
+            installed = metadata.version(name.strip())
+        except metadata.PackageNotFoundError:
+            missing.append(name.strip())
+            continue
+        if pinned and installed != pinned.strip():
+            print(f"⚠️ {name.strip()} {installed} installed, {pinned.strip()} pinned")
+    
+    if missing:
+        print(f"❌ Missing packages: {', '.join(missing)}")
         print("Please run: pip install -r requirements.txt")
         return False
+    print("✅ All required packages are installed")
+    return True
+
+def app_imports(path: Path = APP_DIR / "app.py") -> Tuple[List[str], List[str]]:
+    """Modules app.py imports at startup, and those it defers into functions"""
+    tree = ast.parse(path.read_text())
+    
+    def names(nodes) -> List[str]:
+        found = []
+        for node in nodes:
+            if isinstance(node, ast.Import):
+                found.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+                found.append(node.module)
+        return list(dict.fromkeys(found))
+    
+    # Imports under "if TYPE_CHECKING:" never run
+    startup = names(node for node in tree.body if not isinstance(node, ast.If))
+    deferred = names(node for func in ast.walk(tree)
+                     if isinstance(func, ast.FunctionDef) for node in ast.walk(func))
+    return startup, [name for name in deferred if name not in startup]
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def measure_imports(modules: List[str]) -> Dict[str, int]:
+    """Incremental import time (µs) of each module, in order, in a fresh interpreter"""
+    code = "; ".join(f"import {name}" for name in modules)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=APP_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    
+    # Each requested module's top-level line carries everything it pulled in
+    # that an earlier module had not already loaded
+    timings = {}
+    for match in IMPORTTIME_LINE.finditer(result.stderr):
+        _, cumulative, indent, name = match.groups()
+        if indent == " " and name in modules and name not in timings:
+            timings[name] = int(cumulative)
+    return {name: timings.get(name, 0) for name in modules}
+
+def import_time_report(runs: int = 5, json_path: Optional[str] = None):
+    """Median import-time breakdown of the app's startup and deferred modules"""
+    startup, deferred = app_imports()
+    modules = startup + deferred
+    samples = [measure_imports(modules) for _ in range(runs)]
+    medians = {name: statistics.median(sample[name] for sample in samples) for name in modules}
+    
+    for title, group in (("Startup", startup), ("Deferred (first use)", deferred)):
+        print(f"\n{title}: {sum(medians[name] for name in group) / 1000:.1f} ms")
+        for name in sorted(group, key=medians.get, reverse=True):
+            print(f"  {medians[name] / 1000:8.1f} ms  {name}")
+    
+    if json_path:
+        report = {
+            'python': sys.version.split()[0],
+            'runs': runs,
+            'startup_ms': sum(medians[name] for name in startup) / 1000,
+            'deferred_ms': sum(medians[name] for name in deferred) / 1000,
+            'modules': [{'module': name, 'deferred': name in deferred, 'ms': medians[name] / 1000}
+                        for name in modules],
+        }
+        Path(json_path).write_text(json.dumps(report, indent=2))
+        print(f"\n📝 Report written to {json_path}")
 
 def check_environment():
     """Check if Streamlit secrets are configured"""
+    import streamlit as st
+    
     try:
         # Check if secrets.toml exists
         secrets_file = Path(".streamlit/secrets.toml")
@@ -72,4 +157,14 @@ def run_app():
         print("\n👋 Fuel Tracker stopped")
 
 if __name__ == "__main__":
-    run_app()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Start Fuel Tracker")
+    parser.add_argument('--importtime', action='store_true',
+                        help="Report module import times instead of starting the app")
+    parser.add_argument('--runs', type=int, default=5, help="Interpreter runs to take the median of")
+    parser.add_argument('--json', help="Also write the import-time report to this file")
+    args = parser.parse_args()
+    
+    if args.importtime:
+        import_time_report(args.runs, args.json)
+    else:
+        run_app()
\ No newline at end of file
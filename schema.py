@@ -0,0 +1,79 @@
+"""
+Typed fuel_entry schema for Fuel Tracker
+
+Each view declares the columns it reads; fetches project only those columns
+and frames are built with compact dtypes instead of pandas inference.
+"""
+
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# Vehicle of entries recorded before multi-vehicle support
+DEFAULT_VEHICLE_ID = 'default'
+
+# Compact dtypes for the raw fuel_entry columns
+ENTRY_DTYPES = {
+    'id': 'object',
+    'vehicle_id': 'object',
+    'created_at': 'datetime64[ns, UTC]',
+    'ts': 'datetime64[ns, UTC]',
+    'liters': 'float32',
+    'amount_pln': 'float32',
+    'range_before_km': 'int32',
+    'range_after_km': 'int32',
+    'odometer_km': 'int32',
+    'is_full_tank': 'bool',
+    # Change watermark for incremental sync (migrations/005_entry_sync.sql)
+    'updated_at': 'datetime64[ns, UTC]',
+}
+
+# Derived columns served by the entry_metrics view
+ENTRY_METRIC_COLUMNS = [
+    'price_per_liter', 'distance_from_prev', 'range_accuracy',
+    'consumption_l_per_100km', 'cost_per_100km'
+]
+
+# Columns each view reads from fuel_entry
+VIEW_COLUMNS = {
+    'quick_add': ['id', 'vehicle_id', 'ts', 'odometer_km'],
+    'entries': ['id', 'vehicle_id', 'ts', 'liters', 'amount_pln', 'range_before_km', 'range_after_km',
+                'odometer_km', 'is_full_tank'],
+    'analytics': ['id', 'vehicle_id', 'ts', 'liters', 'amount_pln', 'range_after_km', 'odometer_km',
+                  'is_full_tank'],
+}
+
+
+def columns_for(*views: str) -> List[str]:
+    """Union of the columns needed by the given views, in schema order"""
+    needed = {col for view in views for col in VIEW_COLUMNS[view]}
+    return [col for col in ENTRY_DTYPES if col in needed]
+
+
+def select_clause(columns: List[str]) -> str:
+    """PostgREST select list for a projection"""
+    return ','.join(columns)
+
+
+def typed_frame(records: List[Dict], columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Build an entries DataFrame with compact dtypes.
+
+    Only the requested columns are kept; derived metric columns become float64
+    with NaN for missing values rather than object columns of None.
+    """
+    if not records:
+        return pd.DataFrame()
+    df = pd.DataFrame.from_records(records, columns=columns)
+    for col in df.columns:
+        dtype = ENTRY_DTYPES.get(col)
+        if col == 'vehicle_id':
+            # Rows written before vehicles existed (e.g. still queued) belong to the default one
+            df[col] = df[col].fillna(DEFAULT_VEHICLE_ID)
+        elif dtype is not None and dtype.startswith('datetime64'):
+            # PostgREST drops trailing zero fractions, so one result mixes precisions
+            df[col] = pd.to_datetime(df[col], utc=True, format='ISO8601')
+        elif dtype is not None and dtype != 'object':
+            df[col] = df[col].astype(dtype)
+        elif col in ENTRY_METRIC_COLUMNS:
+            df[col] = pd.to_numeric(df[col]).astype('float64')
+    return df
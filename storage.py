@@ -0,0 +1,327 @@
+"""
+Storage backends for Fuel Tracker
+
+FuelDatabase reads and writes through a FuelStorage: SupabaseStorage talks to
+the hosted database over HTTP, SQLiteStorage keeps everything in an embedded
+SQLite file for local single-user (and offline) deployments. Both return rows
+in the JSON shape Supabase uses, so the rest of the app is backend-agnostic.
+
+Backends with stored_metrics keep the derived metric columns on fuel_entry
+up to date on every write (refresh_entry_metrics), so reads with metrics are
+plain column fetches. Backends with delta_sync stamp rows with updated_at and
+serve the changes since a watermark plus per-vehicle checksums.
+"""
+
+import os
+import sqlite3
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+
+from aggregates import Aggregates, SQLiteAggregates, SupabaseAggregates, earliest_by_vehicle
+from schema import select_clause
+from telemetry import count, span, track_response_bytes
+
+Cursor = Tuple[str, str]
+
+# Postgres / PostgREST error codes that recur on every retry of the same rows:
+# data exceptions, constraint violations, syntax and permission errors, and
+# malformed requests or unknown schema objects
+PERMANENT_ERROR_CODES = ('22', '23', '42', 'PGRST1', 'PGRST2')
+
+
+class FuelStorage:
+    """Interface for entry storage: insert, filtered queries, last entry and aggregates"""
+
+    stored_metrics = False
+    delta_sync = False
+
+    def insert_entries(self, entries: List[Dict]):
+        """Write entries (and their stored metrics); rows carrying an id are idempotent on it"""
+        raise NotImplementedError
+
+    def is_permanent_error(self, error: Exception) -> bool:
+        """Whether a failed write will fail the same way on retry (rejected rows, not an outage)"""
+        return False
+
+    def refresh_metrics(self, vehicle_id: Optional[str] = None, since: Optional[str] = None):
+        """Recompute stored metrics of a vehicle (None = all) for entries from since on"""
+        raise NotImplementedError
+
+    def query_entries(self, columns: List[str], full_only: bool = False,
+                      start: Optional[str] = None, end: Optional[str] = None,
+                      cursor: Optional[Cursor] = None, limit: Optional[int] = None,
+                      with_metrics: bool = False, vehicle_id: Optional[str] = None,
+                      oldest_first: bool = False) -> List[Dict]:
+        """Entries with start <= ts < end, newest first by (ts, id).
+
+        cursor is the (ts, id) of the last row already seen; with_metrics adds
+        the derived columns, stored or from the entry_metrics view. vehicle_id
+        restricts to one vehicle (None = whole fleet). oldest_first reverses
+        the order, and the cursor then selects the rows after it.
+        """
+        raise NotImplementedError
+
+    def query_changes(self, columns: List[str], since: Optional[str] = None,
+                      after: Optional[Cursor] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Entries with updated_at >= since, oldest change first by (updated_at, id).
+
+        after is the (updated_at, id) of the last row already seen, as returned;
+        columns must include updated_at and id for it.
+        """
+        raise NotImplementedError
+
+    def entry_checksums(self) -> Dict[str, Tuple[int, int]]:
+        """(entry count, odometer sum) per vehicle, for reconciling a synced copy"""
+        raise NotImplementedError
+
+    def vehicle_ids(self) -> List[str]:
+        """Sorted ids of the vehicles that have entries, from the vehicles view"""
+        raise NotImplementedError
+
+    def last_entry(self, columns: List[str], before: Optional[str] = None,
+                   vehicle_id: Optional[str] = None) -> Optional[Dict]:
+        """Newest entry (of a vehicle), or the newest one strictly before a timestamp"""
+        rows = self.query_entries(columns, end=before, limit=1, vehicle_id=vehicle_id)
+        return rows[0] if rows else None
+
+    def aggregates(self) -> Aggregates:
+        """Server-side aggregation over the same data"""
+        raise NotImplementedError
+
+
+class SupabaseStorage(FuelStorage):
+    """Entries in the Supabase fuel_entry table"""
+
+    def __init__(self, client, stored_metrics: bool = False, delta_sync: bool = False):
+        self.client = client
+        # Requires migrations/004_stored_entry_metrics.sql and a backfill
+        self.stored_metrics = stored_metrics
+        # Requires migrations/005_entry_sync.sql
+        self.delta_sync = delta_sync
+
+    def insert_entries(self, entries: List[Dict]):
+        if all('id' in entry for entry in entries):
+            self.client.table('fuel_entry').upsert(
+                entries, on_conflict='id', ignore_duplicates=True, returning=ReturnMethod.minimal
+            ).execute()
+        else:
+            self.client.table('fuel_entry').insert(entries, returning=ReturnMethod.minimal).execute()
+        if self.stored_metrics:
+            # One statement per vehicle touches only the rows the batch can affect
+            for vehicle_id, since in earliest_by_vehicle(entries).items():
+                self.refresh_metrics(vehicle_id, since)
+
+    def is_permanent_error(self, error: Exception) -> bool:
+        if not isinstance(error, APIError):
+            # Connection errors and timeouts
+            return False
+        code = str(error.code or '')
+        if len(code) == 3 and code.isdigit():
+            # HTTP status of a response without a JSON error body
+            return code.startswith('4') and code not in ('408', '429')
+        return code.startswith(PERMANENT_ERROR_CODES)
+
+    def refresh_metrics(self, vehicle_id: Optional[str] = None, since: Optional[str] = None):
+        self.client.rpc('refresh_entry_metrics', {'p_vehicle_id': vehicle_id, 'p_since': since}).execute()
+
+    def query_entries(self, columns: List[str], full_only: bool = False,
+                      start: Optional[str] = None, end: Optional[str] = None,
+                      cursor: Optional[Cursor] = None, limit: Optional[int] = None,
+                      with_metrics: bool = False, vehicle_id: Optional[str] = None,
+                      oldest_first: bool = False) -> List[Dict]:
+        source = 'entry_metrics' if with_metrics and not self.stored_metrics else 'fuel_entry'
+        track_response_bytes(self.client)
+        query = self.client.table(source).select(select_clause(columns))
+        if vehicle_id is not None:
+            query = query.eq('vehicle_id', vehicle_id)
+        if full_only:
+            query = query.eq('is_full_tank', True)
+        if start:
+            query = query.gte('ts', start)
+        if end:
+            query = query.lt('ts', end)
+        # postgrest-py has no or_() builder and takes one column per order(),
+        # so the keyset predicate and compound sort key are raw PostgREST params
+        direction = 'asc' if oldest_first else 'desc'
+        if cursor:
+            ts, entry_id = cursor
+            op = 'gt' if oldest_first else 'lt'
+            query.params = query.params.add('or', f'(ts.{op}."{ts}",and(ts.eq."{ts}",id.{op}.{entry_id}))')
+        query.params = query.params.add('order', f'ts.{direction},id.{direction}')
+        if limit is not None:
+            query = query.limit(limit)
+        with span('fetch'):
+            rows = query.execute().data or []
+        count('rows_fetched', len(rows))
+        return rows
+
+    def query_changes(self, columns: List[str], since: Optional[str] = None,
+                      after: Optional[Cursor] = None, limit: Optional[int] = None) -> List[Dict]:
+        track_response_bytes(self.client)
+        query = self.client.table('fuel_entry').select(select_clause(columns))
+        if since:
+            query = query.gte('updated_at', since)
+        if after:
+            updated_at, entry_id = after
+            query.params = query.params.add(
+                'or', f'(updated_at.gt."{updated_at}",and(updated_at.eq."{updated_at}",id.gt.{entry_id}))'
+            )
+        query.params = query.params.add('order', 'updated_at.asc,id.asc')
+        if limit is not None:
+            query = query.limit(limit)
+        with span('fetch'):
+            rows = query.execute().data or []
+        count('rows_fetched', len(rows))
+        return rows
+
+    def entry_checksums(self) -> Dict[str, Tuple[int, int]]:
+        with span('fetch'):
+            rows = self.client.rpc('entry_checksums', {}).execute().data or []
+        return {row['vehicle_id']: (int(row['entry_count']), int(row['odometer_total'])) for row in rows}
+
+    def vehicle_ids(self) -> List[str]:
+        # Requires migrations/006_vehicle_list.sql
+        with span('fetch'):
+            rows = self.client.table('vehicles').select('vehicle_id').order('vehicle_id').execute().data or []
+        return [row['vehicle_id'] for row in rows]
+
+    def aggregates(self) -> Aggregates:
+        return SupabaseAggregates(self.client, self.stored_metrics)
+
+
+def supabase_from_environment():
+    """Supabase client for command-line tools: SUPABASE_URL/KEY from the environment or secrets.toml"""
+    from supabase import create_client
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_KEY")
+    if not url or not key:
+        import streamlit as st
+        url, key = st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"]
+    return create_client(url, key)
+
+
+def sqlite_ts(value) -> str:
+    """UTC ISO-8601 text, so lexical order in SQLite matches time order.
+
+    Naive timestamps are taken as UTC, as Postgres does for timestamptz input.
+    """
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+    return ts.isoformat()
+
+
+def sqlite_updated_at(value) -> str:
+    """Timestamp in the fixed-width form SQLite stamps updated_at with (millisecond floor)"""
+    ts = pd.Timestamp(sqlite_ts(value))
+    return ts.strftime('%Y-%m-%dT%H:%M:%S.') + f"{ts.microsecond // 1000:03d}Z"
+
+
+class SQLiteStorage(FuelStorage):
+    """Entries in an embedded SQLite database, indexed on ts, (ts, id) and odometer_km"""
+
+    stored_metrics = True
+    delta_sync = True
+
+    def __init__(self, path: str):
+        # Reuses the aggregation stand-in, which creates the table, indexes and views
+        self.backend = SQLiteAggregates(path)
+        self.conn = self.backend.conn
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    def insert_entries(self, entries: List[Dict]):
+        self.backend.insert_entries([
+            {**entry, 'id': entry.get('id') or str(uuid.uuid4()), 'ts': sqlite_ts(entry['ts'])}
+            for entry in entries
+        ])
+
+    def is_permanent_error(self, error: Exception) -> bool:
+        # A locked database (OperationalError) clears up; bad rows do not
+        return isinstance(error, (sqlite3.IntegrityError, sqlite3.DataError, KeyError, ValueError, TypeError))
+
+    def refresh_metrics(self, vehicle_id: Optional[str] = None, since: Optional[str] = None):
+        self.backend.refresh_metrics(vehicle_id, sqlite_ts(since) if since else None)
+
+    def query_entries(self, columns: List[str], full_only: bool = False,
+                      start: Optional[str] = None, end: Optional[str] = None,
+                      cursor: Optional[Cursor] = None, limit: Optional[int] = None,
+                      with_metrics: bool = False, vehicle_id: Optional[str] = None,
+                      oldest_first: bool = False) -> List[Dict]:
+        source = 'entry_metrics' if with_metrics and not self.stored_metrics else 'fuel_entry'
+        where, params = [], []
+        if vehicle_id is not None:
+            where.append("vehicle_id = ?")
+            params.append(vehicle_id)
+        if full_only:
+            where.append("is_full_tank")
+        if start:
+            where.append("ts >= ?")
+            params.append(start)
+        if end:
+            where.append("ts < ?")
+            params.append(end)
+        op, direction = ('>', 'ASC') if oldest_first else ('<', 'DESC')
+        if cursor:
+            ts, entry_id = cursor
+            where.append(f"(ts {op} ? OR (ts = ? AND id {op} ?))")
+            params.extend([ts, ts, entry_id])
+
+        sql = f"SELECT {', '.join(columns)} FROM {source}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY ts {direction}, id {direction}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        return self._fetch(sql, params, columns)
+
+    def _fetch(self, sql: str, params: List, columns: List[str]) -> List[Dict]:
+        """Rows as dicts in the Supabase JSON shape"""
+        with span('fetch'):
+            with self.backend.lock:
+                rows = self.conn.execute(sql, params).fetchall()
+            records = [dict(row) for row in rows]
+            if 'is_full_tank' in columns:
+                for record in records:
+                    record['is_full_tank'] = bool(record['is_full_tank'])
+        count('rows_fetched', len(records))
+        return records
+
+    def query_changes(self, columns: List[str], since: Optional[str] = None,
+                      after: Optional[Cursor] = None, limit: Optional[int] = None) -> List[Dict]:
+        where, params = [], []
+        if since:
+            where.append("updated_at >= ?")
+            params.append(sqlite_updated_at(since))
+        if after:
+            updated_at, entry_id = after
+            where.append("(updated_at > ? OR (updated_at = ? AND id > ?))")
+            params.extend([updated_at, updated_at, entry_id])
+
+        sql = f"SELECT {', '.join(columns)} FROM fuel_entry"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY updated_at, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._fetch(sql, params, columns)
+
+    def entry_checksums(self) -> Dict[str, Tuple[int, int]]:
+        with span('fetch'):
+            with self.backend.lock:
+                rows = self.conn.execute(self.backend.functions['entry_checksums']).fetchall()
+        return {vehicle_id: (int(entries), int(odometer)) for vehicle_id, entries, odometer in rows}
+
+    def vehicle_ids(self) -> List[str]:
+        rows = self._fetch("SELECT vehicle_id FROM vehicles ORDER BY vehicle_id", [], ['vehicle_id'])
+        return [row['vehicle_id'] for row in rows]
+
+    def aggregates(self) -> Aggregates:
+        return self.backend
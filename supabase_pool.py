@@ -0,0 +1,186 @@
+"""
+Pooled Supabase clients for Fuel Tracker
+
+Every client built here sends its requests through one shared httpx transport,
+a bounded pool of keep-alive connections, so a new client (one per browser
+session) reuses warm TLS connections instead of opening its own. Clients are
+cheap and isolated: logins and refreshes happen on each session's own client.
+The shared data client behind the caches sends every request with the access
+token of the session being served (see authorize), so queries keep the user's
+role. Background threads either authorize themselves (write-queue flushes run
+as each entry's owner) or use the freshest token of any session, and send
+nothing while no one is logged in rather than fall back to the project key.
+"""
+
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+import httpx
+from postgrest import SyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_TIMEOUT
+from supabase import Client
+from supabase.lib.auth_client import SupabaseAuthClient, SyncClient
+from supabase.lib.client_options import ClientOptions
+
+from telemetry import count_response_bytes
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT_S = 10.0
+DEFAULT_READ_TIMEOUT_S = float(DEFAULT_POSTGREST_CLIENT_TIMEOUT)
+# How long an idle connection is kept for reuse
+DEFAULT_KEEPALIVE_S = 60.0
+
+# Marks threads not serving a session (write-queue flushes, precompute)
+_BACKGROUND = object()
+
+# Access token of the session the current script thread serves (None = not logged in)
+_request_token: ContextVar = ContextVar('fuel_access_token', default=_BACKGROUND)
+
+
+def authorize(access_token: Optional[str]):
+    """Send this thread's data requests (one Streamlit rerun) with a session's access token"""
+    _request_token.set(access_token)
+
+
+class NoLiveSession(RuntimeError):
+    """A background request found no logged-in session to send it as"""
+
+
+def clear_authorization():
+    """Return this thread to background requests, e.g. when a rerun ends"""
+    _request_token.set(_BACKGROUND)
+
+
+class PooledHttpClient(SyncClient):
+    """httpx client on the shared transport; closing it leaves the pool open.
+
+    With a token_provider, each request is sent with the bearer token it
+    returns at that moment (if any) instead of the client's default.
+    """
+
+    def __init__(self, *args, token_provider: Optional[Callable[[], Optional[str]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.token_provider = token_provider
+
+    def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        if self.token_provider is not None:
+            token = self.token_provider()
+            if token:
+                request.headers['Authorization'] = f"Bearer {token}"
+        return super().send(request, **kwargs)
+
+    def close(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PooledPostgrestClient(SyncPostgrestClient):
+    """PostgREST client whose session is a PooledHttpClient"""
+
+    def __init__(self, base_url: str, pool: 'SupabasePool',
+                 token_provider: Optional[Callable[[], Optional[str]]] = None, **kwargs):
+        # create_session() runs inside the base constructor
+        self.pool = pool
+        self.token_provider = token_provider
+        super().__init__(base_url, **kwargs)
+
+    def create_session(self, base_url: str, headers: Dict[str, str], timeout) -> SyncClient:
+        return self.pool.http_client(base_url, headers, token_provider=self.token_provider)
+
+
+class PooledClient(Client):
+    """Supabase client on a SupabasePool.
+
+    Queries are authorized with access_token when given (a logged-in
+    session), per request with token_provider's token (the shared data
+    client), else with the project key. Tokens are never refreshed or
+    persisted by the client itself; SimpleAuth does that per session.
+    """
+
+    def __init__(self, pool: 'SupabasePool', access_token: Optional[str] = None,
+                 token_provider: Optional[Callable[[], Optional[str]]] = None):
+        self.pool = pool
+        self.access_token = access_token
+        self.token_provider = token_provider
+        # Fresh options: create_client's default instance (and its session storage) is shared
+        super().__init__(pool.url, pool.key, ClientOptions(auto_refresh_token=False, persist_session=False))
+
+    def _init_supabase_auth_client(self, auth_url: str, client_options: ClientOptions) -> SupabaseAuthClient:
+        return SupabaseAuthClient(
+            url=auth_url,
+            headers=client_options.headers,
+            auto_refresh_token=False,
+            persist_session=False,
+            storage=client_options.storage,
+            http_client=self.pool.http_client(),
+            flow_type=client_options.flow_type,
+        )
+
+    def _init_postgrest_client(self, rest_url: str, headers: Dict[str, str], schema: str,
+                               timeout=None) -> SyncPostgrestClient:
+        return PooledPostgrestClient(rest_url, self.pool, token_provider=self.token_provider,
+                                     headers=headers, schema=schema)
+
+    def _get_token_header(self) -> Dict[str, str]:
+        if self.access_token:
+            return {"Authorization": f"Bearer {self.access_token}"}
+        return super()._get_token_header()
+
+
+class SupabasePool:
+    """Bounded keep-alive connection pool shared by every Supabase client of the process.
+
+    At most pool_size connections are open; a request waits up to
+    connect_timeout for a free one, then as long for the connection itself,
+    and read_timeout for each read.
+    """
+
+    def __init__(self, url: str, key: str, pool_size: int = DEFAULT_POOL_SIZE,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT_S,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT_S,
+                 keepalive_expiry: float = DEFAULT_KEEPALIVE_S):
+        self.url = url
+        self.key = key
+        # Token for requests from background threads, e.g. SimpleAuth.latest_access_token;
+        # None sends them with the project key (deployments without logins)
+        self.background_token: Optional[Callable[[], Optional[str]]] = None
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout)
+        self._transport = httpx.HTTPTransport(limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=keepalive_expiry,
+        ))
+
+    def http_client(self, base_url: str = '', headers: Optional[Dict[str, str]] = None,
+                    token_provider: Optional[Callable[[], Optional[str]]] = None) -> PooledHttpClient:
+        """httpx client with its own headers and cookies over the shared connections"""
+        return PooledHttpClient(base_url=base_url, headers=headers, timeout=self.timeout,
+                                transport=self._transport, token_provider=token_provider,
+                                event_hooks={'response': [count_response_bytes]})
+
+    def client(self, access_token: Optional[str] = None) -> PooledClient:
+        """New Supabase client; pass a session's access token to query as that user"""
+        return PooledClient(self, access_token)
+
+    def shared_client(self) -> PooledClient:
+        """Client for data shared by all sessions, sending each request as the session it serves"""
+        return PooledClient(self, token_provider=self.request_token)
+
+    def request_token(self) -> Optional[str]:
+        """Access token for a request from the current thread (None = project key)"""
+        token = _request_token.get()
+        if token is not _BACKGROUND:
+            return token
+        if self.background_token is None:
+            return None
+        token = self.background_token()
+        if token is None:
+            # Under row-level security the project key would read no rows, or write them as anon
+            raise NoLiveSession("No logged-in session to send a background request as")
+        return token
+
+    def close(self):
+        """Close every pooled connection"""
+        self._transport.close()
@@ -0,0 +1,231 @@
+"""
+Hot-path timing spans and counters for Fuel Tracker
+
+Spans time the stages of a rerun (fetch, frame build, segments, range
+accuracy, formatting, Plotly) and counters tally rows, bytes and cache hits.
+Totals are kept per process for the Prometheus text file; a run (one
+Streamlit rerun) also collects its own breakdown for the debug panel and the
+JSON-lines log. Recording is two perf_counter calls and a dict update, so it
+stays on in production.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+PROMETHEUS_PREFIX = 'fuel_tracker'
+
+
+class RunRecord:
+    """Spans and counters of one rerun"""
+
+    __slots__ = ('labels', 'spans', 'counters', 'started')
+
+    def __init__(self, labels: Dict):
+        self.labels = labels
+        self.spans: Dict[str, List[float]] = {}
+        self.counters: Dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    def as_dict(self) -> Dict:
+        """JSON-ready record: total and per-stage milliseconds, plus counters"""
+        return {
+            'ts': time.time(),
+            **self.labels,
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'spans': {name: {'count': int(count), 'ms': round(seconds * 1000, 3)}
+                      for name, (count, seconds) in self.spans.items()},
+            'counters': dict(self.counters),
+        }
+
+
+# Run of the current thread (each Streamlit rerun runs on its own script thread)
+_current_run: contextvars.ContextVar[Optional[RunRecord]] = contextvars.ContextVar('fuel_run', default=None)
+
+
+class Telemetry:
+    """Process-wide span and counter totals with optional JSON-lines and Prometheus sinks"""
+
+    def __init__(self):
+        self.labels: Dict[str, str] = {}
+        self.jsonl_path: Optional[str] = None
+        self.prometheus_path: Optional[str] = None
+        self._spans: Dict[str, List[float]] = {}
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, jsonl_path: Optional[str] = None, prometheus_path: Optional[str] = None,
+                  **labels: str):
+        """Set the sinks (None disables one) and the labels stamped on every record, e.g. release"""
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.labels = {key: str(value) for key, value in labels.items()}
+
+    @contextmanager
+    def span(self, name: str):
+        """Time a block as one occurrence of a stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def timed(self, name: str):
+        """Decorator form of span()"""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def observe(self, name: str, seconds: float):
+        """Record one occurrence of a stage (count, total, max)"""
+        with self._lock:
+            total = self._spans.get(name)
+            if total is None:
+                self._spans[name] = [1, seconds, seconds]
+            else:
+                total[0] += 1
+                total[1] += seconds
+                total[2] = max(total[2], seconds)
+        run = _current_run.get()
+        if run is not None:
+            stage = run.spans.setdefault(name, [0, 0.0])
+            stage[0] += 1
+            stage[1] += seconds
+
+    def count(self, name: str, value: float = 1):
+        """Add to a counter (rows, bytes, cache hits, ...)"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+        run = _current_run.get()
+        if run is not None:
+            run.counters[name] = run.counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float):
+        """Set a point-in-time value, e.g. the number of resident entries"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def start_run(self, **labels) -> RunRecord:
+        """Start collecting a run on the current thread"""
+        run = RunRecord({**self.labels, **labels})
+        _current_run.set(run)
+        return run
+
+    def current_run(self) -> Optional[RunRecord]:
+        return _current_run.get()
+
+    def finish_run(self, **labels) -> Optional[Dict]:
+        """End the current run and write it to the sinks; returns its record"""
+        run = _current_run.get()
+        if run is None:
+            return None
+        _current_run.set(None)
+        run.labels.update(labels)
+        record = run.as_dict()
+        if self.jsonl_path:
+            self.write_jsonl(record)
+        if self.prometheus_path:
+            self.write_prometheus()
+        return record
+
+    def totals(self) -> Dict:
+        """Process-wide totals since start"""
+        with self._lock:
+            return {
+                'spans': {name: {'count': int(count), 'total_ms': seconds * 1000, 'max_ms': longest * 1000}
+                          for name, (count, seconds, longest) in self._spans.items()},
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+            }
+
+    def write_jsonl(self, record: Dict):
+        """Append one record per line"""
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def prometheus_text(self) -> str:
+        """Totals in the Prometheus text exposition format"""
+        labels = ''.join(f',{key}="{_escape(value)}"' for key, value in sorted(self.labels.items()))
+        totals = self.totals()
+        lines = [
+            f'# HELP {PROMETHEUS_PREFIX}_stage_seconds Time spent in hot-path stages',
+            f'# TYPE {PROMETHEUS_PREFIX}_stage_seconds summary',
+        ]
+        for name, stage in sorted(totals['spans'].items()):
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_sum{{stage="{name}"{labels}}} '
+                         f'{stage["total_ms"] / 1000:.6f}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_count{{stage="{name}"{labels}}} {stage["count"]}')
+        lines += [
+            f'# HELP {PROMETHEUS_PREFIX}_stage_seconds_max Longest single occurrence of a stage',
+            f'# TYPE {PROMETHEUS_PREFIX}_stage_seconds_max gauge',
+        ]
+        for name, stage in sorted(totals['spans'].items()):
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_max{{stage="{name}"{labels}}} '
+                         f'{stage["max_ms"] / 1000:.6f}')
+        lines += [
+            f'# HELP {PROMETHEUS_PREFIX}_events_total Rows, bytes and cache hits/misses',
+            f'# TYPE {PROMETHEUS_PREFIX}_events_total counter',
+        ]
+        for name, value in sorted(totals['counters'].items()):
+            lines.append(f'{PROMETHEUS_PREFIX}_events_total{{event="{name}"{labels}}} {_number(value)}')
+        for name, value in sorted(totals['gauges'].items()):
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name} gauge')
+            lines.append(f'{PROMETHEUS_PREFIX}_{name}{{{labels.lstrip(",")}}} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self):
+        """Rewrite the text file atomically (node_exporter textfile collector)"""
+        text = self.prometheus_text()
+        temp_path = f"{self.prometheus_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, self.prometheus_path)
+
+
+def count_response_bytes(response):
+    """httpx response hook adding the downloaded (wire) size to bytes_fetched"""
+    response.read()
+    telemetry.count('bytes_fetched', response.num_bytes_downloaded)
+
+
+def track_response_bytes(client):
+    """Hook count_response_bytes into a Supabase client's PostgREST session.
+
+    Called before each query: the session is replaced whenever the auth
+    state changes, so a hook added once at startup would be lost.
+    """
+    session = getattr(getattr(client, 'postgrest', None), 'session', None)
+    if session is None:
+        # Test doubles without an HTTP session
+        return
+    hooks = session.event_hooks
+    if count_response_bytes not in hooks['response']:
+        session.event_hooks = {**hooks, 'response': hooks['response'] + [count_response_bytes]}
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+    """Exact integers (byte counts) without exponent notation"""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# Shared by every module in the process
+telemetry = Telemetry()
+span = telemetry.span
+timed = telemetry.timed
+count = telemetry.count
@@ -0,0 +1,109 @@
+"""
+Tests for the vectorized segment and range accuracy calculations
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import generate_fleet, generate_history
+from calculations import RANGE_TREND_WINDOW, FuelCalculator
+
+SEEDS = range(12)
+SEGMENT_VALUES = ['distance_km', 'fuel_used_l', 'cost_total_pln', 'consumption_l_per_100km', 'cost_per_100km']
+
+
+def messy(history: pd.DataFrame, seed: int, full_ties: bool = True) -> pd.DataFrame:
+    """Shuffled copy with tied timestamps and some entries without a range prediction.
+
+    Without full_ties, only partial fills take over the previous row's ts, so
+    no two full tanks of a vehicle tie.
+    """
+    rng = np.random.default_rng(seed)
+    history = history.copy()
+    tied = rng.random(len(history)) < 0.15
+    tied[0] = False
+    if not full_ties:
+        tied &= ~history['is_full_tank'].to_numpy()
+    column = history.columns.get_loc('ts')
+    for i in np.flatnonzero(tied):
+        history.iat[i, column] = history.iat[i - 1, column]
+    history.loc[rng.random(len(history)) < 0.05, 'range_after_km'] = 0
+    return history.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def range_accuracy_reference(df: pd.DataFrame) -> pd.Series:
+    """Per-entry loop over one vehicle's ts-sorted entries, indexed by id"""
+    df_sorted = df.sort_values('ts')
+    rows = df_sorted.to_dict('records')
+    accuracy = {}
+    for current, following in zip(rows, rows[1:] + [None]):
+        # The newest entry has nothing to compare its prediction with yet
+        accuracy[current['id']] = np.nan if following is None else FuelCalculator.range_accuracy(
+            current['range_after_km'], following['odometer_km'] - current['odometer_km']
+        )
+    return pd.Series(accuracy, dtype=float)
+
+
+def assert_segments_match_reference(segments: pd.DataFrame, history: pd.DataFrame):
+    expected = pd.DataFrame(FuelCalculator.find_full_tank_segments_reference(history))
+    assert len(segments) == len(expected)
+    if expected.empty:
+        return
+    assert list(segments['end_entry_id']) == list(expected['end_entry_id'])
+    assert list(segments['start_date']) == list(expected['start_date'])
+    assert list(segments['end_date']) == list(expected['end_date'])
+    for col in SEGMENT_VALUES:
+        np.testing.assert_allclose(segments[col].to_numpy(dtype=float), expected[col].to_numpy(dtype=float))
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_segments_match_reference(seed):
+    history = messy(generate_history(150, seed=seed, partial_fill_rate=0.4), seed)
+
+    assert_segments_match_reference(FuelCalculator.segments_frame(history), history)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_fleet_segments_match_reference_per_vehicle(seed):
+    fleet = messy(generate_fleet(240, 3, seed=seed), seed, full_ties=False)
+
+    segments = FuelCalculator.segments_frame(fleet)
+    for vehicle_id, history in fleet.groupby('vehicle_id'):
+        assert_segments_match_reference(segments[segments['vehicle_id'] == vehicle_id], history)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_range_accuracy_matches_reference(seed):
+    history = messy(generate_history(150, seed=seed, partial_fill_rate=0.4), seed)
+
+    result = FuelCalculator.calculate_range_accuracy(history)
+    expected = range_accuracy_reference(history)
+    np.testing.assert_allclose(result['range_accuracy'].to_numpy(),
+                               expected.reindex(result['id']).to_numpy(), equal_nan=True)
+
+    valid = expected.reindex(result['id']).dropna()
+    trend = [valid.iloc[max(0, i - RANGE_TREND_WINDOW + 1):i + 1].mean() for i in range(len(valid))]
+    np.testing.assert_allclose(result.set_index('id')['range_accuracy_trend'].reindex(valid.index), trend)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_fleet_range_accuracy_matches_reference_per_vehicle(seed):
+    fleet = messy(generate_fleet(240, 3, seed=seed), seed, full_ties=False)
+    # With ties the next entry depends on order; the fleet path sorts stably by vehicle, ts
+    fleet = fleet[~fleet.duplicated(['vehicle_id', 'ts'], keep=False)]
+
+    result = FuelCalculator.calculate_range_accuracy(fleet).set_index('id')['range_accuracy']
+    for _, history in fleet.groupby('vehicle_id'):
+        expected = range_accuracy_reference(history)
+        np.testing.assert_allclose(result.reindex(expected.index).to_numpy(), expected.to_numpy(),
+                                   equal_nan=True)
+
+
+def test_empty_and_single_full_tank_histories_have_no_segments():
+    history = generate_history(5, seed=1)
+    history['is_full_tank'] = [True, False, False, False, False]
+
+    assert FuelCalculator.segments_frame(history.iloc[:0]).empty
+    assert FuelCalculator.segments_frame(history).empty
+    assert FuelCalculator.find_full_tank_segments_reference(history) == []
@@ -0,0 +1,59 @@
+"""
+Tests for the incrementally maintained insights
+"""
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_fleet, generate_history
+from calculations import FleetMetrics
+from insights import FleetInsights
+
+
+def assert_same_insights(ours, theirs):
+    for key, value in ours.snapshot().items():
+        expected = theirs.snapshot()[key]
+        if isinstance(value, pd.DataFrame):
+            pd.testing.assert_frame_equal(value.reset_index(drop=True), expected.reset_index(drop=True),
+                                          check_dtype=False)
+        else:
+            assert value.keys() == expected.keys()
+            np.testing.assert_allclose(list(value.values()), list(expected.values()))
+
+
+def append_all(entries, new_rows):
+    """Build from entries, then append new_rows one by one as the entry store does"""
+    metrics = FleetMetrics.from_frame(entries)
+    insights = FleetInsights.from_frames(entries, metrics.segments_frame())
+    for entry in new_rows.to_dict('records'):
+        assert metrics.append(entry)
+        assert insights.append(entry, metrics.segment_ending_at(entry))
+    return insights
+
+
+def rebuilt(entries):
+    return FleetInsights.from_frames(entries, FleetMetrics.from_frame(entries).segments_frame())
+
+
+def test_append_for_second_vehicle_leaves_first_vehicle_alone():
+    history = generate_history(60, seed=3)
+    second = generate_history(5, seed=4, vehicle_id='van')
+    second['ts'] = history['ts'].iloc[-1] + pd.to_timedelta(np.arange(1, 6), unit='D')
+    second['id'] = [f'van-{i}' for i in range(5)]
+
+    insights = append_all(history, second)
+    expected = rebuilt(pd.concat([history, second], ignore_index=True))
+
+    assert_same_insights(insights.get(None), expected.get(None))
+    for vehicle_id in ('default', 'van'):
+        assert_same_insights(insights.get(vehicle_id), expected.get(vehicle_id))
+
+
+def test_appending_to_fleet_matches_rebuild():
+    fleet = generate_fleet(300, 3, seed=7)
+    insights = append_all(fleet.iloc[:250], fleet.iloc[250:])
+    expected = rebuilt(fleet)
+
+    assert_same_insights(insights.get(None), expected.get(None))
+    for vehicle_id in fleet['vehicle_id'].unique():
+        assert_same_insights(insights.get(vehicle_id), expected.get(vehicle_id))
@@ -0,0 +1,38 @@
+"""
+Tests for building typed entry frames
+"""
+
+import pandas as pd
+
+from schema import ENTRY_DTYPES, columns_for, typed_frame
+
+
+def test_typed_frame_parses_mixed_precision_timestamps():
+    # As PostgREST returns them: whole seconds carry no fraction
+    records = [
+        {'id': '1', 'ts': '2024-01-01T10:00:00+00:00', 'updated_at': '2024-01-01T10:00:05.123456+00:00'},
+        {'id': '2', 'ts': '2024-01-02T08:30:00.25+00:00', 'updated_at': '2024-01-02T08:30:01+00:00'},
+        {'id': '3', 'ts': '2024-01-03T09:15:00.123456+00:00', 'updated_at': None},
+    ]
+
+    df = typed_frame(records, ['id', 'ts', 'updated_at'])
+
+    assert str(df['ts'].dtype) == ENTRY_DTYPES['ts']
+    assert str(df['updated_at'].dtype) == ENTRY_DTYPES['updated_at']
+    assert list(df['ts']) == [
+        pd.Timestamp('2024-01-01 10:00:00', tz='UTC'),
+        pd.Timestamp('2024-01-02 08:30:00.25', tz='UTC'),
+        pd.Timestamp('2024-01-03 09:15:00.123456', tz='UTC'),
+    ]
+    assert df['updated_at'].iloc[0] == pd.Timestamp('2024-01-01 10:00:05.123456', tz='UTC')
+    assert pd.isna(df['updated_at'].iloc[2])
+
+
+def test_typed_frame_uses_compact_dtypes():
+    records = [{'id': '1', 'vehicle_id': None, 'ts': '2024-01-01T10:00:00+00:00', 'odometer_km': 1000}]
+
+    df = typed_frame(records, columns_for('quick_add'))
+
+    assert list(df.columns) == columns_for('quick_add')
+    assert df['vehicle_id'].iloc[0] == 'default'
+    assert str(df['odometer_km'].dtype) == 'int32'
@@ -0,0 +1,148 @@
+"""
+Tests for the durable write-behind queue
+"""
+
+import sqlite3
+
+from postgrest.exceptions import APIError
+
+from storage import SQLiteStorage, SupabaseStorage
+from write_queue import OwnerUnavailable, WriteQueue
+
+
+class RejectedRow(Exception):
+    """Stands in for a constraint violation the database reports for a row"""
+
+
+def entries(count):
+    return [{'id': f'e{i}', 'ts': f'2024-01-{i + 1:02d}T10:00:00+00:00', 'odometer_km': 1000 + i}
+            for i in range(count)]
+
+
+def rejecting_writer(written, poison_id):
+    def flush(batch, owner):
+        if any(entry['id'] == poison_id for entry in batch):
+            raise RejectedRow(f"row {poison_id} violates a constraint")
+        written.extend(entry['id'] for entry in batch)
+    return flush
+
+
+def test_poison_row_is_set_aside_and_the_rest_of_its_batch_is_written(tmp_path):
+    written = []
+    set_aside = []
+    queue = WriteQueue(str(tmp_path / 'queue.db'), flush=rejecting_writer(written, 'e2'),
+                       is_permanent=lambda e: isinstance(e, RejectedRow),
+                       on_failed=lambda batch: set_aside.extend(entry['id'] for entry in batch))
+    for entry in entries(5):
+        queue.enqueue(entry)
+
+    assert queue.flush_due() == 5
+
+    assert written == ['e0', 'e1', 'e3', 'e4']
+    assert set_aside == ['e2']
+    assert queue.pending() == []
+    assert [entry['id'] for entry in queue.failed()] == ['e2']
+    assert 'violates a constraint' in queue.failed()[0]['last_error']
+    assert queue.stats()['pending'] == 0 and queue.stats()['failed'] == 1
+    # Nothing left to send: the failed row is not retried
+    assert queue.flush_due() == 0
+
+    assert queue.discard_failed() == 1
+    assert queue.stats()['failed'] == 0
+
+
+def test_outage_backs_off_the_whole_batch_after_one_probe(tmp_path):
+    calls = []
+
+    def flush(batch, owner):
+        calls.append(len(batch))
+        raise ConnectionError("network unreachable")
+
+    queue = WriteQueue(str(tmp_path / 'queue.db'), flush=flush, is_permanent=lambda e: False)
+    for entry in entries(5):
+        queue.enqueue(entry)
+
+    assert queue.flush_due() == 0
+
+    # The batch, then one single-row probe that fails the same way
+    assert calls == [5, 1]
+    assert len(queue.pending()) == 5
+    assert queue.failed() == []
+    assert queue.stats()['max_attempts'] == 1
+
+
+def test_rows_failing_retryably_are_set_aside_after_max_attempts(tmp_path):
+    def flush(batch, owner):
+        raise ConnectionError("network unreachable")
+
+    queue = WriteQueue(str(tmp_path / 'queue.db'), flush=flush, max_attempts=3)
+    queue.enqueue(entries(1)[0])
+
+    for _ in range(2):
+        assert queue.flush_due() == 0
+        queue._conn.execute("UPDATE pending_entry SET next_attempt_at = 0")
+    assert queue.flush_due() == 1
+
+    assert queue.pending() == []
+    assert [entry['id'] for entry in queue.failed()] == ['e0']
+
+
+def test_queue_created_before_failed_entries_existed_is_upgraded(tmp_path):
+    path = str(tmp_path / 'queue.db')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE pending_entry (
+            idempotency_key TEXT PRIMARY KEY, payload TEXT NOT NULL, created_at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, last_error TEXT
+        );
+        INSERT INTO pending_entry VALUES ('e0', '{"id": "e0"}', 1.0, 0, 1.0, NULL);
+    """)
+    conn.close()
+
+    queue = WriteQueue(path, flush=lambda batch, owner: None)
+
+    assert queue.pending() == [{'id': 'e0'}]
+    assert queue.flush_due() == 1
+
+
+def test_each_batch_is_written_as_its_owner(tmp_path):
+    written = []
+    queue = WriteQueue(str(tmp_path / 'queue.db'), flush=lambda batch, owner: written.append(
+        (owner, [entry['id'] for entry in batch])))
+    for entry, owner in zip(entries(5), ['ann', 'bob', 'ann', None, 'bob']):
+        queue.enqueue(entry, owner=owner)
+
+    while queue.flush_due():
+        pass
+
+    assert written == [('ann', ['e0', 'e2']), ('bob', ['e1', 'e4']), (None, ['e3'])]
+
+
+def test_entries_wait_for_their_owner_without_using_attempts(tmp_path):
+    def flush(batch, owner):
+        raise OwnerUnavailable(f"{owner} is not logged in")
+
+    queue = WriteQueue(str(tmp_path / 'queue.db'), flush=flush, max_attempts=1)
+    for entry in entries(3):
+        queue.enqueue(entry, owner='ann')
+
+    assert queue.flush_due() == 0
+
+    assert len(queue.pending()) == 3
+    assert queue.failed() == []
+    assert queue.stats()['max_attempts'] == 0
+    assert queue.stats()['last_error'] == "ann is not logged in"
+
+
+def test_storage_tells_rejected_rows_from_outages():
+    supabase = SupabaseStorage(client=None)
+    assert supabase.is_permanent_error(APIError({'code': '23505', 'message': 'duplicate key'}))
+    assert supabase.is_permanent_error(APIError({'code': 'PGRST204', 'message': 'unknown column'}))
+    assert supabase.is_permanent_error(APIError({'code': 400, 'message': 'JSON could not be generated'}))
+    assert not supabase.is_permanent_error(APIError({'code': 503, 'message': 'JSON could not be generated'}))
+    assert not supabase.is_permanent_error(APIError({'code': '57014', 'message': 'statement timeout'}))
+    assert not supabase.is_permanent_error(ConnectionError("network unreachable"))
+
+    sqlite = SQLiteStorage(":memory:")
+    assert sqlite.is_permanent_error(sqlite3.IntegrityError("NOT NULL constraint failed"))
+    assert not sqlite.is_permanent_error(sqlite3.OperationalError("database is locked"))
@@ -0,0 +1,262 @@
+"""
+Durable write-behind queue for Fuel Tracker
+
+Entries are committed to a local SQLite database (WAL mode) and acknowledged
+immediately; a background thread flushes them to Supabase in batches with
+exponential backoff. Each entry carries a client-generated id that doubles as
+the idempotency key, so a retried batch never creates duplicates. Entries
+record the user who saved them and each batch holds one owner's entries, so
+they are written with that user's credentials. A batch that
+fails is retried entry by entry, and entries the database rejects outright (or
+that exhaust their attempts) are set aside as failed instead of blocking the
+queue.
+"""
+
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_BATCH_SIZE = 50
+BASE_BACKOFF_S = 1.0
+MAX_BACKOFF_S = 300.0
+DEFAULT_MAX_ATTEMPTS = 12
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_entry (
+    idempotency_key TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    failed_at REAL,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_pending_entry_due ON pending_entry (next_attempt_at);
+"""
+
+# Columns added after the first release, for queues created before them
+ADDED_COLUMNS = {'failed_at': 'REAL', 'owner': 'TEXT'}
+
+
+class OwnerUnavailable(Exception):
+    """Raised by a flush that cannot act for the entries' owner right now (e.g. no live session).
+
+    The batch waits without using up its attempts.
+    """
+
+
+def backoff_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter, capped at MAX_BACKOFF_S"""
+    return random.uniform(0, min(MAX_BACKOFF_S, BASE_BACKOFF_S * 2 ** attempts))
+
+
+class WriteQueue:
+    """Local durable queue of entries waiting to reach the database"""
+
+    def __init__(self, path: str, flush: Callable[[List[Dict], Optional[str]], None],
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 on_flushed: Optional[Callable[[List[Dict]], None]] = None,
+                 is_permanent: Optional[Callable[[Exception], bool]] = None,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 on_failed: Optional[Callable[[List[Dict]], None]] = None):
+        self.path = path
+        self.flush = flush
+        self.batch_size = batch_size
+        self.on_flushed = on_flushed
+        # Errors that will recur on every retry (rejected data rather than an outage)
+        self.is_permanent = is_permanent or (lambda e: False)
+        self.max_attempts = max_attempts
+        self.on_failed = on_failed
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL still survives process crashes; only power loss can drop the last commit
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(pending_entry)")}
+        for column, definition in ADDED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE pending_entry ADD COLUMN {column} {definition}")
+
+    def enqueue(self, entry: Dict, owner: Optional[str] = None) -> Dict:
+        """Persist an entry locally and return it with its idempotency id.
+
+        owner identifies the user the entry is written as; flush(batch, owner)
+        receives it back.
+        """
+        entry = dict(entry)
+        entry.setdefault('id', str(uuid.uuid4()))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO pending_entry (idempotency_key, payload, created_at, next_attempt_at, owner) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (entry['id'], json.dumps(entry), now, now, owner)
+            )
+        self._wake.set()
+        return entry
+
+    def pending(self) -> List[Dict]:
+        """Entries not yet confirmed by the database and not failed, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM pending_entry WHERE failed_at IS NULL ORDER BY created_at"
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def failed(self) -> List[Dict]:
+        """Entries set aside as failed, oldest first, each with its last_error"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload, last_error FROM pending_entry WHERE failed_at IS NOT NULL ORDER BY created_at"
+            ).fetchall()
+        return [{**json.loads(payload), 'last_error': error} for payload, error in rows]
+
+    def discard_failed(self) -> int:
+        """Delete the failed entries; returns how many were dropped"""
+        with self._lock:
+            return self._conn.execute("DELETE FROM pending_entry WHERE failed_at IS NOT NULL").rowcount
+
+    def flush_due(self) -> int:
+        """Send one batch of due entries of one owner; returns how many were confirmed or set aside"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idempotency_key, payload, attempts, owner FROM pending_entry "
+                "WHERE failed_at IS NULL AND next_attempt_at <= ? ORDER BY created_at LIMIT ?",
+                (time.time(), self.batch_size)
+            ).fetchall()
+        if not rows:
+            return 0
+
+        # The oldest due entry picks the owner; other owners' entries go in later batches
+        owner = rows[0][3]
+        batch = [(key, json.loads(payload), attempts) for key, payload, attempts, row_owner in rows
+                 if row_owner == owner]
+        try:
+            self.flush([entry for _, entry, _ in batch], owner)
+        except OwnerUnavailable as e:
+            self._defer(batch, e)
+            return 0
+        except Exception as e:
+            if len(batch) == 1:
+                return len(self._record_failure(batch, e))
+            return self._isolate(batch, owner)
+
+        self.last_error = None
+        self._confirm(batch)
+        return len(batch)
+
+    def _isolate(self, batch: List, owner: Optional[str]) -> int:
+        """Retry a failed batch entry by entry to find the ones the database rejects.
+
+        The first entry failing with a retryable error looks like an outage, so
+        it and the rest of the batch are backed off without further requests.
+        """
+        confirmed = []
+        failed = []
+        for position, (key, entry, attempts) in enumerate(batch):
+            try:
+                self.flush([entry], owner)
+            except OwnerUnavailable as e:
+                self._defer(batch[position:], e)
+                break
+            except Exception as e:
+                if self.is_permanent(e):
+                    failed += self._record_failure([(key, entry, attempts)], e)
+                    continue
+                failed += self._record_failure(batch[position:], e)
+                break
+            confirmed.append((key, entry, attempts))
+        if confirmed:
+            self._confirm(confirmed)
+        return len(confirmed) + len(failed)
+
+    def _defer(self, batch: List, error: Exception):
+        """Retry the entries later without counting an attempt"""
+        self.last_error = str(error)
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE pending_entry SET next_attempt_at = ?, last_error = ? WHERE idempotency_key = ?",
+                [(time.time() + MAX_BACKOFF_S, str(error), key) for key, _, _ in batch]
+            )
+
+    def _confirm(self, batch: List):
+        with self._lock:
+            self._conn.executemany("DELETE FROM pending_entry WHERE idempotency_key = ?",
+                                   [(key,) for key, _, _ in batch])
+        if self.on_flushed is not None:
+            self.on_flushed([entry for _, entry, _ in batch])
+
+    def _record_failure(self, batch: List, error: Exception) -> List[Dict]:
+        """Back off the entries, or set them aside; returns the ones now failed"""
+        self.last_error = str(error)
+        now = time.time()
+        permanent = self.is_permanent(error)
+        updates = []
+        failed = []
+        for key, entry, attempts in batch:
+            gives_up = permanent or attempts + 1 >= self.max_attempts
+            if gives_up:
+                failed.append(entry)
+            updates.append((now + backoff_delay(attempts), str(error), now if gives_up else None, key))
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE pending_entry SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?, "
+                "failed_at = ? WHERE idempotency_key = ?",
+                updates
+            )
+        if failed and self.on_failed is not None:
+            self.on_failed(failed)
+        return failed
+
+    def _next_due_in(self) -> float:
+        """Seconds until the earliest pending retry (capped for responsiveness)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM pending_entry WHERE failed_at IS NULL"
+            ).fetchone()
+        if row[0] is None:
+            return MAX_BACKOFF_S
+        return max(0.0, min(MAX_BACKOFF_S, row[0] - time.time()))
+
+    def _run(self):
+        while not self._stop.is_set():
+            while self.flush_due():
+                pass
+            self._wake.wait(self._next_due_in())
+            self._wake.clear()
+
+    def start(self):
+        """Start the background flusher thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="fuel-write-queue", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self) -> Dict:
+        """Queue depth, retry state, failed entries and the last flush error"""
+        with self._lock:
+            count, oldest, max_attempts, failed = self._conn.execute(
+                "SELECT COUNT(*) - COUNT(failed_at), MIN(CASE WHEN failed_at IS NULL THEN created_at END), "
+                "MAX(CASE WHEN failed_at IS NULL THEN attempts END), COUNT(failed_at) FROM pending_entry"
+            ).fetchone()
+        return {
+            'pending': count,
+            'failed': failed,
+            'oldest_age_s': time.time() - oldest if oldest else None,
+            'max_attempts': max_attempts or 0,
+            'last_error': self.last_error,
+        }